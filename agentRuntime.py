@@ -0,0 +1,248 @@
+# Fixed-rate tick loop for an agent, replacing the sleep(0.05) and
+# getWorldState() loops of the examples. A tick runs at most tickRate times a
+# second and only when a new observation came in: between ticks the runtime
+# sleeps, and when the observation is late it polls for it a few times per
+# tick, so work follows the observations instead of a free running timer.
+# A tick that finishes after its deadline (the start of the next tick) counts
+# as missed, and the next tick skips the optional stages to catch up. With
+# tickRate None there is no rate and no deadline: every observation is handled
+# as soon as it comes in, e.g. to replay a recorded mission as fast as possible.
+#
+# PipelinedRuntime runs the same stages in a pipeline instead: a reader thread
+# fetches and decodes world states, the stages always take the newest decoded
+# observation (older ones are dropped) and a writer thread sends the commands
+# the stages gave to runtime.commands. The threads pass work through single
+# slot queues, so nothing waits behind stale observations.
+
+import json
+import threading
+import time
+
+import profiler
+
+
+class Stage(object):
+    def __init__(self, name, function, optional):
+        self.name = name
+        self.function = function  # function(observation)
+        self.optional = optional  # skipped when the previous tick was late
+        self.runs = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return "%-16s %6d runs %6d skipped %8.3f ms/run" % (
+            self.name, self.runs, self.skipped, 1000 * self.elapsed / max(1, self.runs))
+
+
+class AgentRuntime(object):
+    def __init__(self, agentHost, tickRate=20.0, pollsPerTick=5):
+        self.agentHost = agentHost
+        self.period = 1.0 / tickRate if tickRate else 0.0
+        self.pollInterval = self.period / pollsPerTick if tickRate else 0.001
+        self.stages = []
+        self.late = False  # whether the last tick missed its deadline
+        self.stats = dict(ticks=0, missed=0, idle=0, errors=0)
+
+    def addStage(self, name, function, optional=False):
+        """ Adds a stage, stages run in the order they were added. """
+        self.stages.append(Stage(name, function, optional))
+
+    def getWorldState(self):
+        """ Returns the next world state of the agent host, after printing its errors. """
+        worldState = self.agentHost.getWorldState()
+        for error in worldState.errors:
+            self.stats["errors"] += 1
+            print "Error:", error.text
+        return worldState
+
+    def ticks(self):
+        """
+        Yields (worldState, observation) once per tick that has a new
+        observation, until the mission ends. The work done between two yields
+        is what the deadline is checked against.
+        """
+        worldState = self.getWorldState()
+        slot = time.time()  # start of the current tick
+        while worldState.is_mission_running:
+            now = time.time()
+            if now < slot:
+                time.sleep(slot - now)
+            worldState = self.getWorldState()
+            if worldState.number_of_observations_since_last_state == 0:
+                while worldState.is_mission_running and worldState.number_of_observations_since_last_state == 0:
+                    if self.period and time.time() >= slot + self.period:
+                        slot += self.period  # a whole tick without an observation
+                        self.stats["idle"] += 1
+                    time.sleep(self.pollInterval)
+                    worldState = self.getWorldState()
+                # the observation was late, align the ticks to when it came in
+                slot = max(slot, time.time())
+            if worldState.number_of_observations_since_last_state == 0:
+                break
+            observation = json.loads(worldState.observations[-1].text)
+
+            yield worldState, observation
+
+            self.stats["ticks"] += 1
+            if not self.period:
+                continue
+            finished = time.time()
+            deadline = slot + self.period
+            self.late = finished > deadline
+            if self.late:
+                # continue at the first tick that hasn't started yet
+                missed = int((finished - deadline) / self.period) + 1
+                self.stats["missed"] += missed
+                profiler.count("missedDeadlines", missed)
+                slot += (missed + 1) * self.period
+            else:
+                slot = deadline
+
+    def run(self):
+        """ Runs the stages every tick until the mission ends. """
+        for (worldState, observation) in self.ticks():
+            self.runStages(observation)
+
+    def runStages(self, observation):
+        for stage in self.stages:
+            if stage.optional and self.late:
+                stage.skipped += 1
+                continue
+            starttime = time.time()
+            stage.function(observation)
+            elapsed = time.time() - starttime
+            stage.elapsed += elapsed
+            stage.runs += 1
+            if profiler.enabled:
+                profiler.record("stage." + stage.name, elapsed)
+
+    def report(self):
+        """ Returns the tick statistics and the time spent per stage as text. """
+        lines = ["%(ticks)d ticks, %(missed)d missed deadlines, %(idle)d ticks without observation" % self.stats]
+        lines.extend(repr(stage) for stage in self.stages)
+        return "\n".join(lines)
+
+
+class LatestSlot(object):
+    """
+    Queue of one item between two threads: put() replaces the item if it
+    wasn't taken yet (or merges them with merge(old, new)), get() waits for it.
+    """
+
+    def __init__(self, merge=None):
+        self.condition = threading.Condition()
+        self.merge = merge
+        self.item = None
+        self.full = False
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self.condition:
+            if self.full:
+                self.dropped += 1
+                if self.merge is not None:
+                    item = self.merge(self.item, item)
+            self.item = item
+            self.full = True
+            self.condition.notify()
+
+    def get(self):
+        """ Returns the next item, or None once the slot is closed and empty. """
+        with self.condition:
+            while not self.full and not self.closed:
+                self.condition.wait()
+            if not self.full:
+                return None
+            item = self.item
+            self.item = None
+            self.full = False
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+def mergeCommands(old, new):
+    """ Merges two (received, commands) batches, only the newest of every command (move, turn, ...) is kept. """
+    newest = dict((command.split(" ", 1)[0], command) for command in new[1])
+    return new[0], [command for command in old[1] if command.split(" ", 1)[0] not in newest] + new[1]
+
+
+class CommandWriter(object):
+    """ Stands in for the agent host in Controller and the stages, collects the commands of a tick. """
+
+    def __init__(self):
+        self.batch = []
+
+    def sendCommand(self, command):
+        self.batch.append(command)
+
+    def take(self):
+        (batch, self.batch) = (self.batch, [])
+        return batch
+
+
+class PipelinedRuntime(AgentRuntime):
+    """
+    Runs the stages on the newest observation, overlapping fetching and
+    decoding world states and sending commands with them. Stages send their
+    commands with runtime.commands.sendCommand (give it to Controller in place
+    of the agent host). latencies holds the seconds from fetching every used
+    observation to sending its commands.
+    """
+
+    def __init__(self, agentHost, tickRate=20.0, pollsPerTick=5):
+        AgentRuntime.__init__(self, agentHost, tickRate, pollsPerTick)
+        self.commands = CommandWriter()
+        self.latencies = []
+        self.stats.update(dropped=0)
+
+    def _read(self, frames):
+        worldState = self.getWorldState()
+        while worldState.is_mission_running and not frames.closed:
+            if worldState.number_of_observations_since_last_state > 0:
+                received = time.time()
+                frames.put((received, json.loads(worldState.observations[-1].text)))
+            time.sleep(self.pollInterval)
+            worldState = self.getWorldState()
+        frames.close()
+
+    def _write(self, batches):
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            (received, commands) = batch
+            for command in commands:
+                self.agentHost.sendCommand(command)
+            self.latencies.append(time.time() - received)
+
+    def run(self):
+        """ Runs the pipeline until the mission ends. """
+        frames = LatestSlot()
+        batches = LatestSlot(mergeCommands)
+        reader = threading.Thread(target=self._read, args=(frames, ))
+        writer = threading.Thread(target=self._write, args=(batches, ))
+        reader.start()
+        writer.start()
+        try:
+            while True:
+                frame = frames.get()
+                if frame is None:
+                    break
+                (received, observation) = frame
+                self.runStages(observation)
+                batches.put((received, self.commands.take()))
+                self.stats["ticks"] += 1
+                self.late = bool(self.period) and time.time() - received > self.period
+                self.stats["missed"] += self.late
+        finally:
+            frames.close()
+            batches.close()
+            reader.join()
+            writer.join()
+            self.stats["dropped"] = frames.dropped
@@ -0,0 +1,128 @@
+# Shared knowledge of the world between agents: block types and waypoints by
+# absolute position. Every agent keeps its own Blackboard and syncs it with
+# teammates by exchanging deltas, the facts that changed since the last sync
+# with that teammate, so the traffic grows with new discoveries and not with
+# the size of the map. Every write is stamped (clock, writer) with a Lamport
+# clock, when two agents write the same fact the later stamp wins everywhere.
+#
+# A delta is a JSON friendly list of [kind, key, clock, writer, value] entries:
+#   kind 'b'  key is the worldStore.blockKey of a block, value its type
+#   kind 'w'  key is the [x, y, z] of a waypoint (rounded to WAYPOINT_PRECISION
+#             decimals), value is {'radius': r, 'data': {...}}
+# A value of None means the fact was removed (a chopped tree, a dead waypoint).
+
+from collections import OrderedDict
+
+from worldStore import blockKey, blockKeysToPositions
+
+WAYPOINT_PRECISION = 1
+
+
+class Blackboard(object):
+    def __init__(self, replicaID):
+        self.replicaID = replicaID
+        self.clock = 0  # Lamport clock, larger than every stamp seen
+        self.facts = {}  # (kind, key) -> (clock, writer, value)
+        self.sequence = 0  # local change counter
+        self.changes = OrderedDict()  # (kind, key) -> sequence of its last change, oldest first
+        self.cursors = {}  # replicaID -> sequence of that replica already merged
+        self.byType = {}  # block type -> set of block keys
+        self.stats = dict(written=0, merged=0, stale=0, sent=0)
+
+    ############################################################################
+    # Facts
+    ############################################################################
+
+    def write(self, kind, key, value):
+        """ Sets a fact, stamped as the newest write. """
+        self.clock += 1
+        self._set((kind, key), (self.clock, self.replicaID, value))
+        self.stats["written"] += 1
+
+    def read(self, kind, key, default=None):
+        fact = self.facts.get((kind, key))
+        if fact is None or fact[2] is None:
+            return default
+        return fact[2]
+
+    def _set(self, factKey, fact):
+        old = self.facts.get(factKey)
+        if factKey[0] == 'b':
+            if old is not None and old[2] is not None:
+                self.byType[old[2]].discard(factKey[1])
+            if fact[2] is not None:
+                self.byType.setdefault(fact[2], set()).add(factKey[1])
+        self.facts[factKey] = fact
+        self.sequence += 1
+        self.changes.pop(factKey, None)
+        self.changes[factKey] = self.sequence
+
+    def setBlock(self, position, blockType):
+        """ Records the type of the block at an absolute (x, y, z) position, None if it is gone. """
+        self.write('b', blockKey(*position), blockType)
+
+    def getBlock(self, position, default=None):
+        return self.read('b', blockKey(*position), default)
+
+    def positionsOf(self, blockType):
+        """ Returns an (N, 3) int array with the known positions of a block type. """
+        return blockKeysToPositions(sorted(self.byType.get(blockType, ())))
+
+    def waypointKey(self, location):
+        return tuple(round(float(c), WAYPOINT_PRECISION) for c in location)
+
+    def setWaypoint(self, location, radius, data=None):
+        """ Records a walkable waypoint and its data dict, radius None removes it. """
+        value = {'radius': float(radius), 'data': dict(data or {})} if radius is not None else None
+        self.write('w', self.waypointKey(location), value)
+
+    def waypoints(self, key=None):
+        """ Returns (location, radius, data) of the known waypoints, only those with key in their data if given. """
+        return [(location, fact[2]['radius'], fact[2]['data']) for ((kind, location), fact) in self.facts.iteritems()
+                if kind == 'w' and fact[2] is not None and (key is None or key in fact[2]['data'])]
+
+    ############################################################################
+    # Synchronization
+    ############################################################################
+
+    def delta(self, since=0, peer=None):
+        """
+        Returns (sequence, entries): the facts that changed after local sequence
+        since, except the ones peer wrote itself, and the sequence to ask from
+        next time. Only looks at the changed facts.
+        """
+        entries = []
+        for factKey in reversed(self.changes):
+            if self.changes[factKey] <= since:
+                break
+            (clock, writer, value) = self.facts[factKey]
+            if writer != peer:
+                entries.append([factKey[0], list(factKey[1]) if factKey[0] == 'w' else factKey[1],
+                                clock, writer, value])
+        entries.reverse()
+        self.stats["sent"] += len(entries)
+        return self.sequence, entries
+
+    def merge(self, entries):
+        """ Applies the entries of a delta, the later stamp of a fact wins. Returns the number applied. """
+        applied = 0
+        for (kind, key, clock, writer, value) in entries:
+            factKey = (kind, tuple(key) if kind == 'w' else key)
+            self.clock = max(self.clock, clock)
+            old = self.facts.get(factKey)
+            if old is not None and (old[0], old[1]) >= (clock, writer):
+                self.stats["stale"] += 1
+                continue
+            self._set(factKey, (clock, writer, value))
+            applied += 1
+        self.stats["merged"] += applied
+        return applied
+
+    def pull(self, other):
+        """ Merges what changed on another Blackboard since the last pull from it. """
+        (sequence, entries) = other.delta(self.cursors.get(other.replicaID, 0), self.replicaID)
+        self.cursors[other.replicaID] = sequence
+        return self.merge(entries)
+
+    def __len__(self):
+        return len(self.facts)
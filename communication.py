@@ -7,6 +7,7 @@ import time
 import uuid
 import random
 from collections import namedtuple
+from missionLauncher import MissionLauncher
 
 class Agent:
     def __init__(self, agentID, location, goapState):
@@ -14,40 +15,50 @@ class Agent:
         self.location = location  # (float, float, float)
         self.goapState = goapState  # int dict
         self.currentPlan = []  # Action list
+        self.planFuture = None  # planService.PlanFuture of the plan being made
         self.messageCounter = 0  # messages sent by the agent
         self.agentHost = MalmoPython.AgentHost() # ?
         self.missionRecordSpec = MalmoPython.MissionRecordSpec() # ?
 
-    def sendQuery(self, content):
-        ret = json.dump({'type': 'Q',
-                         'senderID': self.agentID,
-                         'messageNr': self.messageCounter,
-                         'senderLocation': self.location,
-                         'content': content})
+    def message(self, kind, content, **fields):
+        """ Returns a new message dict of kind 'Q', 'R' or 'C' from this agent, for a messageBus.MessageBus. """
+        message = {'type': kind,
+                   'senderID': self.agentID,
+                   'messageNr': self.messageCounter,
+                   'senderLocation': self.location,
+                   'content': content}
+        message.update(fields)
         self.messageCounter += 1
-        return ret
+        return message
+
+    def sendQuery(self, content):
+        return json.dumps(self.message('Q', content))
 
     def sendReply(self, recipientID, replyToID, content):
-        ret = json.dump({'type': 'R',
-                         'senderID': self.agentID,
-                         'messageNr': self.messageCounter,
-                         'senderLocation': self.location,
-                         'recipientID': recipientID,
-                         'replyToID': replyToID,
-                         'content': content})
-        self.messageCounter += 1
-        return ret
+        return json.dumps(self.message('R', content, recipientID=recipientID, replyToID=replyToID))
 
     def sendConfirmation(self, recipientID, confirmToID, content):
-        ret = json.dump({'type': 'C',
-                         'senderID': self.agentID,
-                         'messageNr': self.messageCounter,
-                         'senderLocation': self.location,
-                         'recipientID': recipientID,
-                         'confirmToID': confirmToID,
-                         'content': content})
-        self.messageCounter += 1
-        return ret
+        return json.dumps(self.message('C', content, recipientID=recipientID, confirmToID=confirmToID))
+
+    def requestPlan(self, service, goals, deadline=None):
+        """ Asks a planService.PlanningService for a plan from the current state, replaces an older request. """
+        self.planFuture = service.submit(self.agentID, self.goapState, goals, deadline)
+
+    def collectPlan(self):
+        """
+        Takes the requested plan once it is ready, returns whether currentPlan
+        changed. Only a complete plan is taken: the prefix the service returns
+        when the request expired or ran out of budget doesn't reach a goal, so
+        it is dropped and the agent has to request a plan again.
+        """
+        if self.planFuture is None or not self.planFuture.done():
+            return False
+        result = self.planFuture.result(0)
+        self.planFuture = None
+        if result is None or not result[1]:
+            return False
+        self.currentPlan = result[0]
+        return True
 
     def startMission(self, client_pool):
         max_retries = 3
@@ -273,33 +284,17 @@ if __name__ == '__main__':
         client_pool.add(MalmoPython.ClientInfo('127.0.0.1', x))
 
 
-    def tut_startMission(agent_host, my_mission, my_client_pool, my_mission_record, role, expId):
-        max_retries = 3
-        for retry in range(max_retries):
-            try:
-                # Attempt to start the mission:
-                agent_host.startMission(my_mission, my_client_pool, my_mission_record, role, expId)
-                break
-            except RuntimeError as e:
-                if retry == max_retries - 1:
-                    print "Error starting mission", e
-                    print "Is the game running?"
-                    exit(1)
-                else:
-                    # In a multi-agent mission, startMission will fail if the integrated server
-                    # hasn't yet started - so if none of our clients were available, that may be the
-                    # reason. To catch this specifically we could check the results for "MALMONOSERVERYET",
-                    # but it should be sufficient to simply wait a bit and try again.
-                    time.sleep(5)
-
-
     experimentID = str(uuid.uuid4())
 
-    for i in range(len(agent_hosts)):
-        tut_startMission(agent_hosts[i], MalmoPython.MissionSpec(getXML("false"), True), client_pool, MalmoPython.MissionRecordSpec(), i, experimentID)
-
-    # Wait for mission to start - complicated by having multiple agent hosts, and the potential
-    # for multiple errors to occur in the start-up process.
+    # Start all agent hosts at once and wait until every mission has begun
+    launcher = MissionLauncher()
+    launches = launcher.launch(agent_hosts, [MalmoPython.MissionSpec(getXML("false"), True) for ah in agent_hosts],
+                               client_pool, [MalmoPython.MissionRecordSpec() for ah in agent_hosts], experimentID)
+    for launch in launches:
+        print launch
+    if not all(launch.ok() for launch in launches):
+        print "Error starting mission, is the game running?"
+        exit(1)
 
 
     # missionSpec = MalmoPython.MissionSpec(missionXML, True) # ?
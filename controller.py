@@ -5,7 +5,6 @@
 # <ContinuousMovementCommands turnSpeedDegs="180"/>
 # observations.get("Yaw", 0)
 
-import MalmoPython
 import numpy as np
 
 from util import *
@@ -68,10 +67,15 @@ class Controller(object):
 		self.agent.sendCommand("setPitch {}".format(newPitch))
 
 
-	def lookAtHorizontally(self, position):
-		""" Turns the agent to look at the given position. """
+	def lookAtHorizontally(self, position, minChange=None):
+		"""
+		Turns the agent to look at the given position. If minChange is given, no
+		command is sent when the yaw is already within minChange degrees.
+		"""
 		dx, dz = self.location[0] - position[0], self.location[2] - position[2]
 		yaw = degrees(atan2(dz, dx)) + 90.0
+		if minChange is not None and abs(shortAngle(self.yaw, yaw)) <= minChange:
+			return
 		self.setYaw(yaw)
 
 
@@ -1,180 +1,727 @@
-import numpy as np
-import heapq
-import time
-
-'''
-Okay, there are three levels of complexity we can choose
-simplest: use boolean state
-          - library does this
-medium:   use integer state
-          - we probbably want this
-          - requires modifying library
-            > actually, throwing lib away was easier
-          - requires different A* heuristic
-            > none, just be Dijkstra
-              bad heuristic is worse than no heuristic,
-              bad heuristic can also result in sub-optimal paths
-complex:  use custom state with user-supplied functions and heuristic
-          - probbably overkill
-          - requires rewriting library
-          - requires custom functions for each action
-          - requires complex A* heuristic
-'''
-
-
-class Goal:
-    def __init__(self, state):
-        self.state = state  # int dict
-
-    def met(self, teststate):
-        for (key, value) in self.state.iteritems():
-            if (teststate.get(key, 0) < value):
-                return False
-        return True
-
-
-class Action:
-    def __repr__(self):
-        return self.name
-
-    def __init__(self, name, function, condition, expectation, cost=1):
-        self.name = name
-        self.function = function  # function
-        self.condition = condition  # int dict
-        self.expectation = expectation  # int dict
-        self.cost = cost  # int
-
-    def available(self, state):
-        for (key, value) in self.condition.iteritems():
-            if (state.get(key, 0) < value):
-                return False
-        return True
-
-
-class Node:
-    def __repr__(self):
-        return "\n(a{0}|{1})".format(self.state, self.prev)
-
-    def __init__(self, state, prev, action):
-        self.state = state  # int dict
-        self.prev = prev  # Node
-        self.action = action  # Action
-
-
-class Leaf:
-    def __repr__(self):
-        return "leaf {0} {1} {2}\n".format(self.prevAction, list(self.doneActions), self.node)
-
-    def __init__(self, prevAction, node, aset):
-        self.prevAction = prevAction
-        self.node = node  # Node
-        self.doneActions = aset  # int set
-
-
-def addDict(a, b):
-    ret = {}
-    for key in a:
-        ret[key] = a.get(key, 0) + b.get(key, 0)
-    for key in b:
-        ret[key] = a.get(key, 0) + b.get(key, 0)
-    return ret
-
-
-# python 2.7 enum
-class ActionReturn:
-    success, replanWithoutMe = range(2)
-
-
-def findTrees(w):
-    print 'finding trees! find find...'
-    return ActionReturn.success
-
-
-def chopWood(w):
-    print 'chopping wood! chop chop...'
-    return ActionReturn.success
-
-
-def craftTable(w):
-    print 'crafting crafting table! table...'
-    return ActionReturn.success
-
-
-def craftPlank(w):
-    print 'crafting planks! plank plank...'
-    return ActionReturn.success
-
-
-def craftSticks(w):
-    print 'crafting sticks! stick stick...'
-    return ActionReturn.success
-
-
-def craftHoe(w):
-    print 'crafting hoe! ho ho...'
-    return ActionReturn.success
-
-
-# dijkstra's algorithm using priority queues
-def pathfind(goals, actions, startstate):
-    root = Node(startstate, None, None)
-
-    leafs = []  # priority queue of leafs
-    heapq.heappush(leafs, (0, Leaf(None, root, set())))
-
-    debug_node_expansions = 0
-
-    while leafs:  # while not empty
-        debug_node_expansions += 1
-        (cost, leaf) = heapq.heappop(leafs)
-        for goal in goals:
-            if (goal.met(leaf.node.state)):
-                print 'node expansions %d' % debug_node_expansions
-                print leaf
-                return leaf
-        for action in actions:
-            if action.available(leaf.node.state) and (action == leaf.prevAction or action not in leaf.doneActions):
-                aset = leaf.doneActions.copy()
-                aset.add(action)
-                node = Node(addDict(leaf.node.state, action.expectation), leaf.node, action)
-                heapq.heappush(leafs, (cost + action.cost, Leaf(action, node, aset)))
-    return Leaf(0, root)
-
-
-# simple wrapper around pathfind to make it easier to use
-def plan(startstate):
-    goals = np.array([
-        Goal({'hoes': 2}),
-    ])
-    actions = np.array([
-        Action("findTrees", findTrees, {}, {'trees': 1}),
-        Action("craftTable", craftTable, {'planks': 4}, {'tables': 1, 'planks': -4}),
-        Action("craftPlank", craftPlank, {'logs': 1}, {'planks': 4, 'logs': -1}),
-        Action("chopWood", chopWood, {'trees': 1}, {'trees': -1, 'logs': 1}),
-        Action("craftHoe", craftHoe, {'tables': 1, 'planks': 2, 'sticks': 2}, {'hoes': 1, 'planks': -2, 'sticks': -2}),
-        Action("craftSticks", craftSticks, {'planks': 2}, {'sticks': 4, 'planks': -1}),
-    ])
-    print 'starting goap'
-    starttime = time.time()
-    leaf = pathfind(goals, actions, startstate)
-    endtime = time.time()
-    print 'done in %0.3f seconds' % (endtime - starttime)
-    node = leaf.node
-    path = []
-    while node != None:
-        if (node.action != None):
-
-            path.append(node.action)
-        node = node.prev
-    return reversed(path)
-
-
-if __name__ == '__main__':
-    state = {}
-    path = plan(state)
-    for action in path:
-        result = action.function(None)
-        if result == ActionReturn.success:
-            continue
-        if result == ActionReturn.replanWithoutMe:
-            continue  # TODO: implement
+import numpy as np
+import heapq
+import time
+from array import array
+
+import profiler
+
+'''
+Okay, there are three levels of complexity we can choose
+simplest: use boolean state
+          - library does this
+medium:   use integer state
+          - we probbably want this
+          - requires modifying library
+            > actually, throwing lib away was easier
+          - requires different A* heuristic
+            > none, just be Dijkstra
+              bad heuristic is worse than no heuristic,
+              bad heuristic can also result in sub-optimal paths
+complex:  use custom state with user-supplied functions and heuristic
+          - probbably overkill
+          - requires rewriting library
+          - requires custom functions for each action
+          - requires complex A* heuristic
+'''
+
+
+class Goal:
+    def __init__(self, state):
+        self.state = state  # int dict
+
+    def met(self, teststate):
+        for (key, value) in self.state.iteritems():
+            if (teststate.get(key, 0) < value):
+                return False
+        return True
+
+
+class Action:
+    def __repr__(self):
+        return self.name
+
+    def __init__(self, name, function, condition, expectation, cost=1):
+        self.name = name
+        self.function = function  # function
+        self.condition = condition  # int dict
+        self.expectation = expectation  # int dict
+        self.cost = cost  # int
+
+    def available(self, state):
+        for (key, value) in self.condition.iteritems():
+            if (state.get(key, 0) < value):
+                return False
+        return True
+
+
+class Node:
+    def __repr__(self):
+        return "\n(a{0}|{1})".format(self.state, self.prev)
+
+    def __init__(self, state, prev, action):
+        self.state = state  # int dict
+        self.prev = prev  # Node
+        self.action = action  # Action
+
+
+class Leaf:
+    def __repr__(self):
+        return "leaf {0} {1} {2}\n".format(self.prevAction, list(self.doneActions), self.node)
+
+    def __init__(self, prevAction, node, aset):
+        self.prevAction = prevAction
+        self.node = node  # Node
+        self.doneActions = aset  # int set
+
+
+def addDict(a, b):
+    ret = {}
+    for key in a:
+        ret[key] = a.get(key, 0) + b.get(key, 0)
+    for key in b:
+        ret[key] = a.get(key, 0) + b.get(key, 0)
+    return ret
+
+
+# python 2.7 enum
+class ActionReturn:
+    success, replanWithoutMe = range(2)
+
+
+def findTrees(w):
+    print 'finding trees! find find...'
+    return ActionReturn.success
+
+
+def chopWood(w):
+    print 'chopping wood! chop chop...'
+    return ActionReturn.success
+
+
+def craftTable(w):
+    print 'crafting crafting table! table...'
+    return ActionReturn.success
+
+
+def craftPlank(w):
+    print 'crafting planks! plank plank...'
+    return ActionReturn.success
+
+
+def craftSticks(w):
+    print 'crafting sticks! stick stick...'
+    return ActionReturn.success
+
+
+def craftHoe(w):
+    print 'crafting hoe! ho ho...'
+    return ActionReturn.success
+
+
+def resourceKeys(goals, actions, startstate):
+    """ Returns the sorted names of all resources used by a planning problem. """
+    keys = set(startstate)
+    for goal in goals:
+        keys.update(goal.state)
+    for action in actions:
+        keys.update(action.condition)
+        keys.update(action.expectation)
+    return sorted(keys)
+
+
+def canonicalState(state, keys):
+    """ Returns an int dict state as a hashable tuple of counts in keys order. """
+    return tuple(state.get(key, 0) for key in keys)
+
+
+class Problem:
+    """
+    Compiled form of goals, actions and a start state. Every resource gets a
+    column, conditions, expectations and goals become int matrices with a row
+    per action or goal, so the actions that are available in a state and all
+    their successor states are found with one comparison and one addition.
+    """
+
+    def __init__(self, goals, actions, startstate):
+        # resources that no goal or action uses can't change the plan
+        self.keys = resourceKeys(goals, actions, {})
+        self.index = dict((key, i) for (i, key) in enumerate(self.keys))
+        self.actions = list(actions)
+        self.goals = self.matrix([goal.state for goal in goals])
+        self.conditions = self.matrix([action.condition for action in self.actions])
+        self.expectations = self.matrix([action.expectation for action in self.actions])
+        self.costs = np.array([action.cost for action in self.actions])
+        self.start = canonicalState(startstate, self.keys)
+
+    def matrix(self, states):
+        """ Returns int dict states as a matrix with a row per state. """
+        matrix = np.zeros((len(states), len(self.keys)), dtype=np.int32)
+        for (row, state) in enumerate(states):
+            for (key, value) in state.iteritems():
+                matrix[row, self.index[key]] = value
+        return matrix
+
+    def met(self, state):
+        """ Returns whether a state vector meets one of the goals. """
+        return bool((self.goals <= state).all(axis=1).any())
+
+    def successors(self, state):
+        """
+        Returns the indices of the actions available in a state vector and the
+        matrix of states they lead to.
+        """
+        available = np.flatnonzero((self.conditions <= state).all(axis=1))
+        return available, state + self.expectations[available]
+
+    def state(self, vector):
+        """ Returns a state vector as an int dict. """
+        return dict(zip(self.keys, vector))
+
+
+class NodeStore:
+    """
+    Search nodes in parallel arrays instead of a Node, a Leaf, a set and a dict
+    per push. Every state is interned once, as the bytes of its int32 vector
+    (less than half the size of a tuple of ints), a node is an index into the
+    arrays with its state id, parent node, action index, cost and (for the
+    doneActions search) a bitmask of the actions done on the way.
+    """
+
+    def __init__(self, withMasks=False):
+        self.ids = {}  # state bytes -> state id
+        self.states = []  # state id -> state bytes
+        self.stateIds = array('i')
+        self.parents = array('i')  # -1 for a root
+        self.actions = array('i')  # -1 for a root
+        self.costs = array('d')
+        self.masks = [] if withMasks else None
+
+    def __len__(self):
+        return len(self.parents)
+
+    def intern(self, state):
+        """ Returns the id of a state (bytes), adding it if it is new. """
+        sid = self.ids.get(state)
+        if sid is None:
+            sid = self.ids[state] = len(self.states)
+            self.states.append(state)
+        return sid
+
+    def add(self, stateId, parent, action, cost, mask=0):
+        """ Adds a node and returns its index. """
+        self.stateIds.append(stateId)
+        self.parents.append(parent)
+        self.actions.append(action)
+        self.costs.append(cost)
+        if self.masks is not None:
+            self.masks.append(mask)
+        return len(self.parents) - 1
+
+    def update(self, node, parent, action, cost):
+        """ Points a node at a cheaper way to reach it. """
+        self.parents[node] = parent
+        self.actions[node] = action
+        self.costs[node] = cost
+
+    def vector(self, node):
+        """ Returns the state of a node as an int32 vector. """
+        return np.frombuffer(self.states[self.stateIds[node]], dtype=np.int32)
+
+    def path(self, node):
+        """ Returns the nodes from the root to node. """
+        nodes = []
+        while node != -1:
+            nodes.append(node)
+            node = self.parents[node]
+        nodes.reverse()
+        return nodes
+
+
+def _record(stats, **values):
+    if stats is not None:
+        stats.update(values)
+
+
+def _storeLeaf(problem, store, node, suffix=()):
+    """
+    Builds the Node chain of the plan that leads to a node of a NodeStore,
+    followed by the actions in suffix. Only the plan gets Nodes and dicts.
+    """
+    chain = None
+    done = set(suffix)
+    for step in store.path(node):
+        action = problem.actions[store.actions[step]] if store.actions[step] != -1 else None
+        chain = Node(problem.state(store.vector(step).tolist()), chain, action)
+        if action is not None:
+            done.add(action)
+    for action in suffix:
+        chain = Node(addDict(chain.state, action.expectation), chain, action)
+    return Leaf(chain.action, chain, done)
+
+
+class RelaxedHeuristic:
+    """
+    Admissible cost-to-goal estimate computed from the actions, for A* in
+    pathfind. Negative effects are ignored. For every goal resource that is
+    short it takes the larger of
+      - hmax: the cost of the most expensive chain of actions that must run
+        before the resource can be produced at all (a condition that the state
+        doesn't meet needs at least one action that produces it), and
+      - the shortage times the cheapest cost per produced unit.
+    The estimate of a goal is the largest over its resources, and the smallest
+    over all goals. It never overestimates, so plans stay optimal.
+    """
+
+    def __init__(self, problem):
+        self.goals = [[(i, need) for (i, need) in enumerate(goal) if need > 0]
+                      for goal in problem.goals.tolist()]
+        self.conditions = problem.conditions
+        self.costs = problem.costs.astype(float)
+        self.produces = problem.expectations > 0
+        gains = np.where(self.produces, problem.expectations, 1)
+        self.unitCost = np.where(self.produces, self.costs[:, None] / gains, np.inf).min(axis=0, initial=np.inf).tolist()
+        # hmax only depends on which conditions a state meets, states are
+        # clipped to the largest condition of every resource to share results
+        self.largestCondition = self.conditions.max(axis=0, initial=0).tolist()
+        self.hmaxCache = {}
+
+    def hmax(self, state):
+        """ Returns the hmax cost of producing every resource from state. """
+        unmet = self.conditions > np.asarray(state)
+        cost = np.full(len(state), np.inf)
+        while True:
+            prerequisites = np.where(unmet, cost, 0).max(axis=1, initial=0)
+            produced = np.where(self.produces, (self.costs + prerequisites)[:, None], np.inf).min(axis=0, initial=np.inf)
+            improved = np.minimum(cost, produced)
+            if (improved == cost).all():
+                return cost.tolist()
+            cost = improved
+
+    def __call__(self, state):
+        cost = None
+        estimate = float('inf')
+        for goal in self.goals:
+            goalEstimate = 0
+            for (i, need) in goal:
+                shortage = need - state[i]
+                if shortage <= 0:
+                    continue
+                if cost is None:
+                    clipped = tuple(map(min, state, self.largestCondition))
+                    cost = self.hmaxCache.get(clipped)
+                    if cost is None:
+                        cost = self.hmaxCache[clipped] = self.hmax(clipped)
+                goalEstimate = max(goalEstimate, cost[i], shortage * self.unitCost[i])
+            estimate = min(estimate, goalEstimate)
+        return estimate
+
+    def backward(self, start):
+        """
+        Returns a function that estimates, for a matrix with a requirement per
+        row, the cost of getting from start to a state that meets each of them.
+        Used by pathfindBackward, where start never changes so hmax is only
+        computed once.
+        """
+        cost = np.array(self.hmax(tuple(map(min, start, self.largestCondition))))
+        unitCost = np.array(self.unitCost)
+        start = np.array(start)
+
+        def estimate(requirements):
+            shortage = np.maximum(requirements - start, 0)
+            with np.errstate(invalid='ignore'):
+                perUnit = np.where(shortage > 0, shortage * unitCost, 0)
+            return np.maximum(np.where(shortage > 0, cost, 0), perUnit).max(axis=1, initial=0)
+        return estimate
+
+
+# dijkstra's algorithm using priority queues, A* when given a heuristic
+def pathfind(goals, actions, startstate, dedupe=True, stats=None, heuristic=None, known=None,
+             maxExpansions=None):
+    """
+    Returns the Leaf of the cheapest plan that meets one of the goals, or None.
+    With dedupe every inventory state is kept once, as a tuple of counts, in a
+    best-cost table: a state reached again at the same or a higher cost is
+    dropped and every state is expanded at most once. Actions can then be
+    taken in any order. dedupe=False runs the old search that only prevents
+    loops by never repeating an action after another one (for comparison, it
+    explodes on deeper recipes). The number of expansions is written to stats.
+    heuristic is a class like RelaxedHeuristic, constructed with the compiled
+    Problem and called with a state tuple, and turns the search into A* (only
+    with dedupe).
+    known maps state tuples (in Problem.keys order) to (cost, actions) of the
+    cheapest plan from that state to the goals, from an earlier search. The
+    search stops as soon as a plan through a known state is the cheapest open
+    plan, stats["known"] tells whether it did.
+    After maxExpansions expansions the search gives up and returns None,
+    stats["exhausted"] tells whether it did.
+    """
+    if not dedupe:
+        return _pathfindDoneActions(goals, actions, startstate, stats)
+
+    problem = Problem(goals, actions, startstate)
+    estimate = heuristic(problem) if heuristic is not None else None
+    known = dict((np.array(state, dtype=np.int32).tobytes(), plan) for (state, plan) in (known or {}).iteritems())
+
+    store = NodeStore()  # one node per state, node index == state id
+    store.add(store.intern(np.array(problem.start, dtype=np.int32).tobytes()), -1, -1, 0)
+    suffixes = []  # known plans, a queued node -1 - i stands for the known plan suffixes[i]
+    leafs = [(0, 0, 0)]  # priority queue of (cost + estimate, node, cost), ties go to older nodes
+    pushes = 1
+    expansions = 0
+
+    while leafs and (maxExpansions is None or expansions < maxExpansions):
+        (_, node, cost) = heapq.heappop(leafs)
+        if node < 0:
+            (node, suffix) = suffixes[-1 - node]
+            _record(stats, expansions=expansions, pushes=pushes, states=len(store), known=True, exhausted=False)
+            return _storeLeaf(problem, store, node, suffix)
+        if cost > store.costs[node]:
+            continue  # already expanded at a lower cost
+        state = store.states[node]
+        if state in known:
+            (remaining, suffix) = known[state]
+            suffixes.append((node, suffix))
+            heapq.heappush(leafs, (cost + remaining, -len(suffixes), cost))
+            pushes += 1
+            continue
+        expansions += 1
+        vector = store.vector(node)
+        if problem.met(vector):
+            _record(stats, expansions=expansions, pushes=pushes, states=len(store), known=False, exhausted=False)
+            return _storeLeaf(problem, store, node)
+        (available, successors) = problem.successors(vector)
+        for (i, successor, successorCost) in zip(available.tolist(), successors,
+                                                 (cost + problem.costs[available]).tolist()):
+            key = successor.tobytes()
+            seen = store.ids.get(key)
+            if seen is not None and store.costs[seen] <= successorCost:
+                continue
+            priority = successorCost
+            if estimate is not None:
+                priority += estimate(successor.tolist())
+                if priority == float('inf'):
+                    continue  # no goal can be reached from here
+            if seen is None:
+                seen = store.add(store.intern(key), node, i, successorCost)
+            else:
+                store.update(seen, node, i, successorCost)
+            heapq.heappush(leafs, (priority, seen, successorCost))
+            pushes += 1
+
+    _record(stats, expansions=expansions, pushes=pushes, states=len(store), known=False, exhausted=bool(leafs))
+    return None
+
+
+class SearchStats:
+    """ Counters of an AnytimePlanner search, over all its steps. """
+
+    def __init__(self):
+        self.expansions = 0  # states expanded
+        self.pushes = 0  # states pushed on the priority queue
+        self.heapPeak = 0  # largest priority queue size
+        self.pruned = 0  # successors dropped: seen cheaper, no goal reachable or can't beat the plan
+        self.solutions = 0  # improving plans found
+        self.elapsed = 0.0  # seconds spent searching
+
+    def __repr__(self):
+        return "SearchStats({0})".format(", ".join("{0}={1}".format(key, value)
+                                                    for (key, value) in sorted(vars(self).items())))
+
+    def asDict(self):
+        return dict(vars(self))
+
+
+class AnytimePlanner:
+    """
+    Anytime weighted A* that can be spread over many ticks. Every step() runs
+    the search within a node and/or time budget and continues where the last
+    one stopped. States are ordered by cost + weight * estimate, which finds a
+    plan (at most weight times more expensive than the best) quickly. Every
+    plan found halves the weight (down to plain A*) and the search keeps
+    improving the plan until no cheaper one can exist, then finished is set.
+    Until the first plan is found, plan() returns the actions towards the
+    expanded state that the heuristic puts closest to a goal.
+    """
+
+    def __init__(self, goals, actions, startstate, heuristic=RelaxedHeuristic, weight=5.0):
+        self.problem = Problem(goals, actions, startstate)
+        self.estimate = heuristic(self.problem)
+        self.weight = weight
+        self.stats = SearchStats()
+
+        estimate = self.estimate(self.problem.start)
+        self.store = NodeStore()  # one node per state
+        self.store.add(self.store.intern(np.array(self.problem.start, dtype=np.int32).tobytes()), -1, -1, 0)
+        # priority queue of (cost + weight * estimate, push order, cost, estimate, node)
+        self.leafs = [(weight * estimate, 0, 0, estimate, 0)]
+        self.stats.pushes = self.stats.heapPeak = 1
+        self.closest = (estimate, 0, 0)  # (estimate, cost, node) of the most promising expanded state
+        self.solution = None  # goal node of the best plan found
+        self.cost = None  # cost of that plan
+        self.finished = estimate == float('inf')
+
+    def step(self, maxExpansions=None, maxSeconds=None):
+        """
+        Searches until the budget is used up or the search is finished and
+        returns plan().
+        """
+        starttime = time.time()
+        problem = self.problem
+        store = self.store
+        stats = self.stats
+        expansions = 0
+        while self.leafs and not self.finished:
+            if maxExpansions is not None and expansions >= maxExpansions:
+                break
+            if maxSeconds is not None and time.time() - starttime >= maxSeconds:
+                break
+
+            (_, _, cost, estimate, node) = heapq.heappop(self.leafs)
+            if cost > store.costs[node]:
+                continue  # already expanded at a lower cost
+            if self.cost is not None and cost + estimate >= self.cost:
+                stats.pruned += 1
+                continue  # can't beat the plan we have
+            expansions += 1
+            stats.expansions += 1
+            self.closest = min(self.closest, (estimate, cost, node))
+
+            vector = store.vector(node)
+            if problem.met(vector):
+                self.solution = node
+                self.cost = cost
+                stats.solutions += 1
+                self._reweight(max(1.0, self.weight / 2))
+                continue
+            (available, successors) = problem.successors(vector)
+            for (i, successor, successorCost) in zip(available.tolist(), successors,
+                                                     (cost + problem.costs[available]).tolist()):
+                key = successor.tobytes()
+                seen = store.ids.get(key)
+                if seen is not None and store.costs[seen] <= successorCost:
+                    stats.pruned += 1
+                    continue
+                successorEstimate = self.estimate(successor.tolist())
+                if self.cost is not None and successorCost + successorEstimate >= self.cost or \
+                        successorEstimate == float('inf'):
+                    stats.pruned += 1
+                    continue
+                if seen is None:
+                    seen = store.add(store.intern(key), node, i, successorCost)
+                else:
+                    store.update(seen, node, i, successorCost)
+                heapq.heappush(self.leafs, (successorCost + self.weight * successorEstimate, stats.pushes,
+                                            successorCost, successorEstimate, seen))
+                stats.pushes += 1
+            stats.heapPeak = max(stats.heapPeak, len(self.leafs))
+
+        if not self.leafs:
+            self.finished = True
+        stats.elapsed += time.time() - starttime
+        return self.plan()
+
+    def _reweight(self, weight):
+        self.weight = weight
+        self.leafs = [(cost + weight * estimate, order, cost, estimate, node)
+                      for (_, order, cost, estimate, node) in self.leafs]
+        heapq.heapify(self.leafs)
+
+    def plan(self):
+        """
+        Returns (actions, complete): the best plan found so far and whether it
+        reaches a goal, or the actions towards the most promising state.
+        """
+        node = self.solution if self.solution is not None else self.closest[2]
+        actions = [self.problem.actions[self.store.actions[step]] for step in self.store.path(node)[1:]]
+        return actions, self.solution is not None
+
+
+def relevantActions(goals, actions):
+    """
+    Returns the actions that can contribute to a goal: the ones that supply a
+    goal resource, or a resource that a relevant action needs or uses up.
+    """
+    needed = set()
+    for goal in goals:
+        needed.update(key for (key, value) in goal.state.iteritems() if value > 0)
+    relevant = []
+    remaining = list(actions)
+    changed = True
+    while changed:
+        changed = False
+        for action in list(remaining):
+            if any(value > 0 and key in needed for (key, value) in action.expectation.iteritems()):
+                relevant.append(action)
+                remaining.remove(action)
+                needed.update(key for (key, value) in action.condition.iteritems() if value > 0)
+                needed.update(key for (key, value) in action.expectation.iteritems() if value < 0)
+                changed = True
+    return relevant
+
+
+# regression: searches from the goals back to the start state
+def pathfindBackward(goals, actions, startstate, stats=None, heuristic=None, maxExpansions=None):
+    """
+    Returns the Leaf of the cheapest plan that meets one of the goals, or None,
+    like pathfind, but searches backward. A search state is a requirement: the
+    least of every resource a state must have to reach a goal. It starts at the
+    goals and regresses through every action that supplies a resource the
+    requirement asks for, also one the start state has enough of (an earlier
+    step may use it up): to have R after an action with condition C and
+    expectation E a state needs max(C, R - E). The search stops at the first
+    requirement that the start state meets. Only resources that lead to the
+    goal are ever looked at, so this is fast for narrow goals in wide action
+    sets. heuristic is a class like RelaxedHeuristic, its backward() estimate
+    is used for A*. A requirement at least as strict as the one it came from is
+    never useful and dropped. maxExpansions works like in pathfind.
+    """
+    problem = Problem(goals, actions, startstate)
+    start = np.array(problem.start, dtype=np.int32)
+    estimate = heuristic(problem).backward(problem.start) if heuristic is not None else None
+    supplies = problem.expectations > 0
+
+    store = NodeStore()  # one node per requirement, parents point towards the goals
+    leafs = []  # priority queue of (cost + estimate, push order, cost, node)
+    for goal in np.maximum(problem.goals, 0):
+        requirement = goal.tobytes()
+        if requirement not in store.ids:
+            node = store.add(store.intern(requirement), -1, -1, 0)
+            priority = estimate(goal[None, :])[0] if estimate is not None else 0
+            heapq.heappush(leafs, (priority, node, 0, node))
+    pushes = len(leafs)
+    expansions = 0
+
+    while leafs and (maxExpansions is None or expansions < maxExpansions):
+        (_, _, cost, node) = heapq.heappop(leafs)
+        if cost > store.costs[node]:
+            continue  # already expanded at a lower cost
+        expansions += 1
+        vector = store.vector(node)
+        if (start >= vector).all():
+            _record(stats, expansions=expansions, pushes=pushes, states=len(store), exhausted=False)
+            return _forwardLeaf(problem, store, node)
+
+        relevant = np.flatnonzero(supplies[:, vector > 0].any(axis=1))
+        regressed = np.maximum(np.maximum(vector - problem.expectations[relevant], problem.conditions[relevant]), 0)
+        useful = ~(regressed >= vector).all(axis=1)
+        (relevant, regressed) = (relevant[useful], regressed[useful])
+        costs = cost + problem.costs[relevant]
+        priorities = costs + estimate(regressed) if estimate is not None else costs
+        for (i, previous, previousCost, priority) in zip(relevant.tolist(), map(np.ndarray.tobytes, regressed),
+                                                         costs.tolist(), priorities.tolist()):
+            seen = store.ids.get(previous)
+            if seen is not None and store.costs[seen] <= previousCost:
+                continue
+            if priority == float('inf'):
+                continue  # the start state can't get there
+            if seen is None:
+                seen = store.add(store.intern(previous), node, i, previousCost)
+            else:
+                store.update(seen, node, i, previousCost)
+            heapq.heappush(leafs, (priority, pushes, previousCost, seen))
+            pushes += 1
+
+    _record(stats, expansions=expansions, pushes=pushes, states=len(store), exhausted=bool(leafs))
+    return None
+
+
+def _forwardLeaf(problem, store, node):
+    """ Builds the Node chain from the start state through the regressed actions. """
+    chain = Node(problem.state(problem.start), None, None)
+    done = set()
+    while store.actions[node] != -1:
+        action = problem.actions[store.actions[node]]
+        chain = Node(addDict(chain.state, action.expectation), chain, action)
+        done.add(action)
+        node = store.parents[node]
+    return Leaf(chain.action, chain, done)
+
+
+def _pathfindDoneActions(goals, actions, startstate, stats=None):
+    problem = Problem(goals, actions, startstate)
+    store = NodeStore(withMasks=True)
+    store.add(store.intern(np.array(problem.start, dtype=np.int32).tobytes()), -1, -1, 0)
+
+    leafs = [(0, 0)]  # priority queue of (cost, node)
+
+    debug_node_expansions = 0
+
+    while leafs:  # while not empty
+        debug_node_expansions += 1
+        (cost, node) = heapq.heappop(leafs)
+        vector = store.vector(node)
+        if problem.met(vector):
+            _record(stats, expansions=debug_node_expansions, pushes=len(store))
+            return _storeLeaf(problem, store, node)
+        (available, successors) = problem.successors(vector)
+        prevAction = store.actions[node]
+        done = store.masks[node]
+        for (i, successor) in zip(available.tolist(), successors):
+            if i == prevAction or not done & (1 << i):
+                successorCost = cost + problem.costs[i]
+                child = store.add(store.intern(successor.tobytes()), node, i, successorCost, done | (1 << i))
+                heapq.heappush(leafs, (successorCost, child))
+    _record(stats, expansions=debug_node_expansions, pushes=len(store))
+    return None
+
+
+def hoeGoals():
+    return np.array([
+        Goal({'hoes': 2}),
+    ])
+
+
+def hoeActions():
+    return np.array([
+        Action("findTrees", findTrees, {}, {'trees': 1}),
+        Action("craftTable", craftTable, {'planks': 4}, {'tables': 1, 'planks': -4}),
+        Action("craftPlank", craftPlank, {'logs': 1}, {'planks': 4, 'logs': -1}),
+        Action("chopWood", chopWood, {'trees': 1}, {'trees': -1, 'logs': 1}),
+        Action("craftHoe", craftHoe, {'tables': 1, 'planks': 2, 'sticks': 2}, {'hoes': 1, 'planks': -2, 'sticks': -2}),
+        Action("craftSticks", craftSticks, {'planks': 2}, {'sticks': 4, 'planks': -1}),
+    ])
+
+
+# simple wrapper around pathfind to make it easier to use, cache is an
+# optional planCache.PlanCache shared between agents and replans (forward
+# search only). direction is "forward", "backward" or "auto", which searches
+# backward when less than half of the actions are relevant to the goals.
+def plan(startstate, cache=None, direction="auto"):
+    goals = hoeGoals()
+    actions = hoeActions()
+    print 'starting goap'
+    starttime = time.time()
+    if cache is not None:
+        path = cache.plan(goals, actions, startstate) or []
+        print 'done in %0.3f seconds (cache hit rate %0.2f)' % (time.time() - starttime, cache.hitRate())
+        return path
+    if direction == "auto":
+        direction = "backward" if 2 * len(relevantActions(goals, actions)) < len(actions) else "forward"
+    search = pathfindBackward if direction == "backward" else pathfind
+    stats = {}
+    leaf = search(goals, actions, startstate, stats=stats, heuristic=RelaxedHeuristic)
+    endtime = time.time()
+    print 'node expansions %d (%s)' % (stats["expansions"], direction)
+    profiler.count("goap.expansions", stats["expansions"])
+    print 'done in %0.3f seconds' % (endtime - starttime)
+    path = []
+    if leaf is None:
+        return path
+    node = leaf.node
+    while node != None:
+        if (node.action != None):
+
+            path.append(node.action)
+        node = node.prev
+    return reversed(path)
+
+
+if __name__ == '__main__':
+    state = {}
+    path = plan(state)
+    for action in path:
+        result = action.function(None)
+        if result == ActionReturn.success:
+            continue
+        if result == ActionReturn.replanWithoutMe:
+            continue  # TODO: implement
@@ -0,0 +1,411 @@
+# Benchmarks for the GOAP planner, runs without Minecraft:
+#   python goapBenchmark.py
+
+import sys
+import time
+import multiprocessing
+import random
+import numpy as np
+
+from goap import *
+from planCache import PlanCache
+from planService import PlanningService
+
+
+def noop(w):
+    return ActionReturn.success
+
+
+def recipe(name, condition, expectation, cost=1):
+    return Action(name, noop, condition, expectation, cost)
+
+
+def hoeProblem():
+    """ The recipe plan() uses: two hoes from nothing. """
+    return hoeGoals(), hoeActions()
+
+
+def stoneToolsProblem(goal=None):
+    """
+    Wood and stone tier of Minecraft: mining stone and coal needs a wooden
+    pickaxe, which is kept (a tool is a condition, not a cost).
+    """
+    actions = [
+        recipe("findTrees", {}, {'trees': 1}),
+        recipe("chopWood", {'trees': 1}, {'trees': -1, 'logs': 1}),
+        recipe("craftPlank", {'logs': 1}, {'planks': 4, 'logs': -1}),
+        recipe("craftSticks", {'planks': 2}, {'sticks': 4, 'planks': -2}),
+        recipe("craftTable", {'planks': 4}, {'tables': 1, 'planks': -4}),
+        recipe("craftWoodenPickaxe", {'tables': 1, 'planks': 3, 'sticks': 2},
+               {'woodenPickaxes': 1, 'planks': -3, 'sticks': -2}),
+        recipe("mineStone", {'woodenPickaxes': 1}, {'cobblestone': 1}, 2),
+        recipe("mineCoal", {'woodenPickaxes': 1}, {'coal': 1}, 3),
+        recipe("craftStonePickaxe", {'tables': 1, 'cobblestone': 3, 'sticks': 2},
+               {'stonePickaxes': 1, 'cobblestone': -3, 'sticks': -2}),
+        recipe("craftStoneAxe", {'tables': 1, 'cobblestone': 3, 'sticks': 2},
+               {'stoneAxes': 1, 'cobblestone': -3, 'sticks': -2}),
+        recipe("craftFurnace", {'tables': 1, 'cobblestone': 8}, {'furnaces': 1, 'cobblestone': -8}),
+        recipe("craftTorch", {'sticks': 1, 'coal': 1}, {'torches': 4, 'sticks': -1, 'coal': -1}),
+    ]
+    return [Goal(goal or {'stonePickaxes': 1})], actions
+
+
+def wideProblem(extra=200, goal=None):
+    """
+    The stone tools recipes plus extra decorative recipes that turn planks and
+    cobblestone into blocks nothing else needs, so every state has many
+    available actions.
+    """
+    (goals, actions) = stoneToolsProblem(goal)
+    for i in range(extra):
+        material = 'planks' if i % 2 else 'cobblestone'
+        actions.append(recipe("craftDecoration%d" % i, {'tables': 1, material: 1 + i % 4},
+                              {'decoration%d' % i: 1, material: -(1 + i % 4)}, 1 + i % 3))
+    return goals, actions
+
+
+def craftingGraph(numItems, maxRecipes=3, toolChance=0.15, oreChance=0.1, maxTier=5, seed=0):
+    """
+    Generates a Minecraft like crafting graph, returns (items, tiers, actions).
+    Items are made in order and only from items made before them:
+      - a few basic raw items (logs, dirt, ...) that are gathered by hand,
+      - ores, gathered with an earlier tool (like stone needs a pickaxe),
+      - crafted items with 1 to maxRecipes recipes each. Every recipe uses 1-3
+        earlier items, mostly one of each, and sometimes needs an earlier tool
+        or workstation, which is a condition but isn't used up.
+    Some crafted items are tools. Costs, amounts and yields vary per recipe.
+    An item's tier is the number of crafting steps below it, like in
+    Minecraft no item is more than maxTier steps away from raw items.
+    """
+    rng = random.Random(seed)
+    items = []
+    tiers = {}
+    tools = []
+    actions = []
+
+    def gather(item, tier, tool=None):
+        condition = {tool: 1} if tool is not None else {}
+        actions.append(recipe("gather_%s" % item, condition, {item: 1}, rng.randint(1, 4)))
+        items.append(item)
+        tiers[item] = tier
+
+    for i in range(min(3, numItems)):
+        gather("raw%d" % i, 0)
+
+    while len(items) < numItems:
+        usable = [tool for tool in tools if tiers[tool] < maxTier]
+        if usable and rng.random() < oreChance:
+            tool = rng.choice(usable)
+            gather("ore%d" % len(items), tiers[tool] + 1, tool)
+            continue
+
+        item = "item%d" % len(items)
+        ingredientsFrom = [other for other in items if tiers[other] < maxTier]
+        tier = None
+        for r in range(rng.randint(1, maxRecipes)):
+            ingredients = rng.sample(ingredientsFrom, min(len(ingredientsFrom), rng.randint(1, 3)))
+            condition = dict((ingredient, rng.choice([1, 1, 1, 1, 1, 1, 2, 2, 3, 4])) for ingredient in ingredients)
+            expectation = dict((ingredient, -amount) for (ingredient, amount) in condition.items())
+            expectation[item] = rng.randint(1, 4)
+            recipeTier = 1 + max(tiers[ingredient] for ingredient in ingredients)
+            if usable and rng.random() < 0.3:
+                tool = rng.choice(usable)
+                condition[tool] = 1
+                recipeTier = max(recipeTier, 1 + tiers[tool])
+            tier = recipeTier if tier is None else min(tier, recipeTier)
+            actions.append(recipe("craft_%s_%d" % (item, r), condition, expectation, rng.randint(1, 5)))
+        items.append(item)
+        tiers[item] = tier
+        if rng.random() < toolChance:
+            tools.append(item)
+    return items, tiers, actions
+
+
+def bytesPerState(numResources):
+    """ Rough size of one entry of the best-cost table: state tuple, value tuple and dict slot. """
+    state = tuple(range(numResources))
+    return sys.getsizeof(state) + sys.getsizeof((0, state, None)) + 3 * 8
+
+
+def benchmarkProblem(name, label, goals, actions, startstate=None, search=pathfind, **options):
+    stats = {}
+    starttime = time.time()
+    leaf = search(goals, actions, startstate or {}, stats=stats, **options)
+    elapsed = time.time() - starttime
+    cost = 0
+    steps = 0
+    node = leaf.node if leaf is not None else None
+    while node is not None and node.action is not None:
+        cost += node.action.cost
+        steps += 1
+        node = node.prev
+    print "  %-30s %-12s %8d expansions %9d pushes %8.3f seconds %3d actions, cost %d" % (
+        name, label, stats["expansions"], stats["pushes"], elapsed, steps, cost)
+
+
+def problems():
+    return [
+        ("hoes: 2", hoeProblem()),
+        ("hoes: 2 (start with 2 logs)", hoeProblem() + ({'logs': 2},)),
+        ("stonePickaxes: 1", stoneToolsProblem()),
+        ("stonePickaxes + stoneAxes", stoneToolsProblem({'stonePickaxes': 1, 'stoneAxes': 1})),
+        ("furnaces: 1", stoneToolsProblem({'furnaces': 1})),
+        ("torches: 8", stoneToolsProblem({'torches': 8})),
+    ]
+
+
+def benchmarkClosedSet():
+    """ Compares the doneActions search with the best-cost table. """
+    for (name, problem) in problems():
+        benchmarkProblem(name, "doneActions", *problem, dedupe=False)
+        benchmarkProblem(name, "closed set", *problem)
+
+
+def benchmarkHeuristic():
+    """ Compares Dijkstra with A* using the relaxed heuristic. """
+    for (name, problem) in problems() + [("furnaces + torches: 16", stoneToolsProblem({'furnaces': 1, 'torches': 16}))]:
+        benchmarkProblem(name, "dijkstra", *problem)
+        benchmarkProblem(name, "A*", *problem, heuristic=RelaxedHeuristic)
+
+
+def benchmarkWide():
+    """ Planning time on the stone tools recipes with many extra actions. """
+    for extra in (0, 25, 50, 100):
+        benchmarkProblem("stonePickaxes, %d extra actions" % extra, "A*", *wideProblem(extra),
+                         heuristic=RelaxedHeuristic)
+
+
+def benchmarkDirections():
+    """ Compares forward and backward A* on narrow and wide action sets. """
+    for (name, problem) in problems():
+        benchmarkProblem(name, "forward", *problem, heuristic=RelaxedHeuristic)
+        benchmarkProblem(name, "backward", *problem, search=pathfindBackward, heuristic=RelaxedHeuristic)
+    for extra in (50, 100, 500):
+        (goals, actions) = wideProblem(extra)
+        name = "stonePickaxes, %d extra actions" % extra
+        if extra <= 100:
+            benchmarkProblem(name, "forward", goals, actions, heuristic=RelaxedHeuristic)
+        benchmarkProblem(name, "backward", goals, actions, search=pathfindBackward, heuristic=RelaxedHeuristic)
+        print "  %d of %d actions relevant" % (len(relevantActions(goals, actions)), len(actions))
+
+
+def consumedSupplyProblem():
+    """
+    The start state has the planks the goal asks for, but the table uses them
+    up, so the plan has to make planks again after crafting it.
+    """
+    actions = [
+        recipe("craftTable", {'planks': 4}, {'planks': -4, 'tables': 1}),
+        recipe("sawPlanks", {'tables': 1}, {'planks': 4}),
+    ]
+    return [Goal({'tables': 1, 'planks': 4})], actions, {'planks': 4}
+
+
+def benchmarkCompleteness():
+    """ Checks that forward and backward search find plans of the same cost. """
+    for (name, problem) in [("table, planks used up", consumedSupplyProblem())] + problems():
+        (goals, actions, startstate) = (problem + ({}, ))[:3]
+        costs = []
+        for (search, heuristic) in ((pathfind, None), (pathfindBackward, None), (pathfindBackward, RelaxedHeuristic)):
+            leaf = search(goals, actions, startstate, heuristic=heuristic)
+            node = leaf.node if leaf is not None else None
+            cost = 0
+            while node is not None and node.action is not None:
+                cost += node.action.cost
+                node = node.prev
+            costs.append(cost if leaf is not None else None)
+        print "  %-30s forward %s, backward %s, backward A* %s  %s" % (
+            (name, ) + tuple(costs) + ("ok" if len(set(costs)) == 1 else "MISMATCH", ))
+        assert len(set(costs)) == 1, name
+
+
+def benchmarkAnytime(tickSeconds=0.05, maxTicks=200):
+    """ Spreads AnytimePlanner over 50 ms ticks and reports when plans arrive. """
+    for (name, (goals, actions)) in [("furnaces: 1", stoneToolsProblem({'furnaces': 1})),
+                                     ("furnaces + torches: 16", stoneToolsProblem({'furnaces': 1, 'torches': 16}))]:
+        planner = AnytimePlanner(goals, actions, {})
+        firstPlan = None
+        ticks = 0
+        while not planner.finished and ticks < maxTicks:
+            (path, complete) = planner.step(maxSeconds=tickSeconds)
+            ticks += 1
+            if complete and firstPlan is None:
+                firstPlan = (ticks, planner.cost)
+        print "  %s" % name
+        if firstPlan is not None:
+            print "    first plan after %d ticks, cost %d" % firstPlan
+        print "    %s after %d ticks, best cost %s" % (
+            "optimal" if planner.finished else "still improving", ticks, planner.cost)
+        print "    %s" % planner.stats
+
+
+def benchmarkScalability(sizes=(50, 100, 200, 400), goalsPerTier=3, maxExpansions=1000, realtime=0.05):
+    """
+    Plans towards crafted items of every tier in generated crafting graphs of
+    growing size with every planner, and reports how many plans were found,
+    how many within a 50 ms tick, median latency, expansions and the
+    approximate memory of the search.
+    """
+    # (name, planner, largest graph to try it on)
+    planners = [
+        ("forward A*", lambda goals, actions, **options: pathfind(goals, actions, {}, **options), 200),
+        ("backward A*", lambda goals, actions, **options: pathfindBackward(goals, actions, {}, **options), None),
+        ("forward A*, relevant", lambda goals, actions, **options:
+            pathfind(goals, relevantActions(goals, actions), {}, **options), None),
+    ]
+    print "  %5s %7s %4s %-22s %8s %8s %10s %9s %9s" % (
+        "items", "actions", "tier", "planner", "solved", "in 50ms", "median ms", "expanded", "memory")
+    for size in sizes:
+        (items, tiers, actions) = craftingGraph(size, seed=size)
+        rng = random.Random(size)
+        for tier in sorted(set(tiers.values()) - set([0])):
+            candidates = [item for item in items if tiers[item] == tier]
+            targets = [rng.choice(candidates) for _ in range(goalsPerTier)]
+            for (name, planner, largest) in planners:
+                if largest is not None and size > largest:
+                    continue
+                latencies, expansions, memory = [], [], []
+                solved = 0
+                for target in targets:
+                    stats = {}
+                    starttime = time.time()
+                    leaf = planner([Goal({target: 1})], actions, stats=stats, heuristic=RelaxedHeuristic,
+                                   maxExpansions=maxExpansions)
+                    latencies.append(time.time() - starttime)
+                    expansions.append(stats["expansions"])
+                    memory.append(stats["states"] * bytesPerState(len(items)))
+                    solved += leaf is not None
+                latencies = np.array(latencies)
+                print "  %5d %7d %4d %-22s %5d/%-2d %5d/%-2d %10.1f %9d %7.2fMB" % (
+                    size, len(actions), tier, name, solved, len(targets), (latencies <= realtime).sum(),
+                    len(targets), np.median(latencies) * 1000, np.median(expansions), max(memory) / 1e6)
+    print "  (searches give up after %d expansions, forward A* over all actions takes minutes per plan" \
+          " beyond 200 items)" % maxExpansions
+
+
+def benchmarkPlanCache(numAgents=8, replans=3, seed=5):
+    """
+    Agents with similar start inventories plan toward the same goal, execute a
+    part of their plan and replan from where they are, with and without a
+    shared PlanCache.
+    """
+    (goals, actions) = stoneToolsProblem({'stonePickaxes': 1})
+    rng = random.Random(seed)
+    starts = [{'logs': rng.randint(0, 2), 'planks': rng.randint(0, 4)} for _ in range(numAgents)]
+    cuts = [[rng.random() for _ in range(replans)] for _ in range(numAgents)]
+
+    def run(cache, exact=True):
+        starttime = time.time()
+        expansions = 0
+        for (state, agentCuts) in zip(starts, cuts):
+            for cut in agentCuts + [None]:
+                if cache is not None:
+                    path = cache.plan(goals, actions, state, exact=exact)
+                else:
+                    stats = {}
+                    leaf = pathfind(goals, actions, state, stats=stats, heuristic=RelaxedHeuristic)
+                    expansions += stats["expansions"]
+                    path = []
+                    node = leaf.node
+                    while node.action is not None:
+                        path.append(node.action)
+                        node = node.prev
+                    path.reverse()
+                if cut is None:
+                    break
+                for action in path[:int(cut * len(path))]:
+                    state = addDict(state, action.expectation)
+        if cache is not None:
+            expansions = cache.stats["expansions"]
+        return time.time() - starttime, expansions
+
+    print "  %d agents, %d plan calls each" % (numAgents, replans + 1)
+    print "  no cache:          %8.3f seconds %8d expansions" % run(None)
+    cache = PlanCache()
+    print "  cache:             %8.3f seconds %8d expansions, hit rate %0.2f" % (run(cache) + (cache.hitRate(),))
+    print "  %s" % cache.stats
+    cache = PlanCache()
+    print "  cache, exact=False %8.3f seconds %8d expansions, hit rate %0.2f" % (
+        run(cache, exact=False) + (cache.hitRate(),))
+    print "  %s" % cache.stats
+
+
+def benchmarkPlanService(agentCounts=(1, 2, 4, 8, 16), tick=0.01, seed=3):
+    """
+    Agents with random start inventories plan toward stone tools, planned one
+    after the other on the main thread and with a PlanningService, while the
+    main thread runs a tick loop (like the observation loop) and waits for the
+    plans. Reports plans per second and the longest tick loop stall. Then every
+    agent replans from a changed state right after its first request, so the
+    first one is superseded.
+    """
+    (_, actions) = stoneToolsProblem()
+    goalChoices = [{'stonePickaxes': 1}, {'torches': 8}, {'stoneAxes': 1, 'torches': 4}]
+    rng = random.Random(seed)
+    requests = [([Goal(rng.choice(goalChoices))], {'logs': rng.randint(0, 2), 'planks': rng.randint(0, 4)})
+                for _ in range(max(agentCounts))]
+
+    def sequential(numAgents):
+        starttime = time.time()
+        stall = 0
+        for (goals, state) in requests[:numAgents]:
+            planstart = time.time()
+            planner = AnytimePlanner(goals, actions, state, weight=1.0)
+            while not planner.finished:
+                planner.step()
+            stall = max(stall, time.time() - planstart)
+        return time.time() - starttime, stall
+
+    def pooled(service, numAgents, replan=False):
+        starttime = time.time()
+        futures = [service.submit(agent, state, goals) for (agent, (goals, state)) in enumerate(requests[:numAgents])]
+        if replan:
+            futures = [service.submit(agent, addDict(state, {'logs': 1}), goals)
+                       for (agent, (goals, state)) in enumerate(requests[:numAgents])]
+        stall = 0
+        last = time.time()
+        while not all(future.done() for future in futures):
+            time.sleep(tick)
+            now = time.time()
+            stall = max(stall, now - last - tick)
+            last = now
+        return time.time() - starttime, stall
+
+    print "  %d cores" % multiprocessing.cpu_count()
+    print "  agents planner                   plans/second  longest stall"
+    processes = sorted(set([1, multiprocessing.cpu_count()]))
+    services = [(count, PlanningService(actions, processes=count)) for count in processes]
+    for numAgents in agentCounts:
+        (elapsed, stall) = sequential(numAgents)
+        print "  %6d %-25s %10.1f %12.3fs" % (numAgents, "main thread", numAgents / elapsed, stall)
+        for (count, service) in services:
+            (elapsed, stall) = pooled(service, numAgents)
+            print "  %6d %-25s %10.1f %12.3fs" % (numAgents, "service, %d process%s" % (count, "es" * (count > 1)),
+                                                  numAgents / elapsed, stall)
+    for (count, service) in services:
+        before = dict(service.stats)
+        (elapsed, _) = pooled(service, max(agentCounts), replan=True)
+        print "  replanning %d agents, %d process%s: %.3f seconds, %d superseded, %d expansions" % (
+            max(agentCounts), count, "es" * (count > 1), elapsed,
+            service.stats["superseded"] - before["superseded"], service.stats["expansions"] - before["expansions"])
+        service.close()
+
+
+if __name__ == '__main__':
+    benchmarkClosedSet()
+    print
+    benchmarkHeuristic()
+    print
+    benchmarkWide()
+    print
+    benchmarkDirections()
+    print
+    benchmarkCompleteness()
+    print
+    benchmarkAnytime()
+    print
+    benchmarkPlanCache()
+    print
+    benchmarkScalability()
+    print
+    benchmarkPlanService()
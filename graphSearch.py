@@ -0,0 +1,419 @@
+# Route finding on a waypointGraph.WaypointGraph, works on integer waypoint ids
+# and the cached edge weights of the graph instead of WaypointNode objects.
+
+import heapq
+import numpy as np
+
+
+def reconstructIds(current, cameFrom):
+    """ Reconstructs a route of ids using the cameFrom dictionary and the last id. """
+    route = [current]
+    while current in cameFrom:
+        current = cameFrom[current]
+        route.append(current)
+    route.reverse()
+    return route
+
+
+def euclidianHeuristic(graph, goal):
+    """ Returns h(id) giving the straight line distance to the goal waypoint. """
+    distance = graph.distance
+    return lambda wid: distance(wid, goal)
+
+
+def astar(graph, start, goal, heuristic=None, stats=None):
+    """
+    A* from waypoint id start to waypoint id goal. The heuristic is a function
+    h(id) -> float and defaults to the euclidian distance to the goal. When
+    given, the stats dict receives the number of node expansions.
+    Returns a list of ids, or None if no route was found.
+    """
+    if heuristic is None:
+        heuristic = euclidianHeuristic(graph, goal)
+
+    gScore = {start: 0.0}
+    cameFrom = {}
+    closedSet = set()
+    openHeap = [(heuristic(start), start)]
+    expansions = 0
+    route = None
+
+    while openHeap:
+        (f, current) = heapq.heappop(openHeap)
+        if current in closedSet:
+            continue  # outdated heap entry
+        if current == goal:
+            route = reconstructIds(current, cameFrom)
+            break
+
+        closedSet.add(current)
+        expansions += 1
+        g = gScore[current]
+        neighbors, weights = graph.edges(current)
+
+        for (neighbor, weight) in zip(neighbors, weights):
+            if neighbor in closedSet:
+                continue
+            gScore_t = g + weight
+            if gScore_t >= gScore.get(neighbor, float("inf")):
+                continue
+            cameFrom[neighbor] = current
+            gScore[neighbor] = gScore_t
+            heapq.heappush(openHeap, (gScore_t + heuristic(neighbor), neighbor))
+
+    if stats is not None:
+        stats["expansions"] = expansions
+    return route
+
+
+def routeLength(graph, route):
+    """ Returns the summed length of the edges along a route of ids. """
+    return sum(graph.distance(a, b) for (a, b) in zip(route, route[1:]))
+
+
+def bidirectionalAstar(graph, start, goal, stats=None):
+    """
+    Bidirectional A* from waypoint id start to waypoint id goal, searching from
+    both ends at the same time. Uses the average of the euclidian heuristics
+    of both directions as potential, which is consistent for both searches, so
+    the search can stop as soon as the smallest keys of both sides add up to
+    the best route found so far and the route is still optimal.
+    Returns a list of ids, or None if no route was found.
+    """
+    if start == goal:
+        if stats is not None:
+            stats["expansions"] = 0
+        return [start]
+
+    distance = graph.distance
+    potential = lambda wid: (distance(wid, goal) - distance(wid, start)) / 2.0
+
+    # index 0 is the forward search from start, index 1 the reverse one from goal
+    gScores = ({start: 0.0}, {goal: 0.0})
+    cameFroms = ({}, {})
+    closedSets = (set(), set())
+    signs = (1.0, -1.0)
+    openHeaps = ([(potential(start), start)], [(-potential(goal), goal)])
+    best = float("inf")
+    meeting = None
+    expansions = 0
+
+    while openHeaps[0] and openHeaps[1]:
+        if openHeaps[0][0][0] + openHeaps[1][0][0] >= best:
+            break  # no route through an unexpanded waypoint can be shorter
+
+        # expand the side with the smaller open set
+        side = 0 if len(openHeaps[0]) <= len(openHeaps[1]) else 1
+        (key, current) = heapq.heappop(openHeaps[side])
+        if current in closedSets[side]:
+            continue  # outdated heap entry
+
+        closedSets[side].add(current)
+        expansions += 1
+        gScore, otherGScore = gScores[side], gScores[1 - side]
+        g = gScore[current]
+        neighbors, weights = graph.edges(current)
+
+        for (neighbor, weight) in zip(neighbors, weights):
+            if neighbor in closedSets[side]:
+                continue
+            gScore_t = g + weight
+            if gScore_t >= gScore.get(neighbor, float("inf")):
+                continue
+            cameFroms[side][neighbor] = current
+            gScore[neighbor] = gScore_t
+            heapq.heappush(openHeaps[side], (gScore_t + signs[side] * potential(neighbor), neighbor))
+
+            # check if this connects both searches with a shorter route
+            if neighbor in otherGScore and gScore_t + otherGScore[neighbor] < best:
+                best = gScore_t + otherGScore[neighbor]
+                meeting = neighbor
+
+    if stats is not None:
+        stats["expansions"] = expansions
+    if meeting is None:
+        return None
+
+    route = reconstructIds(meeting, cameFroms[0])
+    current = meeting
+    while current in cameFroms[1]:
+        current = cameFroms[1][current]
+        route.append(current)
+    return route
+
+
+class DStarLite(object):
+    """
+    Incremental route planner (D* Lite) towards one goal waypoint. It searches
+    backwards from the goal and keeps its search state between calls, so when
+    the graph changes only the affected part of the plan is repaired instead of
+    searching again from scratch. The planner listens to changes of the graph
+    until close() is called.
+    """
+
+    def __init__(self, graph, goal):
+        super(DStarLite, self).__init__()
+        self.graph = graph
+        self.goal = goal
+        self.epoch = graph.epoch
+        self.start = None
+        self.km = 0.0  # accumulated heuristic offset for moving starts
+        self.g = {}
+        self.rhs = {goal: 0.0}
+        self.openHeap = []
+        self.openKeys = {}  # id -> current key of the id in openHeap
+        self.changed = set()  # ids whose edges changed since the last plan
+        self.expansions = 0  # total node expansions done by this planner
+        self._push(goal, (0.0, 0.0))  # the real key is set once the start is known
+        graph.listeners.append(self._graphChanged)
+
+    def close(self):
+        """ Stops listening to changes of the graph. """
+        if self._graphChanged in self.graph.listeners:
+            self.graph.listeners.remove(self._graphChanged)
+
+    def _graphChanged(self, ids):
+        self.changed.update(ids)
+
+    def _key(self, wid):
+        best = min(self.g.get(wid, float("inf")), self.rhs.get(wid, float("inf")))
+        return (best + self.graph.distance(self.start, wid) + self.km, best)
+
+    def _push(self, wid, key):
+        self.openKeys[wid] = key
+        heapq.heappush(self.openHeap, (key, wid))
+
+    def _topKey(self):
+        """ Returns the smallest valid key in the open heap, dropping outdated entries. """
+        while self.openHeap:
+            (key, wid) = self.openHeap[0]
+            if self.openKeys.get(wid) == key:
+                return key
+            heapq.heappop(self.openHeap)
+        return (float("inf"), float("inf"))
+
+    def _updateVertex(self, wid):
+        graph = self.graph
+        if wid != self.goal:
+            rhs = float("inf")
+            if graph.isAlive(wid):
+                neighbors, weights = graph.edges(wid)
+                for (neighbor, weight) in zip(neighbors, weights):
+                    rhs = min(rhs, weight + self.g.get(neighbor, float("inf")))
+            self.rhs[wid] = rhs
+
+        self.openKeys.pop(wid, None)
+        if self.g.get(wid, float("inf")) != self.rhs.get(wid, float("inf")):
+            self._push(wid, self._key(wid))
+
+    def _computeShortestPath(self):
+        start = self.start
+        while True:
+            topKey = self._topKey()
+            if topKey >= self._key(start) and self.rhs.get(start, float("inf")) == self.g.get(start, float("inf")):
+                break
+            (key, current) = heapq.heappop(self.openHeap)
+            del self.openKeys[current]
+            self.expansions += 1
+
+            newKey = self._key(current)
+            if key < newKey:
+                self._push(current, newKey)
+            elif self.g.get(current, float("inf")) > self.rhs.get(current, float("inf")):
+                self.g[current] = self.rhs[current]
+                for neighbor in self.graph.neighbors(current):
+                    self._updateVertex(neighbor)
+            else:
+                self.g[current] = float("inf")
+                self._updateVertex(current)
+                for neighbor in self.graph.neighbors(current):
+                    self._updateVertex(neighbor)
+
+    def plan(self, start):
+        """
+        Returns the shortest route of ids from start to the goal, or None if the
+        goal can't be reached. Repairs the previous plan if the graph changed.
+        """
+        if self.epoch != self.graph.epoch:
+            raise ValueError("the graph was compacted, the planner has to be created again")
+        if not (self.graph.isAlive(start) and self.graph.isAlive(self.goal)):
+            return None
+
+        if self.start is not None and start != self.start:
+            self.km += self.graph.distance(self.start, start)
+        self.start = start
+
+        changed, self.changed = self.changed, set()
+        for wid in changed:
+            self._updateVertex(wid)
+        self._computeShortestPath()
+
+        if self.g.get(start, float("inf")) == float("inf"):
+            return None
+
+        # walk down the g values towards the goal
+        route = [start]
+        current = start
+        visited = set(route)
+        while current != self.goal:
+            neighbors, weights = self.graph.edges(current)
+            best = None
+            bestCost = float("inf")
+            for (neighbor, weight) in zip(neighbors, weights):
+                cost = weight + self.g.get(neighbor, float("inf"))
+                if cost < bestCost and neighbor not in visited:
+                    best, bestCost = neighbor, cost
+            if best is None:
+                return None
+            route.append(best)
+            visited.add(best)
+            current = best
+        return route
+
+
+class Landmarks(object):
+    """
+    Landmark (ALT) heuristic for A*. Stores the shortest route distance from a
+    few landmark waypoints to every waypoint, and uses the triangle inequality
+    |d(L, goal) - d(L, v)| <= d(v, goal) as a lower bound that follows walls and
+    winding trails much better than the straight line distance.
+    Edges added to the graph are applied lazily (distances can only shrink),
+    removed edges only make the bound less tight, so it stays admissible.
+    """
+
+    # Distances are stored as float32, the bound is lowered by this fraction of
+    # the largest distance to make up for the rounding
+    SLACK = 1e-6
+
+    def __init__(self, graph, count=8):
+        super(Landmarks, self).__init__()
+        self.graph = graph
+        self.count = count
+        self.landmarks = []  # ids of the landmark waypoints
+        self.distances = np.zeros((0, 0), dtype=np.float32)  # [landmark, id]
+        self.selectedSize = 0  # number of waypoints when the landmarks were selected
+        self.epoch = graph.epoch  # waypoint numbering the distances belong to
+        self.pendingEdges = []  # (id, id, weight) added since the last update
+        graph.listeners.append(self._graphChanged)
+        self.select()
+
+    def close(self):
+        """ Stops listening to changes of the graph. """
+        if self._graphChanged in self.graph.listeners:
+            self.graph.listeners.remove(self._graphChanged)
+
+    def _graphChanged(self, ids):
+        # removals and detached waypoints keep the bound admissible, only new edges matter
+        if len(ids) == 2:
+            weight = self.graph.edgeWeight(ids[0], ids[1])
+            if weight is not None:
+                self.pendingEdges.append((ids[0], ids[1], weight))
+
+    def _propagate(self, distances, seeds):
+        """ Lowers the distances with a Dijkstra search starting from the seed ids. """
+        graph = self.graph
+        openHeap = [(float(distances[wid]), wid) for wid in seeds]
+        heapq.heapify(openHeap)
+        while openHeap:
+            (d, current) = heapq.heappop(openHeap)
+            if d > distances[current]:
+                continue  # outdated heap entry
+            neighbors, weights = graph.edges(current)
+            for (neighbor, weight) in zip(neighbors, weights):
+                if d + weight < distances[neighbor]:
+                    distances[neighbor] = d + weight
+                    heapq.heappush(openHeap, (float(distances[neighbor]), neighbor))
+
+    def _resize(self):
+        """ Makes room for waypoints added to the graph since the last update. """
+        if self.distances.shape[1] < self.graph.size:
+            grown = np.full((len(self.landmarks), self.graph.size), np.inf, dtype=np.float32)
+            grown[:, :self.distances.shape[1]] = self.distances
+            self.distances = grown
+
+    def select(self):
+        """
+        Selects the landmarks (each one the waypoint farthest away from the
+        ones picked before) and computes their distances to every waypoint.
+        """
+        graph = self.graph
+        self.landmarks = []
+        self.distances = np.zeros((0, graph.size), dtype=np.float32)
+        self.pendingEdges = []
+        self.selectedSize = len(graph)
+        self.epoch = graph.epoch
+        ids = graph.ids()
+        if len(ids) == 0:
+            return
+
+        # start from the waypoint farthest away from an arbitrary one
+        distances = np.full(graph.size, np.inf, dtype=np.float32)
+        distances[ids[0]] = 0.0
+        self._propagate(distances, [ids[0]])
+        closest = distances
+
+        rows = []
+        for i in range(min(self.count, len(ids))):
+            finite = np.where(np.isfinite(closest), closest, -1.0)
+            finite[~graph.alive[:graph.size]] = -1.0
+            landmark = int(np.argmax(finite))
+            if landmark in self.landmarks:
+                break
+
+            distances = np.full(graph.size, np.inf, dtype=np.float32)
+            distances[landmark] = 0.0
+            self._propagate(distances, [landmark])
+            self.landmarks.append(landmark)
+            rows.append(distances)
+            closest = distances if i == 0 else np.minimum(closest, distances)
+
+        self.distances = np.array(rows, dtype=np.float32)
+
+    def update(self):
+        """ Applies the edges added to the graph since the last update. """
+        if len(self.graph) > 2 * max(1, self.selectedSize) or not self.landmarks or \
+                self.epoch != self.graph.epoch:
+            # the graph grew a lot (the old landmarks are likely in a bad spot), or
+            # it was compacted and the waypoints were renumbered
+            self.select()
+            return
+
+        self._resize()
+        pending, self.pendingEdges = self.pendingEdges, []
+        for (k, distances) in enumerate(self.distances):
+            seeds = []
+            for (a, b, weight) in pending:
+                for (u, v) in ((a, b), (b, a)):
+                    if distances[u] + weight < distances[v]:
+                        distances[v] = distances[u] + weight
+                        seeds.append(v)
+            if seeds:
+                self._propagate(distances, seeds)
+
+    def heuristic(self, goal):
+        """ Returns h(id) for A* towards goal, the best of the ALT and euclidian bounds. """
+        self.update()
+        distance = self.graph.distance
+        toGoal = self.distances[:, goal] if self.landmarks else np.zeros(0, dtype=np.float32)
+        useful = np.isfinite(toGoal)
+        distances = self.distances[useful]
+        toGoal = toGoal[useful]
+        if len(toGoal) == 0:
+            return lambda wid: distance(wid, goal)
+        slack = self.SLACK * float(np.max(toGoal))
+
+        def h(wid):
+            bound = float(np.max(np.abs(toGoal - distances[:, wid]))) - slack
+            return max(bound, distance(wid, goal))
+        return h
+
+    def memoryUsage(self):
+        """ Returns the number of bytes used by the distance table. """
+        return self.distances.nbytes
+
+
+# Route finding engines that findRoute can select by name
+ENGINES = {
+    "astar": astar,
+    "bidirectional": bidirectionalAstar,
+}
@@ -0,0 +1,207 @@
+# Benchmarks for agent messages, runs without Minecraft:
+#   python messageBenchmark.py
+
+import json
+import random
+import threading
+import time
+
+import messageCodec
+from blackboard import Blackboard
+from messageBus import MessageBus
+
+
+def randomMessages(count, numAgents=8, seed=0):
+    """ Query/Reply/Confirmation dicts like communication.Agent sends, with small contents. """
+    rng = random.Random(seed)
+    messages = []
+    for nr in xrange(count):
+        kind = rng.choice('QRC')
+        message = {'type': kind,
+                   'senderID': rng.randrange(numAgents),
+                   'messageNr': nr,
+                   'senderLocation': (rng.uniform(-20, 20), 204.0, rng.uniform(-20, 20)),
+                   'content': rng.choice([{'need': 'planks', 'amount': rng.randint(1, 8)},
+                                          {'have': 'logs', 'amount': rng.randint(1, 8)},
+                                          'ok'])}
+        if kind != 'Q':
+            message['recipientID'] = rng.randrange(numAgents)
+            message['replyToID' if kind == 'R' else 'confirmToID'] = rng.randrange(max(1, nr))
+        messages.append(message)
+    return messages
+
+
+def timed(function, argument, repeat):
+    starttime = time.time()
+    for _ in xrange(repeat):
+        result = function(argument)
+    return result, (time.time() - starttime) / repeat
+
+
+def benchmarkCodec(count=10000, repeat=5):
+    """ Size and encode/decode time of messages as JSON, binary one by one and binary batches. """
+    messages = randomMessages(count)
+
+    def jsonEach(messages):
+        return [json.dumps(message) for message in messages]
+
+    def jsonLoadEach(encoded):
+        return [json.loads(text) for text in encoded]
+
+    def binaryEach(messages):
+        return [messageCodec.encode(message) for message in messages]
+
+    def binaryDecodeEach(encoded):
+        return [messageCodec.decode(buffer)[0] for buffer in encoded]
+
+    print "  %d messages        bytes/message  encode us/message  decode us/message" % count
+    for (label, encoder, decoder) in [("json", jsonEach, jsonLoadEach),
+                                      ("binary", binaryEach, binaryDecodeEach),
+                                      ("binary batch", messageCodec.encodeBatch, messageCodec.decodeBatch)]:
+        (encoded, encodeTime) = timed(encoder, messages, repeat)
+        (decoded, decodeTime) = timed(decoder, encoded, repeat)
+        size = len(encoded) if isinstance(encoded, str) else sum(len(text) for text in encoded)
+        print "  %-20s %12.1f %18.2f %18.2f" % (label, size / float(count), 1e6 * encodeTime / count,
+                                               1e6 * decodeTime / count)
+
+
+def benchmarkBus(agentCounts=(8, 32, 64), requestsPerAgent=300, window=8, seed=0):
+    """
+    Every agent runs in its own thread, keeps up to window queries to random
+    other agents open and answers the queries it receives. Reports messages
+    (queries and replies) per second and the round trip time.
+    """
+    print "  agents   messages/second   round trip ms   dropped  expired"
+    for numAgents in agentCounts:
+        bus = MessageBus(maxQueue=64)
+        mailboxes = [bus.register(agentID) for agentID in range(numAgents)]
+        roundTrips = []
+        busy = [numAgents]  # agents with open queries, the others keep answering until it is 0
+        lock = threading.Lock()
+
+        def run(agentID):
+            rng = random.Random(seed + agentID)
+            messageNr = 0
+            sent = 0
+            outstanding = []
+            working = True
+            while working or busy[0]:
+                if working and sent == requestsPerAgent and not outstanding:
+                    working = False
+                    with lock:
+                        busy[0] -= 1
+                while sent < requestsPerAgent and len(outstanding) < window:
+                    recipient = rng.choice([other for other in range(numAgents) if other != agentID])
+                    query = {'type': 'Q', 'senderID': agentID, 'messageNr': messageNr, 'senderLocation': (0, 0, 0),
+                             'recipientID': recipient, 'content': {'need': 'planks'}}
+                    messageNr += 1
+                    outstanding.append((time.time(), bus.request(query, timeout=5.0)))
+                    sent += 1
+                message = mailboxes[agentID].receive(0.001)
+                if message is not None and message['type'] == 'Q':
+                    bus.publish({'type': 'R', 'senderID': agentID, 'messageNr': messageNr, 'senderLocation': (0, 0, 0),
+                                 'recipientID': message['senderID'], 'replyToID': message['messageNr'],
+                                 'content': {'have': 'planks'}})
+                    messageNr += 1
+                stillOpen = []
+                for (senttime, future) in outstanding:
+                    if future.done():
+                        roundTrips.append(future.finished - senttime if future.message else None)
+                    else:
+                        stillOpen.append((senttime, future))
+                outstanding = stillOpen
+
+        threads = [threading.Thread(target=run, args=(agentID, )) for agentID in range(numAgents)]
+        starttime = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - starttime
+        answered = sorted(roundTrip for roundTrip in roundTrips if roundTrip is not None)
+        print "  %6d %17.0f %15.2f %9d %8d" % (numAgents, bus.stats["published"] / elapsed,
+                                               1000 * answered[len(answered) // 2], bus.stats["dropped"],
+                                               bus.stats["expired"])
+
+
+def benchmarkSpatial(agentCounts=(16, 64, 256, 1024), density=1 / 256.0, radius=24.0, nearest=4, queries=2000,
+                     seed=0):
+    """
+    Agents spread over a square area that grows with their number (constant
+    density, 1 agent per 16x16 blocks by default) send queries to everybody,
+    to the agents within radius and to the nearest ones. Reports mailboxes
+    reached and microseconds per query.
+    """
+    print "  agents   mode              deliveries/query   us/query"
+    for numAgents in agentCounts:
+        rng = random.Random(seed)
+        side = (numAgents / density) ** 0.5
+        bus = MessageBus(maxQueue=0)
+        for agentID in range(numAgents):
+            bus.register(agentID)
+            bus.moved(agentID, (rng.uniform(0, side), 204.0, rng.uniform(0, side)))
+        for (mode, extra) in [("broadcast", {}), ("radius %g" % radius, {'radius': radius}),
+                              ("nearest %d" % nearest, {'nearest': nearest})]:
+            senders = [rng.randrange(numAgents) for _ in xrange(queries if numAgents < 1024 or extra else 200)]
+            delivered = bus.stats["delivered"]
+            starttime = time.time()
+            for (messageNr, sender) in enumerate(senders):
+                query = {'type': 'Q', 'senderID': sender, 'messageNr': messageNr,
+                         'senderLocation': bus.grid.positions[sender], 'content': {'need': 'planks'}}
+                query.update(extra)
+                bus.publish(query)
+            elapsed = time.time() - starttime
+            for mailbox in bus.mailboxes.itervalues():
+                mailbox.drain()
+            print "  %6d   %-15s %18.1f %10.1f" % (numAgents, mode, (bus.stats["delivered"] - delivered) /
+                                                   float(len(senders)), 1e6 * elapsed / len(senders))
+
+
+def benchmarkBlackboard(numAgents=8, rounds=20, discoveries=50, seed=0):
+    """
+    Every round each agent discovers blocks (some of them already known to
+    others, some trees get chopped) and a waypoint, then pulls from two random
+    teammates. Compares the JSON bytes of the deltas with sending the whole
+    blackboard every time.
+    """
+    rng = random.Random(seed)
+    boards = [Blackboard(agentID) for agentID in range(numAgents)]
+    types = ['log', 'leaves', 'grass', 'stone', 'dirt']
+    print "  round   facts/agent   delta bytes/pull   full state bytes/pull"
+    for turn in range(rounds):
+        for board in boards:
+            for _ in range(discoveries):
+                position = (rng.randint(-200, 200), rng.randint(200, 210), rng.randint(-200, 200))
+                board.setBlock(position, rng.choice(types) if rng.random() > 0.1 else None)
+            board.setWaypoint((rng.uniform(-200, 200), 204, rng.uniform(-200, 200)), 1.5,
+                              {'log': True} if rng.random() < 0.3 else {})
+        deltaBytes = 0
+        fullBytes = 0
+        pulls = 0
+        for board in boards:
+            for other in rng.sample([peer for peer in boards if peer is not board], 2):
+                (sequence, entries) = other.delta(board.cursors.get(other.replicaID, 0), board.replicaID)
+                board.cursors[other.replicaID] = sequence
+                board.merge(entries)
+                deltaBytes += len(json.dumps(entries))
+                fullBytes += len(json.dumps(other.delta()[1]))
+                pulls += 1
+        if turn % 5 == 4 or turn == rounds - 1:
+            print "  %5d %13d %18d %23d" % (turn + 1, sum(len(board) for board in boards) / numAgents,
+                                            deltaBytes / pulls, fullBytes / pulls)
+    for board in boards:
+        for other in boards:
+            if other is not board:
+                board.pull(other)
+    agree = all(board.facts == boards[0].facts for board in boards)
+    print "  after a full sync all blackboards agree: %s" % agree
+
+
+if __name__ == '__main__':
+    benchmarkCodec()
+    print
+    benchmarkBus()
+    print
+    benchmarkSpatial()
+    print
+    benchmarkBlackboard()
@@ -0,0 +1,208 @@
+# In-process message bus for the Query/Reply/Confirmation messages of
+# communication.py (the message dicts Agent builds). Every agent registers a
+# Mailbox, a bounded queue that blocks senders when it is full. A message goes
+# to its recipientID, or to the subscribers of its topic, or to every other
+# agent. A radius or nearest count in the message limits that to the agents
+# within the radius of (or the k nearest to) its senderLocation, found through
+# a SpatialGrid of the positions agents report with moved(). request() returns
+# a ReplyFuture that is resolved by the reply (or confirmation) whose
+# replyToID (confirmToID) is the request's messageNr.
+
+import threading
+import time
+import Queue
+
+from spatialGrid import SpatialGrid
+
+KINDS = {'R': 'replyToID', 'C': 'confirmToID'}
+
+
+class ReplyFuture:
+    """
+    Reply to a request. status is "pending" until a matching message arrives
+    ("done"), the request's timeout passed ("expired") or cancel() is called
+    ("cancelled").
+    """
+
+    def __init__(self, bus, key, deadline):
+        self.bus = bus
+        self.key = key  # (requester, messageNr, kind)
+        self.deadline = deadline  # time.time() after which the request expires, or None
+        self.status = "pending"
+        self.message = None
+        self.finished = None
+        self._event = threading.Event()
+
+    def done(self):
+        if self.status == "pending" and self.deadline is not None and time.time() >= self.deadline:
+            self.bus._resolve(self.key, "expired")
+        return self.status != "pending"
+
+    def result(self, timeout=None):
+        """
+        Waits for the reply, up to timeout seconds or the request's deadline
+        (whichever comes first), and returns it, or None.
+        """
+        if self.deadline is not None:
+            remaining = max(0.0, self.deadline - time.time())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self._event.wait(timeout)
+        self.done()  # expires the request once its deadline passed
+        return self.message
+
+    def cancel(self):
+        return self.bus._resolve(self.key, "cancelled")
+
+    def _finish(self, status, message):
+        self.status = status
+        self.message = message
+        self.finished = time.time()
+        self._event.set()
+
+
+class Mailbox:
+    def __init__(self, agentID, maxQueue):
+        self.agentID = agentID
+        self.queue = Queue.Queue(maxQueue)
+
+    def receive(self, timeout=None):
+        """ Returns the next message, waiting up to timeout seconds (forever if None), or None. """
+        try:
+            return self.queue.get(timeout is None or timeout > 0, timeout)
+        except Queue.Empty:
+            return None
+
+    def drain(self):
+        """ Returns all queued messages without waiting. """
+        messages = []
+        while True:
+            try:
+                messages.append(self.queue.get_nowait())
+            except Queue.Empty:
+                return messages
+
+
+class MessageBus:
+    """
+    Local broker between agents in one process, safe to use from a thread per
+    agent. Mailboxes hold at most maxQueue messages, a full one makes publish()
+    wait up to sendTimeout seconds before the message is dropped for it.
+    """
+
+    def __init__(self, maxQueue=256, sendTimeout=1.0, cellSize=16.0):
+        self.maxQueue = maxQueue
+        self.sendTimeout = sendTimeout
+        self.lock = threading.Lock()
+        self.mailboxes = {}  # agentID -> Mailbox
+        self.topics = {}  # topic -> set of agentIDs
+        self.grid = SpatialGrid(cellSize)  # positions of the agents that reported one
+        self.pending = {}  # (requester, messageNr, kind) -> ReplyFuture
+        self.stats = dict(published=0, delivered=0, dropped=0, replies=0, expired=0)
+
+    def register(self, agentID):
+        with self.lock:
+            if agentID not in self.mailboxes:
+                self.mailboxes[agentID] = Mailbox(agentID, self.maxQueue)
+            return self.mailboxes[agentID]
+
+    def unregister(self, agentID):
+        with self.lock:
+            self.mailboxes.pop(agentID, None)
+            self.grid.remove(agentID)
+            for subscribers in self.topics.itervalues():
+                subscribers.discard(agentID)
+
+    def moved(self, agentID, location):
+        """ Updates the position of an agent, call it with Controller.location after every observation. """
+        with self.lock:
+            self.grid.update(agentID, location)
+
+    def subscribe(self, agentID, topic):
+        with self.lock:
+            self.topics.setdefault(topic, set()).add(agentID)
+
+    def unsubscribe(self, agentID, topic):
+        with self.lock:
+            self.topics.get(topic, set()).discard(agentID)
+
+    def recipients(self, message):
+        """ Returns the mailboxes a message goes to. """
+        with self.lock:
+            if message.get('recipientID', -1) != -1:
+                mailbox = self.mailboxes.get(message['recipientID'])
+                return [mailbox] if mailbox is not None else []
+            topic = message.get('topic')
+            subscribers = self.topics.get(topic, ()) if topic is not None else self.mailboxes
+
+            def accept(agentID):
+                return agentID != message['senderID'] and agentID in self.mailboxes and agentID in subscribers
+
+            if message.get('radius') is not None:
+                agentIDs = self.grid.within(message['senderLocation'], message['radius'], accept)
+            elif message.get('nearest') is not None:
+                agentIDs = self.grid.nearest(message['senderLocation'], message['nearest'], accept)
+            else:
+                agentIDs = [agentID for agentID in subscribers if accept(agentID)]
+            return [self.mailboxes[agentID] for agentID in agentIDs]
+
+    def publish(self, message, timeout=None):
+        """
+        Sends a message, returns the number of mailboxes it was put in. A reply
+        or confirmation that a request waits for resolves its future instead.
+        timeout overrides sendTimeout for full mailboxes.
+        """
+        if message['type'] in KINDS:
+            key = (message['recipientID'], message[KINDS[message['type']]], message['type'])
+            if self._resolve(key, "done", message):
+                with self.lock:
+                    self.stats["published"] += 1
+                    self.stats["replies"] += 1
+                return 1
+        recipients = self.recipients(message)
+        delivered = 0
+        for mailbox in recipients:
+            try:
+                mailbox.queue.put(message, True, self.sendTimeout if timeout is None else timeout)
+                delivered += 1
+            except Queue.Full:
+                pass
+        with self.lock:
+            self.stats["published"] += 1
+            self.stats["delivered"] += delivered
+            self.stats["dropped"] += len(recipients) - delivered
+        return delivered
+
+    def request(self, message, timeout=None, kind='R'):
+        """
+        Publishes a query (or reply) and returns a ReplyFuture for the first
+        message of kind ('R' or 'C') that answers it within timeout seconds.
+        """
+        key = (message['senderID'], message['messageNr'], kind)
+        future = ReplyFuture(self, key, time.time() + timeout if timeout is not None else None)
+        with self.lock:
+            self.pending[key] = future
+        self.publish(message)
+        return future
+
+    def _resolve(self, key, status, message=None):
+        """ Finishes the pending future of key, returns False if there is none or it expired. """
+        with self.lock:
+            future = self.pending.pop(key, None)
+            if future is None:
+                return False
+            if status == "done" and future.deadline is not None and time.time() > future.deadline:
+                status = "expired"
+            if status == "expired":
+                self.stats["expired"] += 1
+            future._finish(status, message if status == "done" else None)
+            return status != "expired"  # a late reply goes to the mailbox
+
+    def sweep(self):
+        """ Expires the requests whose timeout passed, returns how many. """
+        now = time.time()
+        with self.lock:
+            keys = [key for (key, future) in self.pending.iteritems()
+                    if future.deadline is not None and now >= future.deadline]
+        for key in keys:
+            self._resolve(key, "expired")
+        return len(keys)
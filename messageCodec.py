@@ -0,0 +1,64 @@
+# Binary codec for the Query/Reply/Confirmation messages of communication.py.
+# A message is a fixed 33 byte header followed by its content as compact JSON:
+#   type          1 byte   'Q', 'R' or 'C'
+#   senderID      int32
+#   messageNr     uint32
+#   location      3 float32 (x, y, z)
+#   recipientID   int32    -1 for broadcast queries
+#   refID         int32    replyToID or confirmToID, -1 for queries
+#   length        uint32   bytes of content that follow
+# A batch is a uint32 message count followed by the messages.
+# Decoded messages are the same dicts communication.Agent builds.
+
+import json
+import struct
+
+HEADER = struct.Struct('<ciI3fiiI')
+COUNT = struct.Struct('<I')
+REFERENCES = {'Q': None, 'R': 'replyToID', 'C': 'confirmToID'}
+SEPARATORS = (',', ':')
+
+
+def encode(message):
+    """ Returns a message dict as bytes. """
+    kind = message['type']
+    reference = REFERENCES[kind]
+    content = json.dumps(message.get('content'), separators=SEPARATORS)
+    (x, y, z) = message['senderLocation']
+    return HEADER.pack(kind, message['senderID'], message['messageNr'], x, y, z,
+                       message.get('recipientID', -1), message[reference] if reference else -1,
+                       len(content)) + content
+
+
+def decode(buffer, offset=0):
+    """ Returns (message dict, offset of the next message) of the message at offset in buffer. """
+    (kind, senderID, messageNr, x, y, z, recipientID, refID, length) = HEADER.unpack_from(buffer, offset)
+    start = offset + HEADER.size
+    message = {'type': kind,
+               'senderID': senderID,
+               'messageNr': messageNr,
+               'senderLocation': (x, y, z),
+               'content': json.loads(buffer[start:start + length])}
+    reference = REFERENCES[kind]
+    if reference:
+        message['recipientID'] = recipientID
+        message[reference] = refID
+    elif recipientID != -1:
+        message['recipientID'] = recipientID
+    return message, start + length
+
+
+def encodeBatch(messages):
+    """ Returns a list of message dicts as one buffer. """
+    return COUNT.pack(len(messages)) + ''.join([encode(message) for message in messages])
+
+
+def decodeBatch(buffer):
+    """ Returns the list of message dicts in a buffer made by encodeBatch. """
+    (count, ) = COUNT.unpack_from(buffer, 0)
+    offset = COUNT.size
+    messages = []
+    for _ in xrange(count):
+        (message, offset) = decode(buffer, offset)
+        messages.append(message)
+    return messages
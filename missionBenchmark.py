@@ -0,0 +1,95 @@
+# Benchmarks for starting multi-agent missions, runs against stand-in agent
+# hosts instead of Minecraft:
+#   python missionBenchmark.py
+
+import threading
+import time
+
+from missionLauncher import MissionLauncher
+
+
+class StandInServer(object):
+    """
+    Imitates the integrated server of a multi-agent mission: role 0 starts it,
+    it is up serverDelay seconds later, the other roles can't start their
+    mission before that. The mission begins beginDelay seconds after the last
+    role started.
+    """
+
+    def __init__(self, numRoles, serverDelay=1.5, startCost=0.2, beginDelay=0.3):
+        self.numRoles = numRoles
+        self.serverDelay = serverDelay
+        self.startCost = startCost
+        self.beginDelay = beginDelay
+        self.lock = threading.Lock()
+        self.serverUp = None
+        self.started = set()
+        self.begins = None
+
+
+class StandInWorldState(object):
+    def __init__(self, begun):
+        self.has_mission_begun = begun
+        self.is_mission_running = begun
+        self.errors = []
+
+
+class StandInAgentHost(object):
+    """ The startMission / getWorldState part of MalmoPython.AgentHost. """
+
+    def __init__(self, server):
+        self.server = server
+
+    def startMission(self, mission, clientPool, record, role, experimentID):
+        server = self.server
+        time.sleep(server.startCost)  # talking to the client
+        with server.lock:
+            now = time.time()
+            if role == 0:
+                server.serverUp = now + server.serverDelay
+            elif server.serverUp is None or now < server.serverUp:
+                raise RuntimeError("MALMONOSERVERYET")
+            server.started.add(role)
+            if len(server.started) == server.numRoles:
+                server.begins = max(now, server.serverUp) + server.beginDelay
+
+    def getWorldState(self):
+        begins = self.server.begins
+        return StandInWorldState(begins is not None and time.time() >= begins)
+
+
+def sequentialLaunch(hosts, retrySleep=5):
+    """ The old communication.py startup: one host after the other, 5 s sleep on every failure. """
+    starttime = time.time()
+    for (role, host) in enumerate(hosts):
+        for retry in range(3):
+            try:
+                host.startMission(None, None, None, role, "experiment")
+                break
+            except RuntimeError:
+                time.sleep(retrySleep)
+    while not all(host.getWorldState().has_mission_begun for host in hosts):
+        time.sleep(0.1)
+    return time.time() - starttime
+
+
+def benchmarkLaunch(agentCounts=(2, 4, 8, 16)):
+    """ Seconds until every mission has begun, sequential with flat sleeps vs the MissionLauncher. """
+    print "  agents  sequential  launcher  attempts  slowest agent started / begun"
+    for numAgents in agentCounts:
+        server = StandInServer(numAgents)
+        sequential = sequentialLaunch([StandInAgentHost(server) for _ in range(numAgents)])
+
+        server = StandInServer(numAgents)
+        hosts = [StandInAgentHost(server) for _ in range(numAgents)]
+        starttime = time.time()
+        launches = MissionLauncher().launch(hosts, [None] * numAgents, None, [None] * numAgents, "experiment")
+        elapsed = time.time() - starttime
+        assert all(launch.ok() for launch in launches)
+        print "  %6d %10.2fs %8.2fs %9d %14.2fs / %.2fs" % (
+            numAgents, sequential, elapsed, sum(launch.attempts for launch in launches),
+            max(launch.started for launch in launches), max(launch.begun for launch in launches))
+
+
+if __name__ == '__main__':
+    benchmarkLaunch()
@@ -0,0 +1,105 @@
+# Starts a multi-agent mission on all agent hosts at once. Every host retries
+# startMission with exponential backoff and jitter (in a multi-agent mission it
+# fails until the integrated server of role 0 is up), then all hosts are
+# polled together until their mission has begun. Works with any object that
+# has the startMission / getWorldState methods of MalmoPython.AgentHost.
+
+import random
+import time
+from multiprocessing.pool import ThreadPool
+
+
+class AgentLaunch(object):
+    """ Startup of one agent host, times are in seconds since the launch started. """
+
+    def __init__(self, role):
+        self.role = role
+        self.attempts = 0
+        self.started = None  # when startMission succeeded
+        self.begun = None  # when has_mission_begun was seen
+        self.error = None  # last error text, if the host never got going
+
+    def ok(self):
+        return self.begun is not None
+
+    def __repr__(self):
+        return "AgentLaunch(role=%d, attempts=%d, started=%s, begun=%s, error=%r)" % (
+            self.role, self.attempts, self._seconds(self.started), self._seconds(self.begun), self.error)
+
+    def _seconds(self, value):
+        return "%.3f" % value if value is not None else None
+
+
+class MissionLauncher(object):
+    """
+    startMission is retried up to maxRetries times, waiting baseDelay,
+    2 * baseDelay, 4 * baseDelay, ... (at most maxDelay) minus a random
+    jitter fraction of that, so hosts don't all retry at the same moment.
+    Missions that haven't begun after beginTimeout seconds count as failed.
+    """
+
+    def __init__(self, maxRetries=8, baseDelay=0.25, maxDelay=5.0, jitter=0.5, pollInterval=0.05,
+                 beginTimeout=60.0, rng=None):
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.jitter = jitter
+        self.pollInterval = pollInterval
+        self.beginTimeout = beginTimeout
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt):
+        """ Returns the time to wait after the given failed attempt (0 based). """
+        delay = min(self.maxDelay, self.baseDelay * 2 ** attempt)
+        return delay * (1.0 - self.jitter * self.rng.random())
+
+    def launch(self, hosts, missions, clientPool, records, experimentID):
+        """
+        Starts missions[i] with records[i] on hosts[i] as role i and waits for
+        all of them to begin. Returns an AgentLaunch per host.
+        """
+        starttime = time.time()
+        launches = [AgentLaunch(role) for role in range(len(hosts))]
+
+        def start(role):
+            launch = launches[role]
+            for attempt in range(self.maxRetries):
+                launch.attempts += 1
+                try:
+                    hosts[role].startMission(missions[role], clientPool, records[role], role, experimentID)
+                    launch.started = time.time() - starttime
+                    return
+                except RuntimeError as e:
+                    launch.error = str(e)
+                    if attempt < self.maxRetries - 1:
+                        time.sleep(self.delay(attempt))
+
+        pool = ThreadPool(len(hosts))
+        try:
+            pool.map(start, range(len(hosts)))
+        finally:
+            pool.close()
+            pool.join()
+
+        self.waitForBegin(hosts, launches, starttime)
+        return launches
+
+    def waitForBegin(self, hosts, launches, starttime):
+        """ Polls all started hosts together until every mission has begun or beginTimeout passed. """
+        waiting = [launch for launch in launches if launch.started is not None]
+        while waiting and time.time() - starttime < self.beginTimeout:
+            stillWaiting = []
+            for launch in waiting:
+                worldState = hosts[launch.role].getWorldState()
+                if worldState.has_mission_begun:
+                    launch.begun = time.time() - starttime
+                    launch.error = None
+                    continue
+                if len(worldState.errors):
+                    launch.error = worldState.errors[-1].text
+                stillWaiting.append(launch)
+            waiting = stillWaiting
+            if waiting:
+                time.sleep(self.pollInterval)
+        for launch in waiting:
+            launch.error = launch.error or "mission did not begin within %g seconds" % self.beginTimeout
@@ -0,0 +1,370 @@
+# Benchmarks for the waypoint graphs and routing, runs without Minecraft:
+#   python navBenchmark.py
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+
+from navigation import *
+from waypointGraph import WaypointGraph
+from worldStore import saveWorld, loadWorld
+import graphSearch
+
+
+def gridGraphArrays(width, height, spacing=4.0, radius=4.0):
+    """
+    Returns (locations, radii, edges) of a width x height grid of waypoints with
+    4-connectivity, similar to what exploring mode drops on open terrain.
+    """
+    xs, zs = np.meshgrid(np.arange(width), np.arange(height), indexing="ij")
+    locations = np.zeros((width * height, 3))
+    locations[:, 0] = xs.ravel() * spacing
+    locations[:, 1] = 7.0
+    locations[:, 2] = zs.ravel() * spacing
+    radii = np.full(width * height, radius)
+
+    ids = np.arange(width * height).reshape(width, height)
+    horizontal = np.stack([ids[:-1, :].ravel(), ids[1:, :].ravel()], axis=1)
+    vertical = np.stack([ids[:, :-1].ravel(), ids[:, 1:].ravel()], axis=1)
+    return locations, radii, np.concatenate([horizontal, vertical])
+
+
+def cellGraphArrays(cells, spacing=4.0, radius=4.0):
+    """ Returns (locations, radii, edges) of waypoints on a set of (x, z) cells with 4-connectivity. """
+    cells = sorted(cells)
+    index = dict((cell, i) for (i, cell) in enumerate(cells))
+    locations = np.array([(x * spacing, 7.0, z * spacing) for (x, z) in cells])
+    edges = [(index[(x, z)], index[neighbor]) for (x, z) in cells
+             for neighbor in ((x + 1, z), (x, z + 1)) if neighbor in index]
+    return locations, np.full(len(cells), radius), np.array(edges)
+
+
+def corridorGraphArrays(length, turns, width=2, radius=4.0):
+    """
+    Returns (locations, radii, edges) of a winding corridor, like the trail
+    exploring mode leaves behind when it walks back and forth through a field.
+    """
+    cells = set()
+    for turn in range(turns):
+        z = turn * (width + 1)
+        cells |= set((x, z + w) for x in range(length) for w in range(width))
+        if turn < turns - 1:
+            x = length - 1 if turn % 2 == 0 else 0
+            cells.add((x, z + width))
+    return cellGraphArrays(cells, radius=radius)
+
+
+def trailGraphArrays(width, height, loops=0.1, seed=1):
+    """
+    Returns (locations, radii, edges) of a random tree of trails with some loops
+    on a grid, like a long exploration with many dead ends.
+    """
+    random = np.random.RandomState(seed)
+    locations, radii, edges = gridGraphArrays(width, height)
+    parent = range(len(locations))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    kept = []
+    for (a, b) in edges[random.permutation(len(edges))]:
+        rootA, rootB = root(a), root(b)
+        if rootA != rootB:
+            parent[rootA] = rootB
+            kept.append((a, b))
+        elif random.rand() < loops:
+            kept.append((a, b))
+    return locations, radii, np.array(kept)
+
+
+def objectGraph(locations, radii, edges):
+    """ Builds the same graph out of WaypointNode objects. """
+    nodes = [WaypointNode(tuple(location), radius) for (location, radius) in zip(locations.tolist(), radii)]
+    for (a, b) in edges.tolist():
+        nodes[a].assignNeighbor(nodes[b])
+    return nodes
+
+
+def objectGraphMemory(nodes):
+    """ Approximates the number of bytes used by a graph of WaypointNode objects. """
+    total = 0
+    for node in nodes:
+        total += sys.getsizeof(node) + sys.getsizeof(node.__dict__)
+        total += sys.getsizeof(node.nodes) + sys.getsizeof(node.data)
+        total += sys.getsizeof(node.location) + sum(sys.getsizeof(c) for c in node.location)
+    return total
+
+
+def benchmarkCompactGraph(width=60, height=60):
+    locations, radii, edges = gridGraphArrays(width, height)
+    n = len(locations)
+    print "grid of %d waypoints, %d edges" % (n, len(edges))
+
+    nodes = objectGraph(locations, radii, edges)
+    graph = WaypointGraph.fromArrays(locations, radii, edges)
+    print "memory   WaypointNode: %8.1f bytes/waypoint" % (objectGraphMemory(nodes) / float(n))
+    print "memory  WaypointGraph: %8.1f bytes/waypoint" % (graph.memoryUsage() / float(n))
+
+    starttime = time.time()
+    objectRoute = Astar(nodes[0], nodes[-1], euclidianDistance)
+    objectTime = time.time() - starttime
+
+    stats = {}
+    starttime = time.time()
+    graphRoute = graphSearch.astar(graph, 0, n - 1, stats=stats)
+    graphTime = time.time() - starttime
+
+    print "route    WaypointNode: %3d waypoints in %0.3f seconds" % (len(objectRoute), objectTime)
+    print "route   WaypointGraph: %3d waypoints in %0.3f seconds (%d expansions)" % (
+        len(graphRoute), graphTime, stats["expansions"])
+
+
+def benchmarkPersistence(width=1000, height=1000):
+    locations, radii, edges = gridGraphArrays(width, height)
+    graph = WaypointGraph.fromArrays(locations, radii, edges)
+    for wid in range(0, len(locations), 1000):
+        graph.getData(wid)["tree"] = True
+    blocks = dict(((x, 7, z), "log") for x in range(100) for z in range(100))
+    print "persisting %d waypoints, %d edges, %d blocks" % (len(graph), len(edges), len(blocks))
+
+    path = os.path.join(tempfile.mkdtemp(), "world.wpg")
+    starttime = time.time()
+    saveWorld(path, graph, blocks)
+    print "save:          %8.3f seconds, %0.1f MB" % (time.time() - starttime, os.path.getsize(path) / 1e6)
+
+    starttime = time.time()
+    loaded, loadedBlocks = loadWorld(path)
+    print "load (mmap):   %8.3f seconds" % (time.time() - starttime)
+
+    starttime = time.time()
+    loadWorld(path, mmap=False)
+    print "load (read):   %8.3f seconds" % (time.time() - starttime)
+
+    starttime = time.time()
+    route = graphSearch.astar(loaded, 0, width + 5)
+    treeCount = len(loaded.findKey("tree"))
+    blockType = loadedBlocks.get((42, 7, 42))
+    print "first queries: %8.3f seconds" % (time.time() - starttime)
+
+    assert len(loaded) == len(graph) and loaded.numEdges() == len(edges)
+    assert route == graphSearch.astar(graph, 0, width + 5)
+    assert treeCount == len(graph.findKey("tree")) and blockType == "log"
+    assert loadedBlocks.toDict() == blocks
+
+    del loaded, loadedBlocks
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+
+def compareEngines(name, graph, pairs):
+    """ Prints the average node expansions and time of every route engine. """
+    for engine in sorted(graphSearch.ENGINES):
+        search = graphSearch.ENGINES[engine]
+        expansions = 0
+        length = 0.0
+        starttime = time.time()
+        for (start, goal) in pairs:
+            stats = {}
+            route = search(graph, start, goal, stats=stats)
+            expansions += stats["expansions"]
+            length += graphSearch.routeLength(graph, route)
+        print "%-14s %-14s %9.1f expansions %8.4f seconds %9.1f length" % (
+            name, engine, expansions / float(len(pairs)), (time.time() - starttime) / len(pairs),
+            length / len(pairs))
+
+
+def benchmarkEngines(numPairs=20):
+    random = np.random.RandomState(42)
+    graphs = [
+        ("open grid", WaypointGraph.fromArrays(*gridGraphArrays(60, 60))),
+        ("corridor", WaypointGraph.fromArrays(*corridorGraphArrays(80, 25))),
+        ("trails", WaypointGraph.fromArrays(*trailGraphArrays(60, 60))),
+    ]
+    for (name, graph) in graphs:
+        n = len(graph)
+        pairs = [(0, n - 1)] + [tuple(random.randint(0, n, 2)) for i in range(numPairs - 1)]
+        compareEngines(name, graph, pairs)
+
+
+def benchmarkLandmarks(numPairs=20, count=8):
+    """ Compares A* expansions with and without the landmark heuristic. """
+    random = np.random.RandomState(11)
+    graphs = [
+        ("open grid", WaypointGraph.fromArrays(*gridGraphArrays(60, 60))),
+        ("corridor", WaypointGraph.fromArrays(*corridorGraphArrays(80, 25))),
+        ("trails", WaypointGraph.fromArrays(*trailGraphArrays(60, 60))),
+    ]
+    for (name, graph) in graphs:
+        starttime = time.time()
+        landmarks = graphSearch.Landmarks(graph, count)
+        buildTime = time.time() - starttime
+
+        n = len(graph)
+        pairs = [(0, n - 1)] + [tuple(random.randint(0, n, 2)) for i in range(numPairs - 1)]
+        plain = alt = 0
+        for (start, goal) in pairs:
+            stats = {}
+            route = graphSearch.astar(graph, start, goal, stats=stats)
+            plain += stats["expansions"]
+            altRoute = graphSearch.astar(graph, start, goal, landmarks.heuristic(goal), stats=stats)
+            alt += stats["expansions"]
+            assert abs(graphSearch.routeLength(graph, route) - graphSearch.routeLength(graph, altRoute)) < 1e-6
+
+        print "%-10s A* %7.1f, A* + %d landmarks %7.1f expansions (%0.2f s, %d KB to build)" % (
+            name, plain / float(len(pairs)), len(landmarks.landmarks), alt / float(len(pairs)),
+            buildTime, landmarks.memoryUsage() // 1024)
+        landmarks.close()
+
+
+class SimulatedAgent(object):
+    """ Stands in for the agent host: counts commands and applies yaw and moves. """
+
+    WALK_SPEED = 4.317  # blocks per second
+
+    def __init__(self):
+        self.commands = 0
+        self.speed = 0.0
+        self.yaw = 0.0
+
+    def sendCommand(self, command):
+        self.commands += 1
+        (name, value) = command.split(" ")
+        if name == "setYaw":
+            self.yaw = float(value)
+        elif name == "move":
+            self.speed = float(value) * self.WALK_SPEED
+
+
+def simulateRoute(graph, route, smoothing, tickTime=0.05, maxTicks=100000):
+    """ Lets a Navigator walk the route, returns (ticks, walked distance, commands). """
+    agent = SimulatedAgent()
+    controller = Controller(agent)
+    controller.location = np.array(route[0].location, dtype=float)
+    navigator = Navigator(controller, graph)
+    navigator.smoothing = smoothing
+    navigator.setRoute(route)
+
+    walked = 0.0
+    ticks = 0
+    while not navigator.targetReached and ticks < maxTicks:
+        ticks += 1
+        controller.yaw = agent.yaw
+        navigator.update()
+        step = agent.speed * tickTime
+        direction = np.array([-sin(radians(agent.yaw)), 0.0, cos(radians(agent.yaw))])
+        controller.location = controller.location + direction * step
+        walked += step
+    return ticks, walked, agent.commands
+
+
+def benchmarkSmoothing():
+    """ Compares walking routes with and without route smoothing. """
+    graphs = [
+        ("open grid", WaypointGraph.fromArrays(*gridGraphArrays(30, 30))),
+        ("corridor", WaypointGraph.fromArrays(*corridorGraphArrays(40, 8, radius=3.0))),
+    ]
+    stdout = sys.stdout
+    for (name, graph) in graphs:
+        route = map(graph.waypoint, graphSearch.astar(graph, 0, len(graph) - 1))
+        results = []
+        for smoothing in (False, True):
+            sys.stdout = open(os.devnull, "w")  # the Navigator prints every target
+            try:
+                results.append(simulateRoute(graph, route, smoothing))
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+        steering = len(smoothRoute(route, graph))
+        print "%-10s %d -> %d steering targets" % (name, len(route), steering)
+        for (label, (ticks, walked, commands)) in zip(("raw", "smoothed"), results):
+            print "  %-9s %6d ticks (%6.1f s) %8.1f blocks walked %6d commands" % (
+                label, ticks, ticks * 0.05, walked, commands)
+
+
+def benchmarkReplanning(steps=100, width=60, height=60):
+    """
+    Walks routes across a trail graph while waypoints near the route are
+    detached, and compares repairing the plan with D* Lite to planning again
+    with A* every time.
+    """
+    random = np.random.RandomState(7)
+    graph = WaypointGraph.fromArrays(*trailGraphArrays(width, height, loops=0.3))
+    goal = len(graph) - 1
+    planner = graphSearch.DStarLite(graph, goal)
+    start = 0
+    astarExpansions = 0
+    replans = 0
+
+    for step in range(steps):
+        route = planner.plan(start)
+        stats = {}
+        graphSearch.astar(graph, start, goal, stats=stats)
+        astarExpansions += stats["expansions"]
+        replans += 1
+        if route is None or len(route) < 3:
+            break
+
+        start = route[1]
+        # something blocks a waypoint a bit further along the route
+        victim = route[random.randint(2, len(route))]
+        if victim != goal:
+            graph.detach(victim)
+
+    planner.close()
+    print "replanning %d times: D* Lite %0.1f, A* %0.1f expansions per plan" % (
+        replans, planner.expansions / float(replans), astarExpansions / float(replans))
+
+
+def benchmarkCompaction(numPairs=50, width=60, height=60, tolerance=0.1):
+    """
+    Compacts a trail graph and compares its size, route length and search
+    effort before and after.
+    """
+    random = np.random.RandomState(3)
+    graph = WaypointGraph.fromArrays(*trailGraphArrays(width, height, loops=0.2))
+    pairs = [tuple(random.randint(0, len(graph), 2)) for _ in range(numPairs)]
+
+    def measure():
+        lengths, expansions = [], 0
+        for (start, goal) in pairs:
+            stats = {}
+            route = graphSearch.astar(graph, start, goal, stats=stats)
+            expansions += stats["expansions"]
+            lengths.append(sum(graph.edgeWeight(a, b) for (a, b) in zip(route, route[1:])))
+        return np.array(lengths), expansions
+
+    size, numEdges = len(graph), graph.numEdges()
+    lengths, expansions = measure()
+    starttime = time.time()
+    remap = graph.compact(tolerance)
+    compactTime = time.time() - starttime
+    pairs = [(int(remap[start]), int(remap[goal])) for (start, goal) in pairs]
+    newLengths, newExpansions = measure()
+
+    stretch = newLengths / np.maximum(lengths, 1e-9)
+    print "compaction in %0.3f seconds (tolerance %0.2f)" % (compactTime, tolerance)
+    print "  waypoints %6d -> %6d" % (size, len(graph))
+    print "  edges     %6d -> %6d" % (numEdges, graph.numEdges())
+    print "  expansions per route %0.1f -> %0.1f" % (expansions / float(numPairs), newExpansions / float(numPairs))
+    print "  route length stretch: mean %0.3f, max %0.3f" % (stretch.mean(), stretch.max())
+
+
+if __name__ == '__main__':
+    benchmarkCompactGraph()
+    print
+    benchmarkPersistence()
+    print
+    benchmarkEngines()
+    print
+    benchmarkLandmarks()
+    print
+    benchmarkSmoothing()
+    print
+    benchmarkReplanning()
+    print
+    benchmarkCompaction()
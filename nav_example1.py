@@ -24,6 +24,7 @@ import os
 import sys
 import time
 from controller import *
+from agentRuntime import AgentRuntime
 
 sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)  # flush print output immediately
 
@@ -103,22 +104,20 @@ controller = Controller(agent_host)
 i = 0
 locs = [(20,210,20), (-20, 230, -20)]
 locSelect = locs[i]
-# Loop until mission ends:
-while world_state.is_mission_running:
+# Loop until mission ends, one tick per observation at most 20 times a second:
+runtime = AgentRuntime(agent_host, tickRate=20)
+for (world_state, observation) in runtime.ticks():
     sys.stdout.write(".")
-    time.sleep(0.05)
     #controller.update reads out perception and makes it more intuitive to access.
-    controller.update()
-    if controller.observations is not None:
-        #lookAtH and lookAtH2 allow you to turn the camera towards a certain coordinate
-        #lookAtH requires x,z input, lookAtH2 takes a 3D location tuple/vector (x,y,z)
-        controller.lookAtH2(locSelect)
-        #you can still directly send commands to an agent.
-        agent_host.sendCommand("move 1")
-        if distanceH(controller.Location, locSelect) < 5:
-            i = 1 - i
-            locSelect = locs[i]
-            agent_host.sendCommand("move 0")
+    controller.update(observation)
+    #lookAtHorizontally turns the camera towards a 3D location tuple/vector (x,y,z)
+    controller.lookAtHorizontally(locSelect)
+    #you can still directly send commands to an agent.
+    agent_host.sendCommand("move 1")
+    if distanceH(controller.location, locSelect) < 5:
+        i = 1 - i
+        locSelect = locs[i]
+        agent_host.sendCommand("move 0")
 
 
 print
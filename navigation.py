@@ -1,11 +1,13 @@
-import MalmoPython
 import os
 import sys
 import time
 import json
+import numpy as np
 from controller import *
 from math import *
 from util import *
+from waypointGraph import WaypointGraph, GraphWaypoint
+import graphSearch
 
 next_wid = 0
 
@@ -27,7 +29,7 @@ class WaypointNode(object):
     def contains(self, point):
         x, y, z = self.location
         xp, yp, zp = point
-        dx, dy, dz = x - xp, y - xp, z - zp
+        dx, dy, dz = x - xp, y - yp, z - zp
         return dx ** 2 + dy ** 2 + dz ** 2 <= self.radius ** 2
 
     def getAllNodes(self):
@@ -145,15 +147,31 @@ def Astar(wpStart, wpEnd, heuristic):
     return None
 
 
-def findRoute(startWp, endWp):
+def findRoute(startWp, endWp, engine="astar", landmarks=None):
     """Find the route from the start waypoint to the end waypoint"""
+    """engine: name of a graphSearch.ENGINES entry, only "astar" for WaypointNode graphs"""
+    """landmarks: optional graphSearch.Landmarks of the graph, used as A* heuristic"""
+    if isinstance(startWp, GraphWaypoint) and isinstance(endWp, GraphWaypoint):
+        # waypoints of a WaypointGraph are routed over its arrays
+        graph = startWp.graph
+        if landmarks is not None:
+            if engine != "astar":
+                raise ValueError("landmarks can only be used with the astar engine")
+            route = graphSearch.astar(graph, startWp.WID, endWp.WID, landmarks.heuristic(endWp.WID))
+        else:
+            route = graphSearch.ENGINES[engine](graph, startWp.WID, endWp.WID)
+        if route is None:
+            return None
+        return map(graph.waypoint, route)
+    if engine != "astar":
+        raise ValueError("route engine {} needs waypoints of a WaypointGraph".format(engine))
     return Astar(startWp, endWp, euclidianDistance)
 
 
 def findRoutesByKey(startWp, key):
     """Find the shortest routes from the start waypoint to all waypoints that contain a given key"""
     nodes = startWp.findNodes(key)
-    return map(lambda node: Astar(startWp, node, euclidianDistance), nodes)
+    return map(lambda node: findRoute(startWp, node), nodes)
 
 
 def findRouteByKey(startWp, key):
@@ -163,37 +181,203 @@ def findRouteByKey(startWp, key):
     return route
 
 
+def segmentWalkable(start, end, centers, radii, step=0.5, maxClimb=1.0):
+    """check that every point on the segment is horizontally inside a waypoint of about the same height"""
+    """start, end: (x, y, z), centers: numpy [M, 3], radii: numpy [M]"""
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    count = max(2, int(ceil(getVectorDistance(start, end) / step)) + 1)
+    points = start + (end - start) * np.linspace(0.0, 1.0, count)[:, None]
+    dx = points[:, None, 0] - centers[None, :, 0]
+    dy = points[:, None, 1] - centers[None, :, 1]
+    dz = points[:, None, 2] - centers[None, :, 2]
+    inside = (dx ** 2 + dz ** 2 <= radii[None, :] ** 2) & (np.abs(dy) <= maxClimb)
+    return bool(inside.any(axis=1).all())
+
+
+def walkableAround(start, end, route, graph=None):
+    """the known walkable waypoints (centers, radii) that can cover the segment start - end"""
+    """uses all waypoints of the graph if given, otherwise only those of the route"""
+    if graph is None:
+        centers = np.array([node.location for node in route], dtype=float)
+        radii = np.array([node.radius for node in route], dtype=float)
+    else:
+        ids = graph.ids()
+        centers = graph.locations[ids]
+        radii = graph.radii[ids].astype(float)
+    low = np.minimum(start, end)
+    high = np.maximum(start, end)
+    near = np.all((centers[:, [0, 2]] >= low[[0, 2]] - radii[:, None]) &
+                  (centers[:, [0, 2]] <= high[[0, 2]] + radii[:, None]), axis=1)
+    return centers[near], radii[near]
+
+
+def smoothRoute(route, graph=None):
+    """string pulling: drop every waypoint that can be skipped by walking a straight line over known ground"""
+    """returns the remaining steering targets, always keeps the first and the last waypoint"""
+    if len(route) <= 2:
+        return list(route)
+
+    smoothed = [route[0]]
+    i = 0
+    while i < len(route) - 1:
+        j = i + 1
+        start = np.array(route[i].location, dtype=float)
+        while j + 1 < len(route):
+            end = np.array(route[j + 1].location, dtype=float)
+            centers, radii = walkableAround(start, end, route, graph)
+            if not segmentWalkable(start, end, centers, radii):
+                break
+            j += 1
+        smoothed.append(route[j])
+        i = j
+    return smoothed
+
+
 class Navigator(object):
-    def __init__(self, controller):
+    # number of destinations for which the incremental planner state is kept
+    MAX_PLANNERS = 4
+    # don't send a new yaw while steering if it is within this many degrees
+    YAW_TOLERANCE = 3.0
+
+    def __init__(self, controller, graph=None):
         self.controller = controller
+        self.graph = graph  #: WaypointGraph, None to use WaypointNode objects
         self.enabled = True
         self.lastWaypoint = None  #: WaypointNode
         self.target = None  #: WaypointNode
         self.route = []  #: [WaypointNode]
         self.targetReached = False
         self.exploring = False
+        self.destination = None  #: GraphWaypoint, end of the current route
+        self.planners = []  #: [graphSearch.DStarLite], most recently used last
+        self.checkedVersion = None  #: graph version the current route was checked against
+        self.smoothing = True  #: steer straight past waypoints that aren't needed
+        self.plannedRoute = []  #: [WaypointNode], full route from the target on
+        self.moving = False
+        self.nodeBudget = None  #: compact the graph when it has more waypoints than this
+        self.compactionTolerance = 0.1  #: how much longer routes may get by compaction
+        self.compactedSize = 0  #: number of waypoints after the last compaction
+        self.anchors = {}  #: name -> waypoint, kept (and updated) by graph compaction
 
     def setRoute(self, route):
-        self.route = route
+        self.plannedRoute = list(route)
+        if self.smoothing:
+            self.route = smoothRoute(self.plannedRoute, self.graph)
+        else:
+            self.route = list(self.plannedRoute)
+        self.moving = False
         if len(self.route) == 0:
             self.target = None
             self.targetReached = True
+            self.destination = None
         else:
+            if self.graph is not None:
+                # start collecting graph changes, so replanning can be incremental
+                self.destination = self.route[-1]
+                self.getPlanner(self.destination)
             self.target = self.route.pop(0)
             self.targetReached = False
+        self.checkedVersion = None if self.graph is None else self.graph.version
+
+    def getPlanner(self, destination):
+        """the incremental planner towards a destination, keeps state for a few destinations"""
+        for planner in self.planners:
+            if planner.goal == destination.WID:
+                self.planners.remove(planner)
+                self.planners.append(planner)
+                return planner
+        planner = graphSearch.DStarLite(self.graph, destination.WID)
+        self.planners.append(planner)
+        if len(self.planners) > self.MAX_PLANNERS:
+            self.planners.pop(0).close()
+        return planner
+
+    def routeValid(self):
+        """check that all waypoints of the current route still exist and are connected"""
+        nodes = self.plannedRoute
+        for node in nodes:
+            if not self.graph.isAlive(node.WID):
+                return False
+        for (a, b) in zip(nodes, nodes[1:]):
+            if not self.graph.hasEdge(a.WID, b.WID):
+                return False
+        return True
+
+    def replan(self):
+        """repair the route to the destination after the graph changed"""
+        planner = self.getPlanner(self.destination)
+        if self.graph.isAlive(self.target.WID):
+            start = self.target.WID
+        else:
+            start = self.graph.nearest(self.controller.getLocation())
+        route = None if start is None else planner.plan(start)
+        if route is None:
+            print "destination can't be reached anymore"
+            self.setRoute([])
+            self.controller.agent.sendCommand("move 0")
+        else:
+            self.setRoute(map(self.graph.waypoint, route))
+
+    def checkRoute(self):
+        """replan when the graph changed in a way that affects the route to the destination"""
+        if self.destination is None or self.checkedVersion == self.graph.version:
+            return
+        self.checkedVersion = self.graph.version
+        planner = self.getPlanner(self.destination)
+        # a planner that already has search state can cheaply check for shortcuts
+        if not self.routeValid() or (planner.changed and planner.start is not None):
+            self.replan()
+
+    def compactGraph(self):
+        """merge and remove waypoints that aren't needed, keeps the waypoints the navigator uses"""
+        def keep(node):
+            return [] if node is None else [node.WID]
+
+        protected = keep(self.lastWaypoint) + keep(self.target) + keep(self.destination)
+        protected += [node.WID for node in self.plannedRoute + self.route + self.anchors.values()
+                      if node is not None]
+        remap = self.graph.compact(self.compactionTolerance, protected=protected)
+        self.compactedSize = len(self.graph)
+
+        def translate(node):
+            if node is None or remap[node.WID] < 0:
+                return None
+            return self.graph.waypoint(int(remap[node.WID]))
+
+        # the waypoints were renumbered, so the planner states are useless now
+        for planner in self.planners:
+            planner.close()
+        self.planners = []
+        self.lastWaypoint = translate(self.lastWaypoint)
+        self.target = translate(self.target)
+        self.destination = translate(self.destination)
+        self.plannedRoute = map(translate, self.plannedRoute)
+        self.route = map(translate, self.route)
+        self.anchors = dict((name, translate(node)) for (name, node) in self.anchors.items())
+        self.checkedVersion = None
+        print "Compacted waypoint graph to ", self.compactedSize, " waypoints"
+        return remap
 
     def placeWaypoint(self, radius=4):
-        wp = WaypointNode(self.controller.getLocation(), radius)
+        if self.graph is not None:
+            wp = self.graph.waypoint(self.graph.addWaypoint(self.controller.getLocation(), radius))
+        else:
+            wp = WaypointNode(self.controller.getLocation(), radius)
         wp.assignNeighbor(self.lastWaypoint)
         self.lastWaypoint = wp
         print "Placed new waypoint at ", wp.location, " with radius ", wp.radius
 
+        # keep some slack, so we don't compact every tick when the budget can't be met
+        if self.graph is not None and self.nodeBudget is not None and \
+                len(self.graph) > max(self.nodeBudget, 1.1 * self.compactedSize):
+            self.compactGraph()
+
     def setBestNode(self, allNodes):
         bestNode = None
         distance = float("inf")
-        wpHere = WaypointNode(self.Location, 0)
+        here = self.controller.getLocation()
         for node in allNodes:
-            dist = euclidianDistance(wpHere, node)
+            dist = sqrt(sum((a - b) ** 2 for (a, b) in zip(here, node.location)))
             if dist > node.radius:
                 continue
             elif dist < distance:
@@ -201,6 +385,19 @@ class Navigator(object):
                 distance = dist
         self.lastWaypoint = bestNode
 
+    def nodesContaining(self, location):
+        """all waypoints in the graph of the last waypoint that contain the location"""
+        if self.graph is not None:
+            return map(self.graph.waypoint, self.graph.containing(location))
+        return filter(lambda node: node.contains(location), self.lastWaypoint.getAllNodes())
+
+    def nodesInRangeH(self, location):
+        """all waypoints in the graph of the last waypoint horizontally in range of the location"""
+        if self.graph is not None:
+            return map(self.graph.waypoint, self.graph.containingH(location))
+        return filter(lambda node: distanceH(node.location, location) <= node.radius,
+                      self.lastWaypoint.getAllNodes())
+
     def update(self):
         if not self.enabled:
             return
@@ -210,35 +407,41 @@ class Navigator(object):
                 return
             # in exploring mode, drop waypoints where you go
             if distanceH(self.lastWaypoint.location, self.controller.getLocation()) >= self.lastWaypoint.radius:
-                allNodes = self.lastWaypoint.getAllNodes()
+                containing = self.nodesContaining(self.controller.getLocation())
                 newNode = True
-                for node in allNodes:
+                for node in containing:
                     if node == self.lastWaypoint:
                         continue
-                    if node.contains(self.controller.getLocation()):
-                        self.lastWaypoint.assignNeighbor(node)
-                        newNode = False
-                        break  # warning: can't handle overlapping nodes
+                    self.lastWaypoint.assignNeighbor(node)
+                    newNode = False
+                    break  # warning: can't handle overlapping nodes
                 if newNode:
                     self.placeWaypoint()
                 else:
-                    self.setBestNode(allNodes)
-            allNodes = self.lastWaypoint.getAllNodes()
-            for node in allNodes:
-                if distanceH(node.location, self.controller.getLocation()) <= node.radius:
-                    self.lastWaypoint.assignNeighbor(node)
+                    self.setBestNode(containing)
+            for node in self.nodesInRangeH(self.controller.getLocation()):
+                self.lastWaypoint.assignNeighbor(node)
 
         elif self.target is not None:
-            if distanceH(self.controller.getLocation(), self.target.location) < self.target.radius / 4:
+            if self.graph is not None:
+                self.checkRoute()
+                if self.target is None:
+                    return
+            # steering targets on the way only have to be passed, the last one reached
+            reach = self.target.radius / 2 if len(self.route) > 0 else self.target.radius / 4
+            if distanceH(self.controller.getLocation(), self.target.location) < reach:
                 if len(self.route) > 0:
                     print "next target"
                     self.target = self.route.pop(0)
+                    self.plannedRoute = self.plannedRoute[self.plannedRoute.index(self.target):]
                 else:
                     self.target = None
                     self.targetReached = True
+                    self.moving = False
                     self.controller.agent.sendCommand("move 0")
 
             if self.target is not None:
-                (tx, ty, tz) = self.target.location
-                self.controller.lookAtHorizontally2(self.target.location)
-                self.controller.agent.sendCommand("move 1")
+                self.controller.lookAtHorizontally(self.target.location, self.YAW_TOLERANCE)
+                if not self.moving:
+                    self.controller.agent.sendCommand("move 1")
+                    self.moving = True
@@ -0,0 +1,128 @@
+# Cache of GOAP plans, shared by agents that plan toward the same goals and by
+# replans of a single agent. Besides whole plans it remembers the cost and
+# actions from every state on a found plan to the goals, so a search from a
+# state near an old plan can stop as soon as it reaches that plan.
+
+from collections import OrderedDict
+import numpy as np
+
+import goap
+from goap import resourceKeys, canonicalState, RelaxedHeuristic
+
+
+def actionSetVersion(actions):
+    """ Returns a hashable fingerprint of everything about actions that affects plans. """
+    return tuple((action.name, tuple(sorted(action.condition.items())), tuple(sorted(action.expectation.items())),
+                  action.cost) for action in actions)
+
+
+def goalSetKey(goals):
+    return tuple(sorted(tuple(sorted(goal.state.items())) for goal in goals))
+
+
+class PlanCache:
+    """
+    Least recently used cache of plans keyed by (start state, goal set, action
+    set version), and of cost-to-goal tables keyed by (goal set, action set
+    version). Holds at most maxPlans plans and maxTables tables of at most
+    maxStates states each (a full table forgets its oldest states).
+    """
+
+    def __init__(self, maxPlans=256, maxTables=16, maxStates=10000):
+        self.maxPlans = maxPlans
+        self.maxTables = maxTables
+        self.maxStates = maxStates
+        self.plans = OrderedDict()  # (start, goals, version) -> actions tuple or None
+        self.tables = OrderedDict()  # (goals, version) -> OrderedDict state -> (cost, actions)
+        self.stats = dict(hits=0, knownHits=0, coveredHits=0, misses=0, evictions=0, expansions=0)
+
+    def _touch(self, cache, key):
+        value = cache.pop(key)
+        cache[key] = value
+        return value
+
+    def _store(self, cache, key, value, limit):
+        cache[key] = value
+        while len(cache) > limit:
+            cache.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def plan(self, goals, actions, startstate, version=None, heuristic=RelaxedHeuristic, exact=True):
+        """
+        Returns the list of actions of the cheapest plan from startstate to one
+        of the goals, or None. version identifies the action set, by default it
+        is computed from the actions (pass a version, or call clear(), when the
+        actions change in a way their fingerprint doesn't show).
+        With exact=False a known plan is also returned for a start state that
+        has at least the resources of a state on it. That plan still works
+        (conditions only ask for minimum amounts) but might not be the cheapest.
+        """
+        if version is None:
+            version = actionSetVersion(actions)
+        keys = resourceKeys(goals, actions, {})
+        start = canonicalState(startstate, keys)
+        tableKey = (goalSetKey(goals), version)
+        planKey = (start, ) + tableKey
+
+        if planKey in self.plans:
+            self.stats["hits"] += 1
+            plan = self._touch(self.plans, planKey)
+            return list(plan) if plan is not None else None
+
+        table = self._touch(self.tables, tableKey) if tableKey in self.tables else OrderedDict()
+        if start in table:
+            self.stats["hits"] += 1
+            plan = list(table[start][1])
+            self._store(self.plans, planKey, tuple(plan), self.maxPlans)
+            return plan
+
+        if not exact and table:
+            covered = self._covered(table, start)
+            if covered is not None:
+                self.stats["coveredHits"] += 1
+                return list(covered)
+
+        searchStats = {}
+        # through the module, so profiler.enable() sees the calls
+        leaf = goap.pathfind(goals, actions, startstate, stats=searchStats, heuristic=heuristic, known=table)
+        self.stats["expansions"] += searchStats["expansions"]
+        self.stats["knownHits" if searchStats["known"] else "misses"] += 1
+
+        plan = None
+        if leaf is not None:
+            steps = []
+            node = leaf.node
+            while node.action is not None:
+                steps.append((canonicalState(node.prev.state, keys), node.action))
+                node = node.prev
+            plan = [action for (_, action) in reversed(steps)]
+            # every state on the plan now has a known cheapest way to the goals
+            remaining = 0
+            for (i, (state, action)) in enumerate(steps):
+                remaining += action.cost
+                table[state] = (remaining, tuple(plan[len(plan) - i - 1:]))
+            while len(table) > self.maxStates:
+                table.popitem(last=False)
+            self._store(self.tables, tableKey, table, self.maxTables)
+
+        self._store(self.plans, planKey, tuple(plan) if plan is not None else None, self.maxPlans)
+        return plan
+
+    def _covered(self, table, start):
+        """ Returns the cheapest known plan of a state that start has at least the resources of. """
+        states = np.array(list(table), dtype=np.int32)
+        covered = np.flatnonzero((states <= np.array(start, dtype=np.int32)).all(axis=1))
+        if len(covered) == 0:
+            return None
+        plans = table.values()
+        return min((plans[i] for i in covered.tolist()), key=lambda known: known[0])[1]
+
+    def clear(self):
+        self.plans.clear()
+        self.tables.clear()
+
+    def hitRate(self):
+        """ Returns the fraction of plan calls answered without a full search. """
+        answered = self.stats["hits"] + self.stats["knownHits"] + self.stats["coveredHits"]
+        lookups = answered + self.stats["misses"]
+        return answered / float(lookups) if lookups else 0.0
@@ -0,0 +1,200 @@
+# Planning service: runs the GOAP plans of many agents in a pool of worker
+# processes, so one agent's planning doesn't stall the observation loop of
+# all of them. submit() returns a PlanFuture right away. A newer request of the
+# same agent supersedes (cancels) its older one, and a request can have a
+# deadline after which the best plan found so far is returned.
+
+import multiprocessing
+import threading
+import time
+import traceback
+
+from goap import AnytimePlanner
+
+# set in every worker process by _initWorker
+_actions = None
+_indices = None
+_latest = None
+
+
+def _initWorker(actions, latest):
+    global _actions, _indices, _latest
+    _actions = actions
+    _indices = dict((id(action), i) for (i, action) in enumerate(actions))
+    _latest = latest
+
+
+def _planWorker(slot, number, goals, state, deadline, weight, stepExpansions):
+    """
+    Runs in a worker process, returns (status, action indices, complete,
+    expansions). The search runs in steps of stepExpansions and stops early
+    when a newer request of the same agent came in or the deadline passed.
+    """
+    try:
+        if _latest[slot] != number:
+            return "cancelled", None, False, 0
+        if deadline is not None and time.time() >= deadline:
+            return "expired", None, False, 0
+        planner = AnytimePlanner(goals, _actions, state, weight=weight)
+        while not planner.finished:
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            planner.step(maxExpansions=stepExpansions, maxSeconds=remaining)
+            if _latest[slot] != number:
+                return "cancelled", None, False, planner.stats.expansions
+            if deadline is not None and time.time() >= deadline:
+                break
+        (actions, complete) = planner.plan()
+        status = "done" if planner.finished else "expired"
+        return status, [_indices[id(action)] for action in actions], complete, planner.stats.expansions
+    except Exception:
+        return "failed", traceback.format_exc(), False, 0
+
+
+class PlanFuture:
+    """
+    Result of a plan request. status is "pending" until the request is
+    "done" (searched to the end), "expired" (deadline passed, actions is the
+    best plan found so far), "cancelled" (superseded or cancel() called) or
+    "failed" (error is the worker's traceback).
+    """
+
+    def __init__(self, service, agentID, number, deadline):
+        self.service = service
+        self.agentID = agentID
+        self.number = number
+        self.deadline = deadline  # time.time() after which the request expires, or None
+        self.status = "pending"
+        self.actions = None  # Action list
+        self.complete = False  # whether actions reach a goal
+        self.expansions = 0
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self._event = threading.Event()
+        self._callbacks = []
+
+    def done(self):
+        return self.status != "pending"
+
+    def cancel(self):
+        """ Cancels the request if it is still pending, returns whether it was. """
+        return self.service.cancel(self.agentID, self)
+
+    def result(self, timeout=None):
+        """
+        Waits up to timeout seconds (forever if None) and returns (actions,
+        complete) like AnytimePlanner.plan(), or None when the request is
+        still pending, was cancelled or failed.
+        """
+        self._event.wait(timeout)
+        if self.status in ("done", "expired"):
+            return self.actions, self.complete
+        return None
+
+    def addDoneCallback(self, callback):
+        """ Calls callback(future) once the request is finished, from the service's result thread. """
+        if self.done():
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def _finish(self, status, actions=None, complete=False, expansions=0, error=None):
+        """ Returns False if the future was already finished. """
+        if self.done():
+            return False
+        (self.actions, self.complete, self.expansions, self.error) = (actions, complete, expansions, error)
+        self.finished = time.time()
+        self.status = status
+        self._event.set()
+        for callback in self._callbacks:
+            callback(self)
+        return True
+
+
+class PlanningService:
+    """
+    Plans for up to maxAgents agents with a shared action set in a pool of
+    processes (one per core by default). Searches are AnytimePlanner runs with
+    the given weight (1.0 is plain A*, so finished plans are the cheapest).
+    """
+
+    def __init__(self, actions, processes=None, maxAgents=64, weight=1.0, stepExpansions=200):
+        self.actions = list(actions)
+        self.weight = weight
+        self.stepExpansions = stepExpansions
+        self.maxAgents = maxAgents
+        # newest request number of every agent slot, read by the workers to drop superseded requests
+        self.latest = multiprocessing.RawArray('l', maxAgents)
+        self.pool = multiprocessing.Pool(processes, _initWorker, (self.actions, self.latest))
+        self.lock = threading.RLock()  # done callbacks may submit again
+        self.slots = {}  # agentID -> slot in latest
+        self.pending = {}  # agentID -> newest PlanFuture
+        self.counter = 0
+        self.stats = dict(submitted=0, done=0, expired=0, cancelled=0, superseded=0, failed=0, expansions=0)
+
+    def submit(self, agentID, state, goals, deadline=None):
+        """
+        Queues a plan from state (int dict) to one of goals for an agent and
+        returns its PlanFuture. An older pending request of the agent is
+        cancelled. deadline is in seconds from now.
+        """
+        with self.lock:
+            if agentID not in self.slots:
+                if len(self.slots) >= self.maxAgents:
+                    raise ValueError("planning service is full (%d agents)" % self.maxAgents)
+                self.slots[agentID] = len(self.slots)
+            slot = self.slots[agentID]
+            older = self.pending.get(agentID)
+            if older is not None and older._finish("cancelled"):
+                self.stats["superseded"] += 1
+            self.counter += 1
+            absolute = time.time() + deadline if deadline is not None else None
+            future = PlanFuture(self, agentID, self.counter, absolute)
+            self.pending[agentID] = future
+            self.latest[slot] = future.number
+            self.stats["submitted"] += 1
+
+        self.pool.apply_async(_planWorker, (slot, future.number, list(goals), dict(state), absolute, self.weight,
+                                            self.stepExpansions), callback=lambda result: self._deliver(future, result))
+        return future
+
+    def _deliver(self, future, result):
+        (status, indices, complete, expansions) = result
+        with self.lock:
+            self.stats["expansions"] += expansions
+            if self.pending.get(future.agentID) is future:
+                del self.pending[future.agentID]
+            if status == "failed":
+                finished = future._finish(status, error=indices)
+            elif indices is None:
+                finished = future._finish(status, expansions=expansions)
+            else:
+                finished = future._finish(status, [self.actions[i] for i in indices], complete, expansions)
+            if finished:
+                self.stats[status] += 1
+
+    def cancel(self, agentID, future=None):
+        """
+        Cancels the pending request of an agent (only if it is future, when
+        given), returns whether one was cancelled.
+        """
+        with self.lock:
+            pending = self.pending.get(agentID)
+            if pending is None or (future is not None and pending is not future):
+                return False
+            del self.pending[agentID]
+            self.latest[self.slots[agentID]] = 0
+            if not pending._finish("cancelled"):
+                return False
+            self.stats["cancelled"] += 1
+            return True
+
+    def close(self):
+        """ Waits for the queued requests and stops the workers. """
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        """ Stops the workers right away, pending requests stay pending. """
+        self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,172 @@
+# Tick profiling: timers and counters for the expensive parts of an agent,
+# with rolling percentiles exported as JSON lines. Disabled by default, then
+# nothing is wrapped and the only cost is an "if profiler.enabled" in the agent
+# runtime. enable() wraps the functions in TARGETS (or the ones given) with
+# timers and disable() puts the originals back:
+#   import profiler
+#   profiler.enable("profile.jsonl")
+#   ... run the agent, every interval seconds a line per timer is appended ...
+#   print profiler.snapshot()["Navigator.update"]["p95"]
+
+import collections
+import importlib
+import json
+import time
+from functools import wraps
+
+# (module, class or None, function) of the functions enable() times by default
+TARGETS = [
+    ("vision", "VisionHandler", "updateFromObservation"),
+    ("vision", "VisionHandler", "filterOccluded"),
+    ("vision", "VisionHandler", "findWood"),
+    ("navigation", "Navigator", "update"),
+    ("navigation", None, "Astar"),
+    ("graphSearch", None, "astar"),
+    ("graphSearch", None, "bidirectionalAstar"),
+    ("graphSearch", "DStarLite", "plan"),
+    ("stateMachine", "StateMachine", "update"),
+    ("goap", None, "pathfind"),
+]
+
+enabled = False
+window = 1000  # durations per timer the percentiles are computed over
+path = None  # JSON lines file snapshots are appended to, or None
+interval = 5.0  # seconds between exports
+timers = {}  # name -> Timer
+counters = collections.Counter()
+_lastExport = 0.0
+_patched = []  # (owner, attribute or dict key, original)
+
+
+class Timer(object):
+    __slots__ = ("count", "total", "maximum", "durations")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.durations = collections.deque(maxlen=window)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if duration > self.maximum:
+            self.maximum = duration
+        self.durations.append(duration)
+
+    def summary(self):
+        """ Returns count, total and mean, and the p50/p95/p99/max of the recent durations, in milliseconds. """
+        durations = sorted(self.durations)
+        summary = dict(count=self.count, totalMs=1000 * self.total, meanMs=1000 * self.total / max(1, self.count),
+                       maxMs=1000 * self.maximum)
+        for p in (50, 95, 99):
+            summary["p%d" % p] = 1000 * durations[min(len(durations) - 1, len(durations) * p // 100)] \
+                if durations else 0.0
+        return summary
+
+
+def record(name, duration):
+    """ Adds a duration in seconds to the timer name. """
+    timer = timers.get(name)
+    if timer is None:
+        timer = timers[name] = Timer()
+    timer.add(duration)
+    if path is not None and time.time() - _lastExport >= interval:
+        export()
+
+
+def count(name, amount=1):
+    """ Adds to the counter name, does nothing when profiling is disabled. """
+    if enabled:
+        counters[name] += amount
+
+
+def timed(name, function):
+    """ Returns function wrapped with the timer name. """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        starttime = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, time.time() - starttime)
+    wrapper.profiled = function
+    return wrapper
+
+
+def _patch(owner, key, function):
+    """ Replaces an attribute of owner, or an entry if owner is a dict, with function. """
+    if isinstance(owner, dict):
+        _patched.append((owner, key, owner[key]))
+        owner[key] = function
+    else:
+        _patched.append((owner, key, owner.__dict__[key]))
+        setattr(owner, key, function)
+
+
+def enable(exportPath=None, exportInterval=5.0, targets=TARGETS):
+    """
+    Starts profiling: wraps the target functions (of modules that can be
+    imported) with timers. With exportPath a snapshot is appended to it every
+    exportInterval seconds and by disable().
+    """
+    global enabled, path, interval, _lastExport
+    if enabled:
+        disable()
+    (path, interval, _lastExport) = (exportPath, exportInterval, time.time())
+    for (moduleName, className, functionName) in targets:
+        try:
+            module = importlib.import_module(moduleName)
+        except ImportError:
+            continue  # e.g. a module that needs MalmoPython
+        owner = getattr(module, className) if className else module
+        original = owner.__dict__[functionName]
+        name = "%s.%s" % (className, functionName) if className else functionName
+        wrapper = timed(name, original)
+        _patch(owner, functionName, wrapper)
+        if className is None:
+            # tables of functions, like graphSearch.ENGINES, hold their own references
+            for table in module.__dict__.values():
+                if isinstance(table, dict) and table is not module.__dict__:
+                    for (key, value) in table.items():
+                        if value is original:
+                            _patch(table, key, wrapper)
+    enabled = True
+
+
+def disable():
+    """ Stops profiling, exports a last snapshot and puts the original functions back. """
+    global enabled
+    if path is not None:
+        export()
+    while _patched:
+        (owner, key, original) = _patched.pop()
+        if isinstance(owner, dict):
+            owner[key] = original
+        else:
+            setattr(owner, key, original)
+    enabled = False
+
+
+def reset():
+    timers.clear()
+    counters.clear()
+
+
+def snapshot():
+    """ Returns {name: summary} of all timers and {name: value} of the counters under "counters". """
+    result = dict((name, timer.summary()) for (name, timer) in timers.iteritems())
+    result["counters"] = dict(counters)
+    return result
+
+
+def export(exportPath=None):
+    """ Appends a JSON line per timer and one with the counters to exportPath (by default the enable() path). """
+    global _lastExport
+    _lastExport = now = time.time()
+    with open(exportPath or path, "a") as output:
+        for (name, timer) in sorted(timers.iteritems()):
+            line = dict(timer.summary(), time=now, name=name)
+            output.write(json.dumps(line, sort_keys=True) + "\n")
+        if counters:
+            output.write(json.dumps(dict(time=now, name="counters", counters=dict(counters)), sort_keys=True) + "\n")
@@ -26,6 +26,8 @@ import time
 from controller import *
 from navigation import *
 from stateMachine import *
+from worldStore import saveWorld, loadWorld
+from agentRuntime import AgentRuntime
 import random
 
 sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 0)  # flush print output immediately
@@ -61,6 +63,7 @@ missionXML = '''<?xml version="1.0" encoding="UTF-8" standalone="no" ?>
 # Create default Malmo objects:
 
 agent_host = MalmoPython.AgentHost()
+agent_host.addOptionalStringArgument("world,w", "Path of a saved waypoint graph to load and save", "")
 try:
     agent_host.parse(sys.argv)
 except RuntimeError as e:
@@ -102,10 +105,18 @@ print "Mission running ",
 
 start_time = time.time()
 c_time = 0
-firstWaypoint = None
 ac = Controller(agent_host)
 ac.setYaw(0)
-nav = Navigator(ac)
+# continue with the waypoints of earlier missions, if there are any
+world_path = agent_host.getStringArgument("world")
+if world_path and os.path.exists(world_path):
+    # no memory mapping, we save to the same file when the mission ends
+    graph, known_blocks = loadWorld(world_path, mmap=False)
+    print "Loaded %d waypoints from %s" % (len(graph), world_path)
+else:
+    graph, known_blocks = WaypointGraph(), None
+nav = Navigator(ac, graph)
+nav.nodeBudget = 2000  # compact the graph when exploring drops more waypoints
 sm = StateMachine()
 
 sm.addState("explore")
@@ -113,10 +124,10 @@ c_time_threshold_explore = 4
 
 
 def sm_explore_action():
-    global firstWaypoint
     global c_time_threshold_explore
-    if firstWaypoint is None:
-        firstWaypoint = nav.lastWaypoint
+    if nav.anchors.get("first") is None:
+        # anchored, so compacting the graph keeps this waypoint
+        nav.anchors["first"] = nav.lastWaypoint
     agent_host.sendCommand("move 1")
     if c_time > c_time_threshold_explore:
         ac.turnByAngle(90)
@@ -139,7 +150,7 @@ def sm_search_event():
     global agent_host
     nav.exploring = False
     agent_host.sendCommand("move 0")
-    route = findRoute(nav.lastWaypoint, firstWaypoint)
+    route = findRoute(nav.lastWaypoint, nav.anchors["first"])
     print route
     nav.setRoute(route)
 
@@ -163,22 +174,26 @@ def sm_nav2start_event():
 
 sm.addTransition("navigating", "start", lambda: nav.targetReached, sm_nav2start_event)
 
-# Loop until mission ends:
-while world_state.is_mission_running:
-    time.sleep(0.05)
+
+
+def update_time(obs):
+    global c_time
     c_time = time.time() - start_time
 
-    world_state = agent_host.getWorldState()
-    for error in world_state.errors:
-        print "Error:", error.text
-    if world_state.number_of_observations_since_last_state > 0:  # Have any observations come in?
-        msg = world_state.observations[-1].text  # Yes, so get the text
-        obs = json.loads(msg)
-        if obs is not None:
-            ac.update(obs)  # update controller
-            nav.update()  # update navigation
-            sm.update()  # update state machine
+
+# Loop until mission ends, one tick per observation at most 20 times a second:
+runtime = AgentRuntime(agent_host, tickRate=20)
+runtime.addStage("time", update_time)
+runtime.addStage("controller", ac.update)
+# not optional: besides dropping waypoints it steers along the route and stops at the target
+runtime.addStage("navigation", lambda obs: nav.update())
+runtime.addStage("state machine", lambda obs: sm.update())
+runtime.run()
 
 print
 print "Mission ended"
+print runtime.report()
 # Mission has ended.
+if world_path:
+    saveWorld(world_path, graph, known_blocks)
+    print "Saved %d waypoints to %s" % (len(graph), world_path)
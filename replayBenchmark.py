@@ -0,0 +1,180 @@
+# Benchmarks and regression checks of the prototype.py and visionTest.py agent
+# loops, replayed from an observation stream with ReplayAgentHost instead of
+# Minecraft. Without a stream a synthetic mission is generated:
+#   python replayBenchmark.py [observations.jsonl]
+# A replay sends the same commands every run, so the command digests printed
+# can be compared between versions of the agent code.
+
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+from agentRuntime import AgentRuntime
+from controller import Controller
+from navigation import Navigator, findRoute
+from replayHost import ReplayAgentHost, loadObservations, saveObservations
+from stateMachine import StateMachine
+from util import getLookAt, getPlayerPos, distanceH
+from vision import VisionHandler, CUBE_OBS, CUBE_SIZE
+from waypointGraph import WaypointGraph
+
+TICK = 0.05  # seconds of mission time per observation
+
+
+def syntheticMission(frames=600, seed=1):
+    """
+    Returns the observations of an agent walking squares on a flat world,
+    turning 90 degrees every 80 ticks, with a tree in sight every other leg.
+    """
+    rng = random.Random(seed)
+    side = 2 * CUBE_SIZE + 1
+    observations = []
+    (x, z, yaw) = (0.5, 0.5, 0.0)
+    for frame in range(frames):
+        if frame and frame % 80 == 0:
+            yaw = (yaw + 90.0) % 360.0
+        x -= 0.2 * math.sin(math.radians(yaw))
+        z += 0.2 * math.cos(math.radians(yaw))
+        # Malmo orders the grid by y, then z, then x, the agent stands in the middle
+        blocks = ["dirt"] * (CUBE_SIZE - 1) * side ** 2 + ["grass"] * side ** 2 + \
+            ["air"] * (CUBE_SIZE + 1) * side ** 2
+        if (frame // 80) % 2:
+            (treeX, treeZ) = rng.choice([(i, j) for i in range(side) for j in range(side)
+                                         if (i, j) != (CUBE_SIZE, CUBE_SIZE)])
+            for y in range(CUBE_SIZE, rng.randint(CUBE_SIZE + 2, side)):
+                blocks[(y * side + treeZ) * side + treeX] = "log"
+        observations.append({u"XPos": round(x, 3), u"YPos": 7.0, u"ZPos": round(z, 3), u"Yaw": yaw,
+                             u"Pitch": 0.0, u"TimeAlive": frame, CUBE_OBS: blocks})
+    return [json.dumps(observation) for observation in observations]
+
+
+def prototypeLoop(host):
+    """ The explore, search and navigate loop of prototype.py, with mission time counted in ticks. """
+    clock = dict(ticks=0, start=0, threshold=4)
+    ac = Controller(host)
+    nav = Navigator(ac, WaypointGraph())
+    nav.nodeBudget = 2000
+    sm = StateMachine()
+
+    def elapsed():
+        return (clock["ticks"] - clock["start"]) * TICK
+
+    def explore():
+        if nav.anchors.get("first") is None:
+            nav.anchors["first"] = nav.lastWaypoint
+        host.sendCommand("move 1")
+        if elapsed() > clock["threshold"]:
+            ac.turnByAngle(90)
+            clock["threshold"] += 4
+
+    def startExploring():
+        nav.exploring = True
+
+    def search():
+        nav.exploring = False
+        host.sendCommand("move 0")
+        nav.setRoute(findRoute(nav.lastWaypoint, nav.anchors["first"]))
+
+    def restart():
+        clock["start"] = clock["ticks"]
+        clock["threshold"] = 4
+
+    sm.addState("explore")
+    sm.addState("search")
+    sm.addState("navigating")
+    sm.addTransition("start", "explore", lambda: True, startExploring)
+    sm.addTransition("explore", "search", lambda: elapsed() >= 20.0, search)
+    sm.addTransition("search", "navigating", lambda: not nav.exploring, lambda: True)
+    sm.addTransition("navigating", "start", lambda: nav.targetReached, restart)
+    sm.actions["explore"] = explore
+
+    def tick(observation):
+        clock["ticks"] += 1
+
+    runtime = AgentRuntime(host, tickRate=None)
+    runtime.addStage("time", tick)
+    runtime.addStage("controller", ac.update)
+    runtime.addStage("navigation", lambda obs: nav.update())
+    runtime.addStage("state machine", lambda obs: sm.update())
+    runtime.run()
+    return runtime
+
+
+def visionLoop(host):
+    """ The find-a-tree-and-walk-to-it loop of visionTest.py, without the chopping. """
+    visionHandler = VisionHandler(CUBE_SIZE)
+    controller = Controller(host)
+    runtime = AgentRuntime(host, tickRate=None)
+    for (worldState, observation) in runtime.ticks():
+        controller.update(observation)
+        visionHandler.updateFromObservation(observation[CUBE_OBS])
+        visionHandler.filterOccluded(getLookAt(observation, False), False)
+        woodPositions = visionHandler.findWood()
+        if woodPositions == []:
+            controller.setPitch(0)
+            host.sendCommand("move 1")
+        else:
+            woodPosition = getPlayerPos(observation, False) + woodPositions[0]
+            controller.lookAt(woodPosition)
+            host.sendCommand("move {:.3f}".format(distanceH(controller.location, woodPosition) / 2.5))
+    return runtime
+
+
+def replay(loop, observations, period=None):
+    """ Runs loop on a replay of observations, returns (seconds, frames handled, commands, command digest). """
+    host = ReplayAgentHost(observations, period)
+    host.startMission()
+    (stdout, sys.stdout) = (sys.stdout, open(os.devnull, "w"))  # the loops print a lot
+    try:
+        starttime = time.time()
+        runtime = loop(host)
+    finally:
+        (sys.stdout, stdout) = (stdout, sys.stdout)
+        stdout.close()
+    return time.time() - starttime, runtime.stats["ticks"], len(host.commands), host.commandDigest()
+
+
+def benchmarkReplay(observations, realTimeFrames=200):
+    """
+    Replays the observations as fast as the loops take them, twice to check
+    the commands are the same, and a part at the live rate of one observation
+    per 50 ms for comparison.
+    """
+    for (name, loop) in (("prototype", prototypeLoop), ("visionTest", visionLoop)):
+        (seconds, frames, commands, digest) = replay(loop, observations)
+        (_, _, _, again) = replay(loop, observations)
+        print "  %-10s %5d frames in %6.2f s  %7.0f frames/s  %5d commands  digest %s  %s" % (
+            name, frames, seconds, frames / seconds, commands, digest[:16],
+            "deterministic" if digest == again else "DIFFERENT on the second run")
+        (seconds, frames, _, _) = replay(loop, observations[:realTimeFrames], TICK)
+        print "  %-10s %5d frames in %6.2f s at the live rate" % ("", frames, seconds)
+
+
+def benchmarkRoundTrip(observations):
+    """ Saves the observations as JSON lines and replays the file, the commands must match the in-memory replay. """
+    (handle, path) = tempfile.mkstemp(suffix=".jsonl")
+    os.close(handle)
+    try:
+        saveObservations(path, observations)
+        loaded = loadObservations(path)
+        same = replay(visionLoop, loaded)[3] == replay(visionLoop, observations)[3]
+        print "  %d observations, %.1f MB, replay from file %s" % (
+            len(loaded), os.path.getsize(path) / 1e6, "matches" if same else "DIFFERS")
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        observations = loadObservations(sys.argv[1])
+    else:
+        observations = syntheticMission()
+    print "replay"
+    benchmarkReplay(observations)
+    print
+    print "JSON lines round trip"
+    benchmarkRoundTrip(observations)
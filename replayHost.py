@@ -0,0 +1,170 @@
+# Stand-in for MalmoPython.AgentHost that replays a recorded stream of
+# observations (the JSON text of one observation per tick) and records the
+# commands the agent sends, so agent loops run without Minecraft, as fast as
+# they can take the observations, and give the same commands every run.
+#
+# Streams are JSON lines files, one observation per line. Record one from a
+# live mission by wrapping the agent host:
+#   agent_host = ObservationRecorder(MalmoPython.AgentHost(), "mission.jsonl")
+# and replay it with:
+#   agent_host = ReplayAgentHost(loadObservations("mission.jsonl"))
+
+import hashlib
+import json
+import time
+
+
+def loadObservations(path):
+    """ Returns the observation texts of a JSON lines file. """
+    with open(path) as stream:
+        return [line.rstrip("\n") for line in stream if line.strip()]
+
+
+def saveObservations(path, observations):
+    """ Writes observations (dicts or JSON texts) as a JSON lines file. """
+    with open(path, "w") as stream:
+        for observation in observations:
+            stream.write((observation if isinstance(observation, basestring) else json.dumps(observation)) + "\n")
+
+
+class TimestampedString(object):
+    def __init__(self, timestamp, text):
+        self.timestamp = timestamp
+        self.text = text
+
+
+class ReplayWorldState(object):
+    """ The fields of a MalmoPython.WorldState. """
+
+    def __init__(self, begun, running, observations):
+        self.has_mission_begun = begun
+        self.is_mission_running = running
+        self.observations = observations
+        self.number_of_observations_since_last_state = len(observations)
+        self.rewards = []
+        self.number_of_rewards_since_last_state = 0
+        self.video_frames = []
+        self.number_of_video_frames_since_last_state = 0
+        self.errors = []
+        self.mission_control_messages = []
+
+
+class ReplayAgentHost(object):
+    """
+    Every getWorldState() after startMission() hands out the next observation,
+    the mission ends after the last one or when "quit" is sent. With period
+    (seconds), observations come in at most one per period instead, like in
+    a live mission. commands holds (observation index, command) of every
+    sendCommand, the index being that of the last observation handed out.
+    """
+
+    def __init__(self, observations, period=None, arguments=None):
+        self.observations = list(observations)
+        self.period = period
+        self.arguments = dict(arguments or {})  # name -> value, for getStringArgument and friends
+        self.position = 0  # observations handed out
+        self.starttime = None
+        self.quit = False
+        self.commands = []
+
+    # Mission
+    ############################################################################
+
+    def startMission(self, *args):
+        self.position = 0
+        self.starttime = time.time()
+        self.quit = False
+        self.commands = []
+
+    def getWorldState(self):
+        if self.starttime is None:
+            return ReplayWorldState(False, False, [])
+        available = len(self.observations)
+        if self.period is not None:
+            available = min(available, int((time.time() - self.starttime) / self.period) + 1)
+        running = not self.quit and self.position < len(self.observations)
+        observations = []
+        if running and self.position < available:
+            observations.append(TimestampedString(time.time(), self.observations[self.position]))
+            self.position += 1
+        return ReplayWorldState(True, running, observations)
+
+    def peekWorldState(self):
+        return ReplayWorldState(self.starttime is not None, not self.quit and self.position < len(self.observations),
+                                [])
+
+    def sendCommand(self, command, key=None):
+        self.commands.append((self.position - 1, command))
+        if command == "quit":
+            self.quit = True
+
+    def commandDigest(self):
+        """ Returns a hex digest of the recorded commands, equal for runs that sent the same commands at the same ticks. """
+        return hashlib.sha1("\n".join("%d %s" % command for command in self.commands)).hexdigest()
+
+    # Argument parsing and settings, so entry points can use the host unchanged
+    ############################################################################
+
+    def addOptionalFlag(self, name, description):
+        pass
+
+    def addOptionalIntArgument(self, name, description, default):
+        self.arguments.setdefault(name.split(",")[0], default)
+
+    def addOptionalFloatArgument(self, name, description, default):
+        self.arguments.setdefault(name.split(",")[0], default)
+
+    def addOptionalStringArgument(self, name, description, default):
+        self.arguments.setdefault(name.split(",")[0], default)
+
+    def parse(self, args):
+        pass
+
+    def receivedArgument(self, name):
+        return bool(self.arguments.get(name))
+
+    def getIntArgument(self, name):
+        return int(self.arguments[name])
+
+    def getFloatArgument(self, name):
+        return float(self.arguments[name])
+
+    def getStringArgument(self, name):
+        return self.arguments.get(name, "")
+
+    def getUsage(self):
+        return "replaying %d observations" % len(self.observations)
+
+    def setDebugOutput(self, debug):
+        pass
+
+    def setObservationsPolicy(self, policy):
+        pass
+
+    def setRewardsPolicy(self, policy):
+        pass
+
+    def setVideoPolicy(self, policy):
+        pass
+
+
+class ObservationRecorder(object):
+    """ Wraps a live agent host and appends every observation it hands out to a JSON lines file. """
+
+    def __init__(self, agentHost, path):
+        self.agentHost = agentHost
+        self.stream = open(path, "w")
+
+    def getWorldState(self):
+        worldState = self.agentHost.getWorldState()
+        for observation in worldState.observations:
+            self.stream.write(observation.text.replace("\n", " ") + "\n")
+        if not worldState.is_mission_running and worldState.has_mission_begun:
+            self.stream.flush()
+        return worldState
+
+    def close(self):
+        self.stream.close()
+
+    def __getattr__(self, name):
+        return getattr(self.agentHost, name)
@@ -0,0 +1,199 @@
+# Benchmarks for the agent tick loop, runs against a stand-in agent host that
+# produces observations at a fixed rate instead of Minecraft:
+#   python runtimeBenchmark.py
+
+import json
+import random
+import time
+
+import profiler
+from agentRuntime import AgentRuntime, PipelinedRuntime
+import goap
+from stateMachine import StateMachine
+
+
+class StreamingWorldState(object):
+    def __init__(self, running, observations):
+        self.is_mission_running = running
+        self.has_mission_begun = True
+        self.number_of_observations_since_last_state = len(observations)
+        self.observations = observations
+        self.errors = []
+
+
+class StreamingObservation(object):
+    def __init__(self, text):
+        self.text = text
+
+
+class StreamingAgentHost(object):
+    """
+    Makes an observation every period seconds (with some jitter) for duration
+    seconds. Fetching a world state takes fetchCost and sending a command
+    commandCost seconds, like talking to Minecraft does. Observations have a
+    grid of gridSize block names, like ObservationFromGrid. A "chat <nr>"
+    command records the seconds since observation nr was made in latencies.
+    """
+
+    def __init__(self, period=0.05, duration=5.0, jitter=0.01, fetchCost=0.0, commandCost=0.0, gridSize=0,
+                 seed=0):
+        rng = random.Random(seed)
+        self.starttime = time.time()
+        self.times = [self.starttime + k * period + rng.uniform(0, jitter) for k in range(int(duration / period))]
+        self.endtime = self.starttime + duration
+        self.delivered = 0  # observations handed out so far
+        self.fetchCost = fetchCost
+        self.commandCost = commandCost
+        self.grid = [rng.choice(["air", "grass", "log", "leaves"]) for _ in range(gridSize)]
+        self.latencies = []
+
+    def getWorldState(self):
+        time.sleep(self.fetchCost)
+        now = time.time()
+        arrived = self.delivered
+        while arrived < len(self.times) and self.times[arrived] <= now:
+            arrived += 1
+        observations = [StreamingObservation(json.dumps({'nr': nr, 'time': self.times[nr], 'grid': self.grid}))
+                        for nr in range(self.delivered, arrived)]
+        self.delivered = arrived
+        return StreamingWorldState(now < self.endtime, observations)
+
+    def sendCommand(self, command):
+        time.sleep(self.commandCost)
+        if command.startswith("chat "):
+            self.latencies.append(time.time() - self.times[int(command[5:])])
+
+
+class Work(object):
+    """ Stage work that takes cost seconds, and spikeCost in a spikeChance fraction of the ticks. """
+
+    def __init__(self, cost, spikeCost=0.0, spikeChance=0.0, seed=1):
+        self.cost = cost
+        self.spikeCost = spikeCost
+        self.spikeChance = spikeChance
+        self.rng = random.Random(seed)
+
+    def __call__(self, observation):
+        time.sleep(self.spikeCost if self.rng.random() < self.spikeChance else self.cost)
+
+
+def benchmarkTickLoop(duration=5.0):
+    """
+    Observations arrive every 50 ms. The essential stages take 5 ms, the
+    optional vision stage takes 10 ms and 120 ms in 10% of the ticks. Compares
+    the sleep(0.05) loop of the examples with the AgentRuntime.
+    """
+    def summary(label, processed, host, latencies, extra=""):
+        latencies.sort()
+        print "  %-16s %5d of %3d observations  %5d superseded  latency p50 %5.1f ms  p95 %5.1f ms %s" % (
+            label, len(processed), len(host.times), len(host.times) - len(processed),
+            1000 * latencies[len(latencies) // 2], 1000 * latencies[int(0.95 * len(latencies))], extra)
+
+    essential = Work(0.005)
+    vision = Work(0.01, 0.12, 0.1)
+
+    host = StreamingAgentHost(duration=duration)
+    processed = []
+    latencies = []
+    worldState = host.getWorldState()
+    while worldState.is_mission_running:
+        time.sleep(0.05)
+        worldState = host.getWorldState()
+        if worldState.number_of_observations_since_last_state > 0:
+            observation = json.loads(worldState.observations[-1].text)
+            latencies.append(time.time() - observation['time'])
+            processed.append(observation['nr'])
+            essential(observation)
+            vision(observation)
+    summary("sleep loop", processed, host, latencies)
+
+    for skipping in (False, True):
+        host = StreamingAgentHost(duration=duration)
+        processed = []
+        latencies = []
+
+        def track(observation):
+            latencies.append(time.time() - observation['time'])
+            processed.append(observation['nr'])
+
+        runtime = AgentRuntime(host, tickRate=20)
+        runtime.addStage("track", track)
+        runtime.addStage("essential", essential)
+        runtime.addStage("vision", vision, optional=skipping)
+        runtime.run()
+        summary("runtime" + (", skip" if skipping else ""), processed, host, latencies,
+                " %d missed deadlines, vision skipped %d" % (runtime.stats["missed"], runtime.stages[2].skipped))
+
+
+def benchmarkPipeline(duration=5.0):
+    """
+    Observations with a 2000 block grid arrive every 50 ms, the stages spend
+    computeCost seconds of CPU on the grid and send 3 commands. Compares the
+    serial AgentRuntime with the PipelinedRuntime under a light load, where a
+    tick fits in 50 ms, and a heavy one, where fetching, computing and sending
+    together take longer. Latency is from making an observation to sending
+    the last command for it.
+    """
+    def compute(observation, commands, computeCost):
+        starttime = time.time()
+        while time.time() - starttime < computeCost:
+            sum(block == "log" for block in observation['grid'])
+        commands.sendCommand("move 1")
+        commands.sendCommand("turn 0")
+        commands.sendCommand("chat %d" % observation['nr'])
+
+    print "  load   runtime     fetch  compute  command  commanded observations   latency p50   p95"
+    for (load, fetchCost, computeCost, commandCost) in [("light", 0.005, 0.02, 0.003),
+                                                       ("heavy", 0.01, 0.03, 0.006)]:
+        for pipelined in (False, True):
+            host = StreamingAgentHost(duration=duration, fetchCost=fetchCost, commandCost=commandCost, gridSize=2000)
+            runtime = (PipelinedRuntime if pipelined else AgentRuntime)(host, tickRate=20)
+            commands = runtime.commands if pipelined else host
+            runtime.addStage("compute", lambda observation: compute(observation, commands, computeCost))
+            runtime.run()
+            latencies = sorted(host.latencies)
+            print "  %-6s %-10s %4d ms %5d ms %5d ms %10d of %3d %13.1f ms %5.1f ms" % (
+                load, "pipelined" if pipelined else "serial", 1000 * fetchCost, 1000 * computeCost,
+                1000 * commandCost, len(latencies), len(host.times), 1000 * latencies[len(latencies) // 2],
+                1000 * latencies[int(0.95 * len(latencies))])
+
+
+def benchmarkProfiler(calls=20000, plans=200):
+    """
+    Cost of a cheap StateMachine.update and of planning two hoes, with
+    profiling disabled and enabled, and the percentiles it measured.
+    """
+    machine = StateMachine()
+    machine.actions["start"] = lambda: None
+    (goals, actions) = (goap.hoeGoals(), goap.hoeActions())
+
+    def measure():
+        starttime = time.time()
+        for _ in xrange(calls):
+            machine.update()
+        update = (time.time() - starttime) / calls
+        starttime = time.time()
+        for _ in xrange(plans):
+            # through the goap module like goap.plan, so the timer is seen
+            goap.pathfind(goals, actions, {}, heuristic=goap.RelaxedHeuristic)
+        return update, (time.time() - starttime) / plans
+
+    print "  profiling   StateMachine.update   pathfind"
+    print "  disabled %17.2f us %9.2f ms" % tuple(scale * value for (scale, value) in zip((1e6, 1e3), measure()))
+    profiler.reset()
+    profiler.enable(targets=[("stateMachine", "StateMachine", "update"), ("goap", None, "pathfind")])
+    (update, plan) = measure()
+    profiler.disable()
+    print "  enabled  %17.2f us %9.2f ms" % (1e6 * update, 1e3 * plan)
+    for (name, summary) in sorted(profiler.snapshot().items()):
+        if name != "counters":
+            print "  %-22s %6d calls  p50 %.4f ms  p95 %.4f ms  p99 %.4f ms" % (
+                name, summary["count"], summary["p50"], summary["p95"], summary["p99"])
+
+
+if __name__ == '__main__':
+    benchmarkTickLoop()
+    print
+    benchmarkPipeline()
+    print
+    benchmarkProfiler()
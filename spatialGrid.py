@@ -0,0 +1,101 @@
+# Uniform grid of agent positions over the horizontal (x, z) plane, for finding
+# the agents within a radius of a point or the k nearest ones without looking
+# at every agent. Distances are full 3D distances.
+
+import math
+
+
+class SpatialGrid:
+    def __init__(self, cellSize=16.0):
+        self.cellSize = float(cellSize)
+        self.positions = {}  # agentID -> (x, y, z)
+        self.cells = {}  # (cx, cz) -> set of agentIDs
+
+    def cell(self, location):
+        return (int(math.floor(location[0] / self.cellSize)), int(math.floor(location[2] / self.cellSize)))
+
+    def update(self, agentID, location):
+        """ Moves an agent to location, like Controller.location after an observation. """
+        location = (float(location[0]), float(location[1]), float(location[2]))
+        old = self.positions.get(agentID)
+        cell = self.cell(location)
+        if old is not None:
+            oldCell = self.cell(old)
+            if oldCell != cell:
+                self._discard(oldCell, agentID)
+                self.cells.setdefault(cell, set()).add(agentID)
+        else:
+            self.cells.setdefault(cell, set()).add(agentID)
+        self.positions[agentID] = location
+
+    def remove(self, agentID):
+        location = self.positions.pop(agentID, None)
+        if location is not None:
+            self._discard(self.cell(location), agentID)
+
+    def _discard(self, cell, agentID):
+        members = self.cells[cell]
+        members.discard(agentID)
+        if not members:
+            del self.cells[cell]
+
+    def distance(self, agentID, location):
+        (x, y, z) = self.positions[agentID]
+        return math.sqrt((x - location[0]) ** 2 + (y - location[1]) ** 2 + (z - location[2]) ** 2)
+
+    def within(self, location, radius, accept=None):
+        """ Returns the agents at most radius away from location, for which accept(agentID) is true. """
+        (minX, minZ) = self.cell((location[0] - radius, 0, location[2] - radius))
+        (maxX, maxZ) = self.cell((location[0] + radius, 0, location[2] + radius))
+        found = []
+        if (maxX - minX + 1) * (maxZ - minZ + 1) > len(self.cells):
+            cells = [members for (cell, members) in self.cells.iteritems()
+                     if minX <= cell[0] <= maxX and minZ <= cell[1] <= maxZ]
+        else:
+            cells = [self.cells[(cx, cz)] for cx in xrange(minX, maxX + 1) for cz in xrange(minZ, maxZ + 1)
+                     if (cx, cz) in self.cells]
+        for members in cells:
+            for agentID in members:
+                if (accept is None or accept(agentID)) and self.distance(agentID, location) <= radius:
+                    found.append(agentID)
+        return found
+
+    def nearest(self, location, k, accept=None, maxRadius=None):
+        """
+        Returns up to k agents closest to location (nearest first), for which
+        accept(agentID) is true, at most maxRadius away if given. Searches rings
+        of cells around location until no unsearched cell can be closer.
+        """
+        (cx, cz) = self.cell(location)
+        found = []  # (distance, agentID)
+        seen = 0
+        ring = 0
+        while seen < len(self.positions):
+            if (2 * ring + 1) ** 2 > 4 * len(self.cells):
+                # the rings got larger than the occupied grid, just look at every agent
+                found = [(self.distance(agentID, location), agentID) for agentID in self.positions
+                         if accept is None or accept(agentID)]
+                found.sort()
+                break
+            if ring == 0:
+                cells = [(cx, cz)]
+            else:
+                cells = [(cx + dx, cz + dz) for dx in xrange(-ring, ring + 1) for dz in (-ring, ring)] + \
+                        [(cx + dx, cz + dz) for dx in (-ring, ring) for dz in xrange(-ring + 1, ring)]
+            for cell in cells:
+                for agentID in self.cells.get(cell, ()):
+                    seen += 1
+                    if accept is None or accept(agentID):
+                        found.append((self.distance(agentID, location), agentID))
+            # anything in the next ring is at least this far away
+            reach = ring * self.cellSize
+            found.sort()
+            if len(found) >= k and found[k - 1][0] <= reach:
+                break
+            if maxRadius is not None and reach > maxRadius:
+                break
+            ring += 1
+        return [agentID for (distance, agentID) in found[:k] if maxRadius is None or distance <= maxRadius]
+
+    def __len__(self):
+        return len(self.positions)
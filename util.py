@@ -73,7 +73,7 @@ def getRotationMatrix(pitch, yaw):
 
 def shortAngle(angle1, angle2):
 	""" Returns shortest signed angle from angle1 to angle2 in degrees. """
-	x, y = radians(a1), radians(a2)
+	x, y = radians(angle1), radians(angle2)
 	a = atan2(sin(x - y), cos(x - y))
 	return degrees(a)
 
@@ -1,6 +1,5 @@
 # Code for filtering non-visible blocks based on a given observation and small tests
 
-import MalmoPython
 import numpy as np
 
 from util import *
@@ -11,6 +11,7 @@ import numpy as np
 from util import *
 from controller import *
 from vision import *
+from agentRuntime import AgentRuntime
 
 ENTITIES_KEY = "entities"
 
@@ -202,121 +203,113 @@ if __name__ == "__main__":
         visionHandler = VisionHandler(CUBE_SIZE)
         controller = Controller(agentHost)
 
-        # Mission loop:
-        while worldState.is_mission_running:
-            if worldState.number_of_observations_since_last_state > 0:
-                # Get observation info
-                msg = worldState.observations[-1].text
-                observation = json.loads(msg)
-
-                if u"XPos" not in observation:
-                    print "Fuck you Malmo, gimme mah playahPos"
-                    continue
-
-                # print "observation = {}".format(observation)
-
-                # if ENTITIES_KEY in observation:
-                # 	print "entities = {}".format(observation[ENTITIES_KEY])
-
-                playerIsCrouching = controller.isCrouching()
-                lookAt = getLookAt(observation, playerIsCrouching)
-
-                # Update vision and filter occluded blocks
-                controller.update(observation)
-                controller.setCrouch(False)
-                visionHandler.updateFromObservation(observation[CUBE_OBS])
-                visionHandler.filterOccluded(lookAt, playerIsCrouching)
-                playerPos = getPlayerPos(observation, False)
-                usablePlayerPos = getPlayerPos(observation, True)
-                # print "playerPos = {}, round = {}, final = {}".format(playerPos,
-                # 	np.round(playerPos, 0), usablePlayerPos)
-
-                # Print all the blocks that we can see
-                # print "blocks around us: \n{}".format(visionHandler)
-
-                # Look for wood
-                woodPositions = visionHandler.findWood()
-
-                if woodPositions == []:
-                    # Shit, no wood visible/in range... keep moving then
-                    # print "No wood in range!"
-                    controller.setPitch(0)
-                    agentHost.sendCommand("move 1")
-                    agentHost.sendCommand("attack 0")
-
-                    # Check if we can collect some wood spoils, and pick them up...
-                    if ENTITIES_KEY in observation:
-                        woodDropPositions = getEntityPositions(playerPos,
-                                                               observation[ENTITIES_KEY], BLOCK_WOOD)
-
-                        if woodDropPositions != []:
-                            controller.lookAt(woodDropPositions[0])
-                            agentHost.sendCommand("move 1")
-                        else:
-                            print "Chopped tree down and collected all wood!"
-                            controller.setPitch(0)
-                            agentHost.sendCommand("move 0")
-                            time.sleep(1.5)
-                            agentHost.sendCommand("quit")
-
-                else:
-                    # Look at the first wood block
-                    usableWoodPos = usablePlayerPos + woodPositions[0]
-                    realWoodPos = playerPos + woodPositions[0]
-                    # print "usableWoodPos = {}, realWoodPos = {}".format(usableWoodPos,
-                    # 	realWoodPos)
-                    tempx, tempy, tempz = woodPositions[0]
-                    # print "wood[0] at {}, {}, {}: {}".format(tempx, tempy, tempz,
-                    # 	visionHandler.isBlock(tempx, tempy, tempz, BLOCK_WOOD))
-
-                    # print "Target wood found at relative position {} and absolute position {}".format(
-                    # 	woodPositions[0], usableWoodPos)
-
-                    controller.lookAt(realWoodPos)
-
-                    # Check line of sight to see if we have targeted the right block
-                    if u"LineOfSight" in observation:
-                        lineOfSightDict = observation[u"LineOfSight"]
-                        losBlock = getLineOfSightBlock(lineOfSightDict)
-                        relBlockPos = losBlock - usablePlayerPos
-                        x, y, z = relBlockPos
-                        visionBlockIsWood = visionHandler.isBlock(x, y, z, BLOCK_WOOD)
-                        losBlockType = lineOfSightDict[u"type"]
-                        # print "LOS block = {}, LOS type = {}, isWood = {}, target = {}".format(
-                        # 	losBlock, losBlockType, visionBlockIsWood, usableWoodPos)
-
-                        # If we are standing close enough to the wood block, start
-                        # punching it,
-                        inRange = lineOfSightDict[u"inRange"]
-                        # print "relBlockPos = {} {} {}, inRange = {}".format(x, y, z,
-                        # 	inRange)
-
-                        if inRange and (
-                                (losBlock == usableWoodPos).all() or visionBlockIsWood or losBlockType == BLOCK_WOOD):
-                            print "Chopping tree down!!!!"
-                            agentHost.sendCommand("move 0")
-                            controller.lookAt(realWoodPos)
-                            agentHost.sendCommand("attack 1")
-                        else:
-                            # If the distance between the wood block and our position
-                            # is too far away, we need to towards it
-                            # print "MURT! distanceH is {}".format(distanceH(playerPos, realWoodPos))
-                            agentHost.sendCommand("attack 0")
-                            distanceEpsilon = 0.9
-                            distanceToWood = distanceH(playerPos, realWoodPos)
-
-                            # Malmo already clips speeds > 1.0 to 1.0 maximum
-                            movementSpeed = distanceToWood / 2.5
-
-                            if distanceToWood > distanceEpsilon:
-                                # Keep moving forward until we reach it
-                                print "Moving towards new wood, possibly like a fucking moron! Speed = {}".format(
-                                    movementSpeed)
-                                agentHost.sendCommand("move {}".format(movementSpeed))
-
-            for error in worldState.errors:
-                print "Error:", error.text
-
-            worldState = agentHost.getWorldState()
+        # Mission loop, one tick per observation at most 20 times a second, the
+        # runtime prints the errors of every world state it fetches:
+        runtime = AgentRuntime(agentHost, tickRate=20)
+        for (worldState, observation) in runtime.ticks():
+            if u"XPos" not in observation:
+                print "Fuck you Malmo, gimme mah playahPos"
+                continue
+
+            # print "observation = {}".format(observation)
+
+            # if ENTITIES_KEY in observation:
+            # 	print "entities = {}".format(observation[ENTITIES_KEY])
+
+            playerIsCrouching = controller.isCrouching()
+            lookAt = getLookAt(observation, playerIsCrouching)
+
+            # Update vision and filter occluded blocks
+            controller.update(observation)
+            controller.setCrouch(False)
+            visionHandler.updateFromObservation(observation[CUBE_OBS])
+            visionHandler.filterOccluded(lookAt, playerIsCrouching)
+            playerPos = getPlayerPos(observation, False)
+            usablePlayerPos = getPlayerPos(observation, True)
+            # print "playerPos = {}, round = {}, final = {}".format(playerPos,
+            # 	np.round(playerPos, 0), usablePlayerPos)
+
+            # Print all the blocks that we can see
+            # print "blocks around us: \n{}".format(visionHandler)
+
+            # Look for wood
+            woodPositions = visionHandler.findWood()
+
+            if woodPositions == []:
+                # Shit, no wood visible/in range... keep moving then
+                # print "No wood in range!"
+                controller.setPitch(0)
+                agentHost.sendCommand("move 1")
+                agentHost.sendCommand("attack 0")
+
+                # Check if we can collect some wood spoils, and pick them up...
+                if ENTITIES_KEY in observation:
+                    woodDropPositions = getEntityPositions(playerPos,
+                                                           observation[ENTITIES_KEY], BLOCK_WOOD)
+
+                    if woodDropPositions != []:
+                        controller.lookAt(woodDropPositions[0])
+                        agentHost.sendCommand("move 1")
+                    else:
+                        print "Chopped tree down and collected all wood!"
+                        controller.setPitch(0)
+                        agentHost.sendCommand("move 0")
+                        time.sleep(1.5)
+                        agentHost.sendCommand("quit")
+
+            else:
+                # Look at the first wood block
+                usableWoodPos = usablePlayerPos + woodPositions[0]
+                realWoodPos = playerPos + woodPositions[0]
+                # print "usableWoodPos = {}, realWoodPos = {}".format(usableWoodPos,
+                # 	realWoodPos)
+                tempx, tempy, tempz = woodPositions[0]
+                # print "wood[0] at {}, {}, {}: {}".format(tempx, tempy, tempz,
+                # 	visionHandler.isBlock(tempx, tempy, tempz, BLOCK_WOOD))
+
+                # print "Target wood found at relative position {} and absolute position {}".format(
+                # 	woodPositions[0], usableWoodPos)
+
+                controller.lookAt(realWoodPos)
+
+                # Check line of sight to see if we have targeted the right block
+                if u"LineOfSight" in observation:
+                    lineOfSightDict = observation[u"LineOfSight"]
+                    losBlock = getLineOfSightBlock(lineOfSightDict)
+                    relBlockPos = losBlock - usablePlayerPos
+                    x, y, z = relBlockPos
+                    visionBlockIsWood = visionHandler.isBlock(x, y, z, BLOCK_WOOD)
+                    losBlockType = lineOfSightDict[u"type"]
+                    # print "LOS block = {}, LOS type = {}, isWood = {}, target = {}".format(
+                    # 	losBlock, losBlockType, visionBlockIsWood, usableWoodPos)
+
+                    # If we are standing close enough to the wood block, start
+                    # punching it,
+                    inRange = lineOfSightDict[u"inRange"]
+                    # print "relBlockPos = {} {} {}, inRange = {}".format(x, y, z,
+                    # 	inRange)
+
+                    if inRange and (
+                            (losBlock == usableWoodPos).all() or visionBlockIsWood or losBlockType == BLOCK_WOOD):
+                        print "Chopping tree down!!!!"
+                        agentHost.sendCommand("move 0")
+                        controller.lookAt(realWoodPos)
+                        agentHost.sendCommand("attack 1")
+                    else:
+                        # If the distance between the wood block and our position
+                        # is too far away, we need to towards it
+                        # print "MURT! distanceH is {}".format(distanceH(playerPos, realWoodPos))
+                        agentHost.sendCommand("attack 0")
+                        distanceEpsilon = 0.9
+                        distanceToWood = distanceH(playerPos, realWoodPos)
+
+                        # Malmo already clips speeds > 1.0 to 1.0 maximum
+                        movementSpeed = distanceToWood / 2.5
+
+                        if distanceToWood > distanceEpsilon:
+                            # Keep moving forward until we reach it
+                            print "Moving towards new wood, possibly like a fucking moron! Speed = {}".format(
+                                movementSpeed)
+                            agentHost.sendCommand("move {}".format(movementSpeed))
 
         print "\nMission ended!"
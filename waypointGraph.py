@@ -0,0 +1,631 @@
+# Compact, array backed waypoint graph. Stores the same information as a graph
+# of navigation.WaypointNode objects, but uses numpy arrays for the locations and
+# radii and a CSR (compressed sparse row) adjacency with cached edge lengths.
+# Waypoints are plain integer ids, GraphWaypoint offers a WaypointNode-like view.
+
+import numpy as np
+from math import sqrt
+
+
+class WaypointGraph(object):
+    """
+    Waypoint graph with integer ids. The adjacency is kept as CSR arrays
+    (indptr, indices, weights) that are rebuilt by compile(); edges added or
+    removed in between are kept in small pending structures, so adding
+    waypoints while exploring stays cheap.
+    """
+
+    # Number of pending (uncompiled) edges before compile() is called automatically
+    MIN_PENDING_EDGES = 1024
+
+    def __init__(self, capacity=64):
+        super(WaypointGraph, self).__init__()
+        capacity = max(1, capacity)
+        self.size = 0  # number of ids handed out, including detached ones
+        self.locations = np.zeros((capacity, 3), dtype=np.float64)
+        self.radii = np.zeros(capacity, dtype=np.float32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.data = {}  # id -> dict, only for waypoints that have data
+        self.storedData = None  # lazily decoded data of a loaded graph, see worldStore
+        self.version = 0  # incremented on every change of the graph
+        self.epoch = 0  # incremented when compact() renumbers the waypoints
+        self.listeners = []  # functions f(ids) called with the ids whose edges changed
+
+        # Compiled CSR adjacency, rows exist for ids < len(self.indptr) - 1 and
+        # the indices within a row are sorted
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float64)
+
+        # Changes since the last compile
+        self._added = {}  # id -> {id: weight}
+        self._removed = set()  # (low id, high id) pairs removed from the CSR
+        self._numPending = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive[:self.size]))
+
+    def __repr__(self):
+        return "WaypointGraph({} waypoints, {} edges)".format(len(self), self.numEdges())
+
+    ############################################################################
+    # Waypoints
+    ############################################################################
+
+    def _grow(self, needed):
+        """ Makes sure the per waypoint arrays can hold at least needed ids. """
+        capacity = len(self.radii)
+        if needed <= capacity:
+            return
+
+        capacity = max(1, capacity)  # a graph loaded from an empty save has none
+        while capacity < needed:
+            capacity *= 2
+
+        locations = np.zeros((capacity, 3), dtype=np.float64)
+        locations[:self.size] = self.locations[:self.size]
+        radii = np.zeros(capacity, dtype=np.float32)
+        radii[:self.size] = self.radii[:self.size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.locations, self.radii, self.alive = locations, radii, alive
+
+    def addWaypoint(self, location, radius, data=None):
+        """ Adds a new waypoint and returns its id. """
+        self._grow(self.size + 1)
+        wid = self.size
+        self.size += 1
+        self.locations[wid] = location
+        self.radii[wid] = radius
+        self.alive[wid] = True
+        if data:
+            self.data[wid] = data
+        self.version += 1
+        return wid
+
+    def isAlive(self, wid):
+        return 0 <= wid < self.size and bool(self.alive[wid])
+
+    def getLocation(self, wid):
+        x, y, z = self.locations[wid]
+        return (float(x), float(y), float(z))
+
+    def getRadius(self, wid):
+        return float(self.radii[wid])
+
+    def getData(self, wid):
+        """ Returns the data dict of a waypoint, creating it if needed. """
+        data = self.data.get(wid)
+        if data is None:
+            if self.storedData is not None:
+                data = self.storedData.get(wid)
+            if data is None:
+                data = {}
+            self.data[wid] = data
+        return data
+
+    def hasData(self, wid):
+        """ Returns True if the waypoint has a non-empty data dict. """
+        if wid in self.data:
+            return bool(self.data[wid])
+        return self.storedData is not None and self.storedData.raw(wid) is not None
+
+    def detach(self, wid):
+        """ Removes a waypoint and all its edges from the graph. """
+        if not self.isAlive(wid):
+            return
+
+        changed = [wid] + self.neighbors(wid)
+        self.alive[wid] = False
+        for neighbor in self._added.pop(wid, {}):
+            self._added[neighbor].pop(wid, None)
+            if not self._added[neighbor]:
+                del self._added[neighbor]
+        self.data.pop(wid, None)
+        self.version += 1
+        self._notify(changed)
+
+    def _notify(self, ids):
+        for listener in self.listeners:
+            listener(ids)
+
+    def waypoint(self, wid):
+        """ Returns a WaypointNode compatible view of the given waypoint. """
+        return GraphWaypoint(self, wid)
+
+    def distance(self, wid1, wid2):
+        """ Returns the euclidian distance between 2 waypoints. """
+        (x1, y1, z1) = self.locations[wid1]
+        (x2, y2, z2) = self.locations[wid2]
+        return sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2 + (z2 - z1) ** 2)
+
+    ############################################################################
+    # Edges
+    ############################################################################
+
+    def _csrRow(self, wid):
+        """ Returns (start, end) of the CSR row of wid, empty if not compiled yet. """
+        if wid + 1 >= len(self.indptr):
+            return 0, 0
+        return self.indptr[wid], self.indptr[wid + 1]
+
+    def _inCSR(self, wid1, wid2):
+        start, end = self._csrRow(wid1)
+        if start == end:
+            return False
+        i = start + np.searchsorted(self.indices[start:end], wid2)
+        return i < end and self.indices[i] == wid2
+
+    def edgeWeight(self, wid1, wid2):
+        """ Returns the weight of the edge between 2 waypoints, or None. """
+        if not (self.isAlive(wid1) and self.isAlive(wid2)):
+            return None
+        added = self._added.get(wid1)
+        if added is not None and wid2 in added:
+            return added[wid2]
+        if (min(wid1, wid2), max(wid1, wid2)) in self._removed:
+            return None
+        start, end = self._csrRow(wid1)
+        if start == end:
+            return None
+        i = start + np.searchsorted(self.indices[start:end], wid2)
+        if i < end and self.indices[i] == wid2:
+            return float(self.weights[i])
+        return None
+
+    def hasEdge(self, wid1, wid2):
+        return self.edgeWeight(wid1, wid2) is not None
+
+    def addEdge(self, wid1, wid2, weight=None):
+        """
+        Connects 2 waypoints, the weight defaults to the euclidian distance.
+        Returns True if a new edge was added.
+        """
+        if wid1 == wid2 or self.hasEdge(wid1, wid2):
+            return False
+        if not (self.isAlive(wid1) and self.isAlive(wid2)):
+            return False
+
+        if weight is None:
+            weight = self.distance(wid1, wid2)
+        self._added.setdefault(wid1, {})[wid2] = weight
+        self._added.setdefault(wid2, {})[wid1] = weight
+        self._numPending += 1
+        self.version += 1
+        self._notify((wid1, wid2))
+
+        if self._numPending > max(self.MIN_PENDING_EDGES, self.size // 8):
+            self.compile()
+        return True
+
+    def removeEdge(self, wid1, wid2):
+        """ Disconnects 2 waypoints, returns True if there was an edge. """
+        removed = False
+        if wid2 in self._added.get(wid1, ()):
+            del self._added[wid1][wid2]
+            del self._added[wid2][wid1]
+            for wid in (wid1, wid2):
+                if not self._added[wid]:
+                    del self._added[wid]
+            removed = True
+
+        pair = (min(wid1, wid2), max(wid1, wid2))
+        if pair not in self._removed and self._inCSR(wid1, wid2):
+            self._removed.add(pair)
+            self._numPending += 1
+            removed = True
+
+        if removed:
+            self.version += 1
+            self._notify((wid1, wid2))
+        return removed
+
+    def edges(self, wid):
+        """ Returns the (neighbor ids, edge weights) of a waypoint as 2 lists. """
+        start, end = self._csrRow(wid)
+        ids = self.indices[start:end]
+        weights = self.weights[start:end]
+
+        if start != end:
+            mask = self.alive[ids]
+            if not mask.all():
+                ids, weights = ids[mask], weights[mask]
+        ids, weights = ids.tolist(), weights.tolist()
+
+        if self._removed and ids:
+            kept = [(n, w) for (n, w) in zip(ids, weights)
+                    if (min(wid, n), max(wid, n)) not in self._removed]
+            ids, weights = [n for (n, w) in kept], [w for (n, w) in kept]
+
+        added = self._added.get(wid)
+        if added:
+            ids.extend(added.keys())
+            weights.extend(added.values())
+        return ids, weights
+
+    def neighbors(self, wid):
+        """ Returns the ids of all neighbors of a waypoint. """
+        return self.edges(wid)[0]
+
+    def degree(self, wid):
+        return len(self.neighbors(wid))
+
+    def edgeArrays(self):
+        """
+        Returns all (directed) edges as the arrays (sources, targets, weights),
+        every undirected edge is listed in both directions.
+        """
+        numRows = len(self.indptr) - 1
+        sources = np.repeat(np.arange(numRows, dtype=np.int32), np.diff(self.indptr))
+        targets = self.indices
+        weights = self.weights
+
+        mask = self.alive[sources] & self.alive[targets]
+        if self._removed:
+            removed = np.array([low * self.size + high for (low, high) in self._removed], dtype=np.int64)
+            low = np.minimum(sources, targets).astype(np.int64)
+            high = np.maximum(sources, targets).astype(np.int64)
+            mask &= ~np.in1d(low * self.size + high, removed)
+        sources, targets, weights = sources[mask], targets[mask], weights[mask]
+
+        if self._added:
+            pending = [(s, t, w) for (s, row) in self._added.items() for (t, w) in row.items()]
+            sources = np.concatenate([sources, np.array([p[0] for p in pending], dtype=np.int32)])
+            targets = np.concatenate([targets, np.array([p[1] for p in pending], dtype=np.int32)])
+            weights = np.concatenate([weights, np.array([p[2] for p in pending], dtype=np.float64)])
+
+        return sources, targets, weights
+
+    def numEdges(self):
+        """ Returns the number of undirected edges. """
+        return len(self.edgeArrays()[0]) // 2
+
+    def compile(self):
+        """ Merges all pending edge changes into the CSR arrays. """
+        if not self._added and not self._removed and len(self.indptr) == self.size + 1:
+            return
+
+        sources, targets, weights = self.edgeArrays()
+        self._setCSR(sources, targets, weights)
+        self._added = {}
+        self._removed = set()
+        self._numPending = 0
+
+    def _setCSR(self, sources, targets, weights):
+        """ Builds the CSR arrays from directed edge arrays. """
+        order = np.lexsort((targets, sources))
+        counts = np.bincount(sources, minlength=self.size)
+        self.indptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+        self.indices = targets[order].astype(np.int32)
+        self.weights = weights[order].astype(np.float64)
+
+    @classmethod
+    def fromCSR(cls, locations, radii, alive, indptr, indices, weights):
+        """
+        Creates a graph directly on top of existing arrays (for example memory
+        mapped ones) without copying them. The arrays are only replaced once
+        the graph needs to grow or gets recompiled.
+        """
+        graph = cls(1)
+        graph.size = len(radii)
+        graph.locations, graph.radii, graph.alive = locations, radii, alive
+        graph.indptr, graph.indices, graph.weights = indptr, indices, weights
+        return graph
+
+    @classmethod
+    def fromArrays(cls, locations, radii, edges, weights=None):
+        """
+        Builds a graph in one go from an (N, 3) array of locations, an array of
+        N radii and an (E, 2) array of undirected edges given as id pairs.
+        Edge weights default to the euclidian length of the edges.
+        """
+        locations = np.asarray(locations, dtype=np.float64)
+        edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+        graph = cls(len(locations))
+        graph.size = len(locations)
+        graph.locations[:graph.size] = locations
+        graph.radii[:graph.size] = radii
+        graph.alive[:graph.size] = True
+
+        if weights is None:
+            delta = locations[edges[:, 0]] - locations[edges[:, 1]]
+            weights = np.sqrt((delta ** 2).sum(axis=1))
+        weights = np.asarray(weights, dtype=np.float64)
+
+        sources = np.concatenate([edges[:, 0], edges[:, 1]])
+        targets = np.concatenate([edges[:, 1], edges[:, 0]])
+        graph._setCSR(sources, targets, np.concatenate([weights, weights]))
+        return graph
+
+    ############################################################################
+    # Queries
+    ############################################################################
+
+    def ids(self):
+        """ Returns an array with the ids of all waypoints in the graph. """
+        return np.nonzero(self.alive[:self.size])[0]
+
+    def component(self, wid):
+        """ Returns the set of ids in the same connected part of the graph as wid. """
+        discovered = set([wid])
+        frontier = [wid]
+        while frontier:
+            current = frontier.pop()
+            for neighbor in self.neighbors(current):
+                if neighbor not in discovered:
+                    discovered.add(neighbor)
+                    frontier.append(neighbor)
+        return discovered
+
+    def findKey(self, key):
+        """ Returns the ids of all waypoints that have the given key in their data. """
+        found = [wid for (wid, data) in self.data.items() if key in data]
+        if self.storedData is not None:
+            found.extend(wid for wid in self.storedData.keyIds(key)
+                         if wid not in self.data and self.isAlive(wid))
+        return found
+
+    def containing(self, point):
+        """ Returns the ids of all waypoints whose sphere contains the point. """
+        delta = self.locations[:self.size] - np.asarray(point, dtype=np.float64)
+        inside = (delta ** 2).sum(axis=1) <= self.radii[:self.size].astype(np.float64) ** 2
+        return np.nonzero(inside & self.alive[:self.size])[0]
+
+    def containingH(self, point):
+        """ Returns the ids of all waypoints horizontally within radius of the point. """
+        delta = self.locations[:self.size] - np.asarray(point, dtype=np.float64)
+        inside = delta[:, 0] ** 2 + delta[:, 2] ** 2 <= self.radii[:self.size].astype(np.float64) ** 2
+        return np.nonzero(inside & self.alive[:self.size])[0]
+
+    def nearest(self, point):
+        """ Returns the id of the waypoint closest to the point, or None. """
+        if not self.alive[:self.size].any():
+            return None
+        delta = self.locations[:self.size] - np.asarray(point, dtype=np.float64)
+        distances = (delta ** 2).sum(axis=1)
+        distances[~self.alive[:self.size]] = np.inf
+        return int(np.argmin(distances))
+
+    def distancesTo(self, wid):
+        """ Returns the euclidian distance of every waypoint to the given waypoint. """
+        delta = self.locations[:self.size] - self.locations[wid]
+        return np.sqrt((delta ** 2).sum(axis=1))
+
+    ############################################################################
+    # Compaction
+    ############################################################################
+
+    def _mergeOverlapping(self, mergeFraction, protected, survivors):
+        """
+        Merges waypoints whose centers are closer than mergeFraction times the
+        smaller radius into one, the survivor keeps the edges of both. Waypoints
+        with data are only merged into, like protected ones.
+        """
+        ids = self.ids()
+        if len(ids) == 0:
+            return
+        cellSize = mergeFraction * float(self.radii[ids].max())
+        if cellSize <= 0.0:
+            return
+
+        cells = {}
+        for (wid, cell) in zip(ids.tolist(), np.floor(self.locations[ids] / cellSize).astype(int).tolist()):
+            cells.setdefault(tuple(cell), []).append(wid)
+
+        offsets = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)]
+        for (cell, members) in cells.items():
+            for keep in members:
+                if not self.alive[keep]:
+                    continue
+                for (dx, dy, dz) in offsets:
+                    for other in cells.get((cell[0] + dx, cell[1] + dy, cell[2] + dz), ()):
+                        if other == keep or not self.alive[other] or not self.alive[keep]:
+                            continue
+                        limit = mergeFraction * min(self.radii[keep], self.radii[other])
+                        if self.distance(keep, other) >= limit:
+                            continue
+                        (survivor, merged) = (keep, other)
+                        if other in protected or self.hasData(other):
+                            if keep in protected or self.hasData(keep):
+                                continue
+                            (survivor, merged) = (other, keep)  # keep is gone, the checks above skip the rest
+                        self._mergeInto(merged, survivor)
+                        survivors[merged] = survivor
+
+    def _mergeInto(self, wid, survivor):
+        """ Moves the edges of wid (which has no data) to survivor and detaches wid. """
+        for neighbor in self.neighbors(wid):
+            if neighbor != survivor:
+                self.addEdge(survivor, neighbor)
+        self.detach(wid)
+
+    def _collapseChains(self, tolerance, protected, survivors):
+        """
+        Removes waypoints in the middle of nearly straight chains, the 2 ends get
+        one edge with the summed weight, so route lengths stay the same.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for wid in self.ids().tolist():
+                if wid in protected or self.hasData(wid):
+                    continue
+                neighbors, weights = self.edges(wid)
+                if len(neighbors) != 2:
+                    continue
+                (a, b), weight = neighbors, weights[0] + weights[1]
+                if weight > (1.0 + tolerance) * self.distance(a, b):
+                    continue  # the chain bends, we need the waypoint to steer around
+
+                existing = self.edgeWeight(a, b)
+                self.detach(wid)
+                if existing is None or existing > weight:
+                    self.removeEdge(a, b)
+                    self.addEdge(a, b, weight)
+                survivors[wid] = a if self.distance(wid, a) <= self.distance(wid, b) else b
+                changed = True
+
+    def _removeRedundantEdges(self, tolerance):
+        """
+        Removes edges for which a detour over one other waypoint is at most
+        tolerance longer. The edges of such detours are kept, so every route
+        gets at most tolerance longer.
+        """
+        sources, targets, weights = self.edgeArrays()
+        order = np.argsort(-weights)
+        kept = set()
+        for (a, b, weight) in zip(sources[order].tolist(), targets[order].tolist(), weights[order].tolist()):
+            if a > b or (a, b) in kept:
+                continue
+            neighborsA, weightsA = self.edges(a)
+            weightsB = dict(zip(*self.edges(b)))
+            for (c, weightAC) in zip(neighborsA, weightsA):
+                if c == b or c not in weightsB:
+                    continue
+                if weightAC + weightsB[c] <= (1.0 + tolerance) * weight:
+                    self.removeEdge(a, b)
+                    kept.add((min(a, c), max(a, c)))
+                    kept.add((min(c, b), max(c, b)))
+                    break
+
+    def _pack(self, survivors):
+        """
+        Renumbers the waypoints so the ids are dense again, returns an array that
+        maps every old id to its new id, or -1 if it is gone.
+        """
+        self.compile()
+        oldSize = self.size
+        ids = self.ids()
+        remap = np.full(oldSize, -1, dtype=np.int64)
+        remap[ids] = np.arange(len(ids))
+
+        # removed waypoints map to the waypoint that took their place
+        for wid in survivors:
+            survivor = survivors[wid]
+            while survivor in survivors and not self.alive[survivor]:
+                survivor = survivors[survivor]
+            remap[wid] = remap[survivor]
+
+        data = {}
+        if self.storedData is not None:
+            for wid in self.storedData.ids.tolist():
+                if wid < oldSize and self.alive[wid] and wid not in self.data:
+                    data[int(remap[wid])] = self.storedData.get(wid)
+        for (wid, values) in self.data.items():
+            if self.alive[wid] and values:
+                data[int(remap[wid])] = values
+
+        sources, targets, weights = self.edgeArrays()
+        n = len(ids)
+        capacity = max(1, 2 * n)
+        locations = np.zeros((capacity, 3), dtype=np.float64)
+        locations[:n] = self.locations[ids]
+        radii = np.zeros(capacity, dtype=np.float32)
+        radii[:n] = self.radii[ids]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:n] = True
+
+        self.size = n
+        self.locations, self.radii, self.alive = locations, radii, alive
+        self.data = data
+        self.storedData = None
+        self._setCSR(remap[sources], remap[targets], weights)
+        self.epoch += 1
+        self.version += 1
+        return remap
+
+    def compact(self, tolerance=0.1, mergeFraction=0.5, protected=()):
+        """
+        Shrinks the graph: merges overlapping waypoints, collapses nearly
+        straight degree 2 chains into single weighted edges, removes edges that
+        have a detour at most tolerance longer and renumbers the waypoints.
+        Waypoints with data and the protected ids are never removed (but can
+        absorb waypoints merged into them). Returns an array that maps every old
+        id to its new id. Old ids and GraphWaypoints must not be used afterwards.
+        """
+        protected = set(protected)
+        survivors = {}  # removed id -> id that took its place
+        self._mergeOverlapping(mergeFraction, protected, survivors)
+        self._collapseChains(tolerance, protected, survivors)
+        self._removeRedundantEdges(tolerance)
+        return self._pack(survivors)
+
+    def memoryUsage(self):
+        """ Returns the number of bytes used by the arrays of this graph. """
+        arrays = [self.locations, self.radii, self.alive, self.indptr, self.indices, self.weights]
+        return sum(array.nbytes for array in arrays)
+
+
+class GraphWaypoint(object):
+    """
+    Thin view on a waypoint in a WaypointGraph that offers the same interface as
+    navigation.WaypointNode, so the Navigator and routing functions can use both.
+    """
+
+    __slots__ = ("graph", "WID")
+
+    def __init__(self, graph, wid):
+        self.graph = graph
+        self.WID = wid
+
+    def __eq__(self, other):
+        return isinstance(other, GraphWaypoint) and self.WID == other.WID and self.graph is other.graph
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.WID)
+
+    def __repr__(self):
+        return "GraphWaypoint({}, {})".format(self.WID, self.location)
+
+    @property
+    def location(self):
+        return self.graph.getLocation(self.WID)
+
+    @property
+    def radius(self):
+        return self.graph.getRadius(self.WID)
+
+    @property
+    def data(self):
+        return self.graph.getData(self.WID)
+
+    @property
+    def nodes(self):
+        return [GraphWaypoint(self.graph, wid) for wid in self.graph.neighbors(self.WID)]
+
+    def contains(self, point):
+        x, y, z = self.location
+        xp, yp, zp = point
+        dx, dy, dz = x - xp, y - yp, z - zp
+        return dx ** 2 + dy ** 2 + dz ** 2 <= self.radius ** 2
+
+    def getAllNodes(self):
+        """get all nodes in the graph this waypoint is part of"""
+        """return : set(GraphWaypoint)"""
+        return set(GraphWaypoint(self.graph, wid) for wid in self.graph.component(self.WID))
+
+    def assignNeighbors(self, neighbors):
+        """assign multiple neighbors to this node"""
+        for n in neighbors:
+            self.assignNeighbor(n)
+
+    def assignNeighbor(self, neighbor, doPrint=False):
+        """assign a neigbor to this waypoint graph"""
+        if neighbor is None or self == neighbor:
+            return
+        if neighbor.graph is not self.graph:
+            raise ValueError("can't connect waypoints of different graphs!")
+        if self.graph.addEdge(self.WID, neighbor.WID) and doPrint:
+            print "added new connection %i - %i" % (self.WID, neighbor.WID)
+
+    def detach(self):
+        """remove this waypoint from the graph"""
+        self.graph.detach(self.WID)
+
+    def findNodes(self, key):
+        component = self.graph.component(self.WID)
+        return [GraphWaypoint(self.graph, wid) for wid in self.graph.findKey(key) if wid in component]
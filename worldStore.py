@@ -0,0 +1,254 @@
+# Saving and loading of explored waypoint graphs and block knowledge, so an
+# agent does not have to explore the same terrain again every mission.
+#
+# File layout (little endian), every section starts at a multiple of 8 bytes:
+#   header      magic, version and the sizes of all sections (HEADER_FORMAT)
+#   locations   float64 [size, 3]
+#   radii       float32 [size]
+#   alive       uint8   [size]
+#   indptr      int64   [size + 1]
+#   indices     int32   [numEdges]      CSR adjacency, both directions
+#   weights     float64 [numEdges]
+#   dataIds     int32   [numData]       sorted ids of waypoints that have data
+#   dataOffsets int64   [numData + 1]   offsets of their JSON text in dataText
+#   dataText    bytes   [dataTextSize]
+#   keyIndex    bytes   [keyIndexSize]  JSON {key: [ids]} for findKey
+#   blockKeys   uint64  [numBlocks]     sorted, see blockKey()
+#   blockTypes  uint16  [numBlocks]     index into blockNames
+#   blockNames  bytes   [blockNamesSize] JSON list of block type names
+#
+# Loading memory-maps all sections (copy-on-write), so opening even huge maps
+# is fast, and waypoint data is only decoded when it is accessed.
+
+import os
+import json
+import struct
+import numpy as np
+
+from waypointGraph import WaypointGraph
+
+MAGIC = b"WPGRAPH\0"
+VERSION = 1
+HEADER_FORMAT = "<8sI4xQQQQQQQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Block coordinates are packed into one uint64 key: 26 bits for x and z (enough
+# for the whole Minecraft world) and 12 bits for y
+BLOCK_XZ_OFFSET = 1 << 25
+BLOCK_Y_OFFSET = 1 << 11
+
+
+def blockKey(x, y, z):
+    """ Returns the uint64 key of an absolute block position. """
+    return ((int(x) + BLOCK_XZ_OFFSET) << 38) | ((int(z) + BLOCK_XZ_OFFSET) << 12) | (int(y) + BLOCK_Y_OFFSET)
+
+
+def blockKeysToPositions(keys):
+    """ Converts an array of block keys back into an (N, 3) int array of positions. """
+    keys = np.asarray(keys, dtype=np.uint64)
+    x = (keys >> np.uint64(38)).astype(np.int64) - BLOCK_XZ_OFFSET
+    z = ((keys >> np.uint64(12)) & np.uint64((1 << 26) - 1)).astype(np.int64) - BLOCK_XZ_OFFSET
+    y = (keys & np.uint64((1 << 12) - 1)).astype(np.int64) - BLOCK_Y_OFFSET
+    return np.stack([x, y, z], axis=1)
+
+
+def _padding(size):
+    return (-size) % 8
+
+
+class StoredData(object):
+    """ Waypoint data of a loaded graph, JSON text is only decoded on access. """
+
+    def __init__(self, ids, offsets, text, keyIndex):
+        self.ids = ids
+        self.offsets = offsets
+        self.text = text
+        self.keyIndex = keyIndex
+
+    def raw(self, wid):
+        """ Returns the undecoded JSON text of a waypoint, or None. """
+        i = np.searchsorted(self.ids, wid)
+        if i >= len(self.ids) or self.ids[i] != wid:
+            return None
+        return self.text[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def get(self, wid):
+        raw = self.raw(wid)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def keyIds(self, key):
+        return self.keyIndex.get(key, [])
+
+
+class BlockTable(object):
+    """
+    Read-only table of known blocks, sorted by block key so lookups are a
+    binary search over the (memory mapped) arrays.
+    """
+
+    def __init__(self, keys, types, names):
+        self.keys = keys
+        self.types = types
+        self.names = names
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, position, default=None):
+        """ Returns the block type at an absolute (x, y, z) position. """
+        key = np.uint64(blockKey(*position))
+        i = np.searchsorted(self.keys, key)
+        if i >= len(self.keys) or self.keys[i] != key:
+            return default
+        return self.names[self.types[i]]
+
+    def positionsOf(self, name):
+        """ Returns an (N, 3) int array with the positions of all blocks of a type. """
+        if name not in self.names:
+            return np.zeros((0, 3), dtype=np.int64)
+        return blockKeysToPositions(self.keys[self.types == self.names.index(name)])
+
+    def toDict(self):
+        """ Returns all blocks as a {(x, y, z): type} dict. """
+        positions = blockKeysToPositions(self.keys)
+        return dict((tuple(p), self.names[t]) for (p, t) in zip(positions.tolist(), self.types.tolist()))
+
+
+def _dataSections(graph):
+    """ Returns (ids, offsets, text, keyIndex) for the waypoint data of a graph. """
+    stored = graph.storedData
+    entries = {}
+    if stored is not None:
+        for wid in stored.ids.tolist():
+            if wid not in graph.data and graph.isAlive(wid):
+                entries[wid] = stored.raw(wid)
+    for (wid, data) in graph.data.items():
+        if data and graph.isAlive(wid):
+            entries[wid] = json.dumps(data).encode("utf-8")
+
+    ids = sorted(entries)
+    texts = [entries[wid] for wid in ids]
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+
+    keyIndex = {}
+    for (wid, text) in zip(ids, texts):
+        for key in json.loads(text):
+            keyIndex.setdefault(key, []).append(wid)
+
+    return np.array(ids, dtype=np.int32), offsets, b"".join(texts), json.dumps(keyIndex).encode("utf-8")
+
+
+def _blockSections(blocks):
+    """ Returns (keys, types, names) for a {(x, y, z): type} dict or BlockTable. """
+    if isinstance(blocks, BlockTable):
+        return np.asarray(blocks.keys), np.asarray(blocks.types), json.dumps(blocks.names).encode("utf-8")
+
+    blocks = blocks or {}
+    names = sorted(set(blocks.values()))
+    nameIndex = dict((name, i) for (i, name) in enumerate(names))
+    keys = np.array([blockKey(*position) for position in blocks], dtype=np.uint64)
+    types = np.array([nameIndex[name] for name in blocks.values()], dtype=np.uint16)
+    order = np.argsort(keys)
+    return keys[order], types[order], json.dumps(names).encode("utf-8")
+
+
+def saveWorld(path, graph=None, blocks=None):
+    """
+    Saves a WaypointGraph and/or block knowledge (a {(x, y, z): type} dict or a
+    loaded BlockTable) to path. Waypoint data must be JSON serializable.
+    The file is written next to path first and then renamed, so a memory mapped
+    copy of the old file stays valid. Windows can't replace a file that is still
+    mapped, so load with mmap=False there if you want to save to the same path.
+    """
+    if graph is None:
+        graph = WaypointGraph()
+    graph.compile()
+    n = graph.size
+
+    dataIds, dataOffsets, dataText, keyIndex = _dataSections(graph)
+    blockKeys, blockTypes, blockNames = _blockSections(blocks)
+
+    sections = [
+        np.ascontiguousarray(graph.locations[:n], dtype="<f8"),
+        np.ascontiguousarray(graph.radii[:n], dtype="<f4"),
+        np.ascontiguousarray(graph.alive[:n], dtype=np.uint8),
+        np.ascontiguousarray(graph.indptr, dtype="<i8"),
+        np.ascontiguousarray(graph.indices, dtype="<i4"),
+        np.ascontiguousarray(graph.weights, dtype="<f8"),
+        dataIds.astype("<i4"),
+        dataOffsets.astype("<i8"),
+        dataText,
+        keyIndex,
+        blockKeys.astype("<u8"),
+        blockTypes.astype("<u2"),
+        blockNames,
+    ]
+
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, n, len(graph.indices), len(dataIds),
+                         len(dataText), len(keyIndex), len(blockKeys), len(blockNames))
+
+    tempPath = path + ".tmp"
+    with open(tempPath, "wb") as f:
+        f.write(header)
+        f.write(b"\0" * _padding(HEADER_SIZE))
+        for section in sections:
+            raw = section if isinstance(section, bytes) else section.tobytes()
+            f.write(raw)
+            f.write(b"\0" * _padding(len(raw)))
+
+    if os.name == "nt" and os.path.exists(path):
+        os.remove(path)
+    os.rename(tempPath, path)
+
+
+def loadWorld(path, mmap=True):
+    """
+    Loads a file written by saveWorld, returns (WaypointGraph, BlockTable). With
+    mmap the arrays are memory mapped copy-on-write, so changes to the graph
+    are never written back to the file (use saveWorld for that).
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) != HEADER_SIZE:
+        raise ValueError("{} is not a saved world!".format(path))
+
+    (magic, version, n, numEdges, numData, dataTextSize, keyIndexSize, numBlocks,
+     blockNamesSize) = struct.unpack(HEADER_FORMAT, header)
+    if magic != MAGIC:
+        raise ValueError("{} is not a saved world!".format(path))
+    if version != VERSION:
+        raise ValueError("{} has unsupported version {}!".format(path, version))
+
+    layout = [
+        ("<f8", (n, 3)), ("<f4", n), (np.uint8, n), ("<i8", n + 1), ("<i4", numEdges), ("<f8", numEdges),
+        ("<i4", numData), ("<i8", numData + 1), (np.uint8, dataTextSize), (np.uint8, keyIndexSize),
+        ("<u8", numBlocks), ("<u2", numBlocks), (np.uint8, blockNamesSize),
+    ]
+
+    sections = []
+    offset = HEADER_SIZE + _padding(HEADER_SIZE)
+    for (dtype, shape) in layout:
+        count = int(np.prod(shape))
+        nbytes = count * np.dtype(dtype).itemsize
+        if count == 0:
+            sections.append(np.zeros(shape, dtype=dtype))
+        elif mmap:
+            sections.append(np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=shape))
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                sections.append(np.fromfile(f, dtype=dtype, count=count).reshape(shape))
+        offset += nbytes + _padding(nbytes)
+
+    (locations, radii, alive, indptr, indices, weights, dataIds, dataOffsets, dataText, keyIndex,
+     blockKeys, blockTypes, blockNames) = sections
+
+    graph = WaypointGraph.fromCSR(locations, radii, alive.view(bool), indptr, indices, weights)
+    keyIndex = json.loads(keyIndex.tobytes().decode("utf-8")) if keyIndexSize else {}
+    graph.storedData = StoredData(dataIds, dataOffsets, dataText, keyIndex)
+
+    names = json.loads(blockNames.tobytes().decode("utf-8")) if blockNamesSize else []
+    return graph, BlockTable(blockKeys, blockTypes, names)